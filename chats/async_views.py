@@ -0,0 +1,130 @@
+"""
+ASGI-native versions of the hot chat endpoints, served instead of the DRF views in
+``chats.views`` when ``settings.ASYNC_API_VIEWS`` is on. Same URLs, same responses.
+
+Reads use the async ORM. Writes still go through one ``sync_to_async`` call each:
+Django can't run transactions from async code, and sending or reading a message has
+to update ``Message`` and ``ChatMembership`` together.
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from chats import conditional
+from chats.models import (ArchivedMessage, Attachment, ChatMembership, Message,
+                          conversation_key)
+from chats.retention import MessageHistory
+from chats.serializers import (NewMessageRequestSerializer, message_data,
+                               recent_chat_data)
+from chats.services import store_message
+from chats.views import (ChatMessagesCursorPagination, ChatMessagesPagination,
+                         RecentChatsPagination, _handle_bot_replies,
+                         mark_conversation_read)
+from core.async_views import (APIError, AsyncAPIView, apaginate, error_response,
+                              render_response)
+from users.management.commands.create_bot_users import BOT_EMAILS
+
+
+async def _get_user(user_id, message="User not found"):
+    try:
+        return await User.objects.aget(id=user_id)
+    except User.DoesNotExist:
+        raise APIError(404, message)
+
+
+class SendMessageView(AsyncAPIView):
+    async def post(self, request):
+        serializer = NewMessageRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return error_response(400, "Invalid input", details=serializer.errors)
+        content = serializer.validated_data["content"]
+        receiver = await _get_user(
+            serializer.validated_data["receiverId"], "Receiver not found"
+        )
+        attachment = None
+        if "attachmentId" in serializer.validated_data:
+            try:
+                attachment = await Attachment.objects.aget(
+                    id=serializer.validated_data["attachmentId"], uploader=request.user
+                )
+            except Attachment.DoesNotExist:
+                return error_response(404, "Attachment not found")
+        message = await sync_to_async(store_message)(
+            request.user, receiver, content, attachment
+        )
+        if receiver.email in BOT_EMAILS:
+            await sync_to_async(_handle_bot_replies)(request, receiver, content)
+        return render_response(request, message_data(message), status=201)
+
+
+class ChatMessagesView(AsyncAPIView):
+    async def get(self, request, userId):
+        validators = await conditional.aconversation_validators(request, userId)
+        if validators and (not_modified := validators.not_modified(request)):
+            return not_modified
+        other_user = await _get_user(userId)
+        key = conversation_key(request.user.id, other_user.id)
+        messages = (
+            Message.objects.filter(conversation_key=key)
+            .select_related("attachment")
+            .order_by("-timestamp", "-id")  # Newest messages first
+        )
+        archived = (
+            ArchivedMessage.objects.filter(conversation_key=key)
+            .select_related("attachment")
+            .order_by("-timestamp", "-id")
+        )
+        if ChatMessagesCursorPagination.is_requested(request):
+            try:
+                page, pagination = await ChatMessagesCursorPagination().apaginate_queryset(
+                    messages, request, archived
+                )
+            except ChatMessagesCursorPagination.InvalidCursor:
+                return error_response(400, "Invalid cursor")
+        else:
+            page, pagination = await apaginate(
+                ChatMessagesPagination(), MessageHistory(messages, archived), request
+            )
+        tz = timezone.get_current_timezone()
+        response = render_response(
+            request,
+            {
+                "messages": [message_data(message, tz) for message in page],
+                "pagination": pagination,
+            },
+        )
+        return validators.apply(response) if validators else response
+
+
+class RecentChatsView(AsyncAPIView):
+    async def get(self, request):
+        validators = await conditional.ainbox_validators(request)
+        if not_modified := validators.not_modified(request):
+            return not_modified
+        memberships = (
+            ChatMembership.objects.filter(user=request.user)
+            .select_related("partner__profile", "last_message__attachment")
+            .order_by("-last_timestamp", "-id")
+        )
+        page, pagination = await apaginate(RecentChatsPagination(), memberships, request)
+        tz = timezone.get_current_timezone()
+        return validators.apply(
+            render_response(
+                request,
+                {
+                    "chats": [recent_chat_data(m, request, tz) for m in page],
+                    "pagination": pagination,
+                },
+            )
+        )
+
+
+class MarkMessagesAsReadView(AsyncAPIView):
+    async def post(self, request, userId):
+        other_user = await _get_user(userId)
+        updated = await sync_to_async(mark_conversation_read)(request.user, other_user)
+        return render_response(
+            request,
+            {"success": True, "message": "Messages marked as read", "updated": updated},
+        )
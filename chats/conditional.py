@@ -0,0 +1,116 @@
+"""
+Conditional GET for the inbox and message history.
+
+Both are re-fetched whenever a client comes back to a screen, and the answer has
+usually not changed. Their validators come from ``ChatMembership`` alone, in one
+indexed query that loads no messages: every change either response can show moves
+one of these rows. New messages move ``last_message``/``last_timestamp``, reads
+lower ``unread_count`` on one side and stamp ``partner_read_at`` on the other, and
+the inbox also watches its partners' ``UserProfile.updatedAt``. Archiving doesn't
+change what the history shows, so it doesn't change the ETag either.
+
+The ETag is exact. ``Last-Modified`` has one-second resolution, so it is only sent
+once the second of the latest change has passed; a later change then always has a
+later date. A conversation without inbox rows (a chat with yourself, or messages
+imported with ``--skip-memberships`` before the backfill) gets no validators.
+"""
+
+import hashlib
+import time
+
+from django.db.models import Count, Max, Q, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from chats.models import ChatMembership
+
+# Clients may keep the response but must check it with us before reusing it
+CACHE_CONTROL = "private, no-cache"
+
+
+class Validators:
+    def __init__(self, request, state, timestamps):
+        # The query string picks the page, so it is part of the representation
+        digest = hashlib.md5(
+            repr((request.user.id, request.get_full_path(), state)).encode(),
+            usedforsecurity=False,
+        )
+        self.etag = f'W/"{digest.hexdigest()}"'
+        timestamps = [t for t in timestamps if t is not None]
+        self.last_modified = int(max(timestamps).timestamp()) if timestamps else None
+
+    def not_modified(self, request):
+        """The 304 (or 412) response for a matching conditional request, or None."""
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified
+        )
+        return self.apply(response) if response is not None else None
+
+    def apply(self, response):
+        response["ETag"] = self.etag
+        response["Cache-Control"] = CACHE_CONTROL
+        if self.last_modified is not None and self.last_modified < int(time.time()):
+            response["Last-Modified"] = http_date(self.last_modified)
+        return response
+
+
+def _inbox_query(user):
+    # Reads by the user stamp partner_read_at on the rows where they are the partner
+    mine = Q(user=user)
+    return ChatMembership.objects.filter(mine | Q(partner=user)), {
+        "chats": Count("id", filter=mine),
+        "last_message": Max("last_message_id", filter=mine),
+        "last_timestamp": Max("last_timestamp", filter=mine),
+        "unread": Sum("unread_count", filter=mine),
+        "read_at": Max("partner_read_at"),
+        "profiles": Max("partner__profile__updatedAt", filter=mine),
+    }
+
+
+def _inbox_validators(request, state):
+    return Validators(
+        request,
+        sorted(state.items()),
+        [state["last_timestamp"], state["read_at"], state["profiles"]],
+    )
+
+
+def inbox_validators(request):
+    memberships, aggregates = _inbox_query(request.user)
+    return _inbox_validators(request, memberships.aggregate(**aggregates))
+
+
+async def ainbox_validators(request):
+    memberships, aggregates = _inbox_query(request.user)
+    return _inbox_validators(request, await memberships.aaggregate(**aggregates))
+
+
+def _conversation_query(user, partner_id):
+    return (
+        ChatMembership.objects.filter(
+            Q(user=user, partner_id=partner_id) | Q(user_id=partner_id, partner=user)
+        )
+        .order_by("user_id")
+        .values_list(
+            "user_id", "last_message_id", "last_timestamp", "unread_count", "partner_read_at"
+        )
+    )
+
+
+def _conversation_validators(request, rows):
+    if not rows:
+        return None
+    return Validators(
+        request, rows, [stamp for row in rows for stamp in (row[2], row[4])]
+    )
+
+
+def conversation_validators(request, partner_id):
+    """Validators for the history with ``partner_id``, or None if there are none."""
+    rows = list(_conversation_query(request.user, partner_id))
+    return _conversation_validators(request, rows)
+
+
+async def aconversation_validators(request, partner_id):
+    rows = [row async for row in _conversation_query(request.user, partner_id)]
+    return _conversation_validators(request, rows)
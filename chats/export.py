@@ -0,0 +1,128 @@
+"""
+Streaming conversation exports.
+
+Rows are read with ``values_list`` and ``iterator()`` and encoded straight to text,
+so memory use stays flat however long the conversation is.
+"""
+
+import csv
+import heapq
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from core.serialization import format_datetime
+from uploads.pipeline import hashed_name
+
+EXPORT_FIELDS = ["id", "senderId", "receiverId", "content", "timestamp", "read", "attachment"]
+EXPORT_COLUMNS = ["id", "sender_id", "receiver_id", "content", "timestamp", "read"]
+# Joined in, so attachments cost no extra queries
+ATTACHMENT_COLUMNS = [
+    "attachment_id",
+    "attachment__name",
+    "attachment__kind",
+    "attachment__size",
+    "attachment__sha256",
+]
+
+# Rows fetched from the database per round trip, and rows per yielded body chunk
+CHUNK_SIZE = 2000
+
+
+def export_rows(*querysets, chunk_size=CHUNK_SIZE):
+    """
+    Yield export rows, oldest first, as tuples in ``EXPORT_FIELDS`` order. Several
+    querysets (archived and hot messages) are merged into one ordered stream.
+    """
+    streams = [
+        queryset.order_by("timestamp", "id")
+        .values_list(*EXPORT_COLUMNS, *ATTACHMENT_COLUMNS)
+        .iterator(chunk_size=chunk_size)
+        for queryset in querysets
+    ]
+    # Ordered by (timestamp, id) like the queries
+    rows = heapq.merge(*streams, key=lambda row: (row[4], row[0]))
+    tz = timezone.get_current_timezone()
+    for (
+        message_id,
+        sender_id,
+        receiver_id,
+        content,
+        timestamp,
+        read,
+        attachment_id,
+        *attachment,
+    ) in rows:
+        yield (
+            message_id,
+            sender_id,
+            receiver_id,
+            content,
+            format_datetime(timestamp, tz),
+            read,
+            _attachment(attachment_id, *attachment) if attachment_id else None,
+        )
+
+
+def _attachment(attachment_id, name, kind, size, sha256):
+    """Same output as ``chats.serializers.attachment_data``."""
+    return {
+        "id": attachment_id,
+        "name": name,
+        "kind": kind,
+        "size": size,
+        "url": settings.MEDIA_URL + hashed_name("attachments", sha256, kind),
+    }
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def jsonl_chunks(rows, chunk_size=CHUNK_SIZE):
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for batch in _batched(rows, chunk_size):
+        yield "".join(dumps(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in batch)
+
+
+class _Echo:
+    """File-like object whose ``write`` hands back the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(rows, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for batch in _batched(rows, chunk_size):
+        # The attachment column holds the file's URL
+        yield "".join(
+            writer.writerow(row[:-1] + (row[-1] and row[-1]["url"],)) for row in batch
+        )
+
+
+FORMATS = {"jsonl": jsonl_chunks, "csv": csv_chunks}
+
+
+async def aiterate(chunks):
+    """
+    Feed a sync chunk generator to an async server one chunk at a time. Django's ASGI
+    handler would otherwise read a sync streaming body into a list before sending it.
+    """
+    next_chunk = sync_to_async(next)
+    done = object()
+    try:
+        while (chunk := await next_chunk(chunks, done)) is not done:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,15 @@
+from django.contrib.auth.models import User
+
+from chats.services import store_message
+from jobs.queue import register
+
+BOT_REPLY = "chats.bot_reply"
+
+
+@register(BOT_REPLY)
+def bot_reply(payload):
+    # Auto-reply bot logic (testing only)
+    bot = User.objects.get(id=payload["botId"])
+    user = User.objects.get(id=payload["userId"])
+    reply_content = f"Auto-reply from {bot.first_name or bot.username}: I received your message: '{payload['content']}'"
+    store_message(bot, user, reply_content)
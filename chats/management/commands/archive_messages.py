@@ -0,0 +1,87 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chats.retention import archivable, archive_batch, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Move read messages older than CHAT_RETENTION['ARCHIVE_AFTER'] into the "
+        "archive table in small throttled batches. Safe to interrupt (SIGINT/SIGTERM "
+        "finish the current batch) and to run again, e.g. nightly from cron"
+    )
+
+    def add_arguments(self, parser):
+        retention = settings.CHAT_RETENTION
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=retention["BATCH_SIZE"],
+            help="Messages moved per transaction",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=retention["BATCH_PAUSE"],
+            help="Seconds to wait between batches",
+        )
+        parser.add_argument(
+            "--max-seconds",
+            type=float,
+            help="Stop after this long; the next run carries on from there",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count the messages that would be archived without moving them",
+        )
+
+    def handle(self, *args, **options):
+        # Fixed for the whole run, so batches don't chase a moving target
+        cutoff = archive_cutoff()
+        if options["dry_run"]:
+            count = archivable(cutoff).count()
+            self.stdout.write(
+                self.style.SUCCESS(f"{count} messages older than {cutoff:%Y-%m-%d} to archive")
+            )
+            return
+
+        stopping = []
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping after the current batch...")
+            stopping.append(signum)
+
+        previous = {sig: signal.signal(sig, stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        started = last_report = time.monotonic()
+        deadline = started + options["max_seconds"] if options["max_seconds"] else None
+        moved_total, last_id = 0, 0
+        try:
+            while not stopping and (deadline is None or time.monotonic() < deadline):
+                # Each batch is one transaction: an interrupted run loses nothing
+                moved, last_id = archive_batch(cutoff, last_id, options["batch_size"])
+                if last_id is None:
+                    break
+                moved_total += moved
+                if time.monotonic() - last_report >= 5:
+                    last_report = time.monotonic()
+                    self._report("Archived", moved_total, last_report - started)
+                time.sleep(options["pause"])
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+        self._report(
+            "Archived" if last_id is None else "Stopped early, archived",
+            moved_total,
+            time.monotonic() - started,
+            style=self.style.SUCCESS,
+        )
+
+    def _report(self, verb, moved, elapsed, style=None):
+        rate = moved / elapsed if elapsed else 0
+        line = f"{verb} {moved} messages in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        self.stdout.write(style(line) if style else line)
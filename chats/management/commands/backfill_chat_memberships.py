@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+
+from chats.models import ChatMembership, Message, conversation_key
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ChatMembership inbox table from existing chats.Message rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of inbox rows written per transaction",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete all existing inbox rows before rebuilding",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        if options["clear"]:
+            deleted, _ = ChatMembership.objects.all().delete()
+            self.stdout.write(f"Deleted {deleted} existing inbox rows")
+
+        # One grouped pass over Message: per direction, the newest message time and
+        # how many of its messages are still unread by the receiver.
+        directions = (
+            Message.objects.exclude(sender=F("receiver"))
+            .values("sender_id", "receiver_id")
+            .annotate(
+                last_timestamp=Max("timestamp"), unread=Count("id", filter=Q(read=False))
+            )
+            .order_by()
+        )
+        entries = {}
+        for row in directions.iterator():
+            sender_id, receiver_id = row["sender_id"], row["receiver_id"]
+            for user_id, partner_id in (
+                (sender_id, receiver_id),
+                (receiver_id, sender_id),
+            ):
+                entry = entries.setdefault((user_id, partner_id), [None, 0])
+                if entry[0] is None or row["last_timestamp"] > entry[0]:
+                    entry[0] = row["last_timestamp"]
+            entries[(receiver_id, sender_id)][1] += row["unread"]
+
+        items = list(entries.items())
+        written = 0
+        for start in range(0, len(items), batch_size):
+            batch = items[start : start + batch_size]
+            last_ids = self._last_message_ids(
+                {
+                    conversation_key(user_id, partner_id): last_timestamp
+                    for (user_id, partner_id), (last_timestamp, _) in batch
+                }
+            )
+            with transaction.atomic():
+                ChatMembership.objects.bulk_create(
+                    [
+                        ChatMembership(
+                            user_id=user_id,
+                            partner_id=partner_id,
+                            last_message_id=last_ids[conversation_key(user_id, partner_id)],
+                            last_timestamp=last_timestamp,
+                            unread_count=unread,
+                        )
+                        for (user_id, partner_id), (last_timestamp, unread) in batch
+                    ],
+                    update_conflicts=True,
+                    unique_fields=["user", "partner"],
+                    update_fields=["last_message", "last_timestamp", "unread_count"],
+                )
+            written += len(batch)
+            self.stdout.write(f"Wrote {written}/{len(items)} inbox rows")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {written} inbox rows"))
+
+    @staticmethod
+    def _last_message_ids(last_timestamps):
+        """
+        ``{conversation_key: id}`` of each conversation's last message by (timestamp,
+        id), the order live updates (``ChatMembership._touch``) keep. Imported messages
+        carry their own timestamps, so the highest id need not be the newest.
+        """
+        matches = Q()
+        for key, timestamp in last_timestamps.items():
+            matches |= Q(conversation_key=key, timestamp=timestamp)
+        last_ids = {}
+        for key, message_id in Message.objects.filter(matches).values_list(
+            "conversation_key", "id"
+        ):
+            last_ids[key] = max(last_ids.get(key, 0), message_id)
+        return last_ids
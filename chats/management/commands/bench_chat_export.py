@@ -0,0 +1,80 @@
+import json
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from chats.models import Message, conversation_key
+from chats.serializers import MessageSerializer
+from chats.views import ChatExportView
+from core import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Export one long conversation through the streaming export endpoint and report "
+        "throughput and peak Python memory"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=1_000_000)
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="Also serialize the whole conversation with MessageSerializer(many=True) "
+            "for a baseline (needs memory proportional to --messages)",
+        )
+        parser.add_argument("--reuse", action="store_true")
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["reuse"]:
+            user_ids = list(bench.bench_users().order_by("id").values_list("id", flat=True))
+        else:
+            user_ids = bench.seed_users(2, stdout=self.stdout)
+            bench.seed_messages(
+                [tuple(user_ids[:2])], options["messages"], stdout=self.stdout
+            )
+        try:
+            self._run(user_ids[0], user_ids[1], options["compare"])
+        finally:
+            if not options["keep"]:
+                bench.cleanup(stdout=self.stdout)
+
+    def _run(self, user_id, partner_id, compare):
+        user = User.objects.get(id=user_id)
+        view = ChatExportView.as_view()
+        factory = APIRequestFactory()
+
+        def export(fmt):
+            request = factory.get(
+                f"/api/chats/messages/{partner_id}/export", {"format": fmt}
+            )
+            force_authenticate(request, user=user)
+            response = view(request, userId=partner_id)
+            return sum(len(chunk) for chunk in response.streaming_content)
+
+        def materialize():
+            messages = Message.objects.filter(
+                conversation_key=conversation_key(user_id, partner_id)
+            ).order_by("timestamp", "id")
+            return len(json.dumps(MessageSerializer(messages, many=True).data))
+
+        cases = [("stream jsonl", lambda: export("jsonl")), ("stream csv", lambda: export("csv"))]
+        if compare:
+            cases.append(("MessageSerializer(many=True)", materialize))
+        for label, fn in cases:
+            started = time.perf_counter()
+            size = fn()
+            elapsed = time.perf_counter() - started
+            # Memory is traced in a second pass; tracemalloc slows Python down a lot
+            tracemalloc.start()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f"{label:<30} {elapsed:8.2f}s {size / 1e6:10.1f}MB body "
+                f"peak={peak / 1e6:8.1f}MB"
+            )
@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from chats.models import Message, conversation_key
+from chats.views import ChatMessagesCursorPagination, ChatMessagesView
+from core import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare page-number and cursor pagination latency for the first and a "
+        "deep page of one long conversation"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=10_000)
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--reuse", action="store_true")
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        pages, limit = options["pages"], options["limit"]
+        if options["reuse"]:
+            user_ids = list(bench.bench_users().order_by("id").values_list("id", flat=True))
+        else:
+            user_ids = bench.seed_users(2, stdout=self.stdout)
+            bench.seed_messages(
+                [tuple(user_ids[:2])], pages * limit, stdout=self.stdout
+            )
+        try:
+            self._run(user_ids[0], user_ids[1], pages, limit, options["repeat"])
+        finally:
+            if not options["keep"]:
+                bench.cleanup(stdout=self.stdout)
+
+    def _run(self, user_id, partner_id, pages, limit, repeat):
+        user = User.objects.get(id=user_id)
+        view = ChatMessagesView.as_view()
+        factory = APIRequestFactory()
+
+        def fetch(params):
+            request = factory.get(f"/api/chats/messages/{partner_id}/", params)
+            force_authenticate(request, user=user)
+            response = view(request, userId=partner_id)
+            assert len(response.data["messages"]) == limit, response.data
+            return response
+
+        # The cursor that starts page N is the last message of page N - 1
+        deep_offset = (pages - 1) * limit - 1
+        boundary = (
+            Message.objects.filter(conversation_key=conversation_key(user_id, partner_id))
+            .order_by("-timestamp", "-id")[deep_offset]
+        )
+        deep_cursor = ChatMessagesCursorPagination.encode_cursor(boundary)
+
+        cases = [
+            ("page number, page 1", {"page": 1, "limit": limit}),
+            (f"page number, page {pages}", {"page": pages, "limit": limit}),
+            ("cursor, page 1", {"before": "", "limit": limit}),
+            (f"cursor, page {pages}", {"before": deep_cursor, "limit": limit}),
+        ]
+        for label, params in cases:
+            fetch(params)  # warm up
+            samples = bench.measure(lambda: fetch(params), repeat)
+            self.stdout.write(bench.format_summary(label, samples))
@@ -0,0 +1,97 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from chats.models import Message, conversation_key
+from core import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic message table and compare chat history and unread-count "
+        "queries with and without the conversation indexes. Dropping the indexes "
+        "changes the schema, so it all runs in a scratch database that is deleted "
+        "afterwards, never the configured one"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--conversations", type=int, default=5000)
+        parser.add_argument("--messages", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        with bench.scratch_database():
+            user_ids = bench.seed_users(options["users"], stdout=self.stdout)
+            rng = random.Random(1)
+            pairs = [
+                tuple(rng.sample(user_ids, 2)) for _ in range(options["conversations"])
+            ]
+            bench.seed_messages(pairs, options["messages"], stdout=self.stdout)
+
+            self.stdout.write(self.style.MIGRATE_HEADING("Without conversation indexes"))
+            self._drop_indexes()
+            self._run(pairs, options["repeat"])
+            self._create_indexes()
+            self.stdout.write(self.style.MIGRATE_HEADING("With conversation indexes"))
+            self._run(pairs, options["repeat"])
+
+    def _run(self, pairs, repeat):
+        rng = random.Random(2)
+
+        def history_or():
+            a, b = rng.choice(pairs)
+            return list(
+                Message.objects.filter(
+                    Q(sender_id=a, receiver_id=b) | Q(sender_id=b, receiver_id=a)
+                ).order_by("-timestamp")[:50]
+            )
+
+        def history_key():
+            a, b = rng.choice(pairs)
+            return list(
+                Message.objects.filter(conversation_key=conversation_key(a, b))
+                .order_by("-timestamp", "-id")[:50]
+            )
+
+        def unread():
+            a, b = rng.choice(pairs)
+            return Message.objects.filter(sender_id=a, receiver_id=b, read=False).count()
+
+        a, b = pairs[0]
+        queries = [
+            (
+                "history (sender/receiver OR)",
+                history_or,
+                Message.objects.filter(
+                    Q(sender_id=a, receiver_id=b) | Q(sender_id=b, receiver_id=a)
+                ).order_by("-timestamp")[:50],
+            ),
+            (
+                "history (conversation_key)",
+                history_key,
+                Message.objects.filter(conversation_key=conversation_key(a, b))
+                .order_by("-timestamp", "-id")[:50],
+            ),
+            (
+                "unread count",
+                unread,
+                Message.objects.filter(sender_id=a, receiver_id=b, read=False),
+            ),
+        ]
+        for label, fn, queryset in queries:
+            plan = queryset.explain().replace("\n", "\n    ")
+            self.stdout.write(f"  plan for {label}:\n    {plan}")
+            self.stdout.write("  " + bench.format_summary(label, bench.measure(fn, repeat)))
+
+    def _drop_indexes(self):
+        with connection.schema_editor() as editor:
+            for index in Message._meta.indexes:
+                editor.remove_index(Message, index)
+
+    def _create_indexes(self):
+        with connection.schema_editor() as editor:
+            for index in Message._meta.indexes:
+                editor.add_index(Message, index)
@@ -0,0 +1,84 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from chats.search import IContainsBackend, get_search_backend
+from core import bench
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "do", "gu"]
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed messages with a Zipf-distributed vocabulary and compare full-text index "
+        "search against an icontains scan"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--conversations", type=int, default=5000)
+        parser.add_argument("--messages", type=int, default=1_000_000)
+        parser.add_argument("--vocabulary", type=int, default=20_000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--reuse",
+            action="store_true",
+            help="Benchmark the bench data left by a previous --keep run",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Do not delete the seeded data"
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(3)
+        words = vocabulary(options["vocabulary"], rng)
+        # Zipf-like: the n-th most common word appears ~1/n as often as the first
+        weights = [1 / rank for rank in range(1, len(words) + 1)]
+
+        def content(rng, i):
+            return " ".join(rng.choices(words, weights, k=rng.randint(4, 16)))
+
+        if options["reuse"]:
+            user_ids = list(bench.bench_users().values_list("id", flat=True))
+        else:
+            user_ids = bench.seed_users(options["users"], stdout=self.stdout)
+            pairs = [
+                tuple(rng.sample(user_ids, 2)) for _ in range(options["conversations"])
+            ]
+            bench.seed_messages(
+                pairs, options["messages"], stdout=self.stdout, content=content
+            )
+        try:
+            self._run(user_ids, words, options["repeat"])
+        finally:
+            if not options["keep"]:
+                bench.cleanup(stdout=self.stdout)
+
+    def _run(self, user_ids, words, repeat):
+        rng = random.Random(4)
+        queries = [
+            ("common word", lambda: words[0]),
+            ("mid-frequency word", lambda: rng.choice(words[100:1000])),
+            ("rare word", lambda: rng.choice(words[-1000:])),
+            ("two words", lambda: f"{words[1]} {rng.choice(words[10:200])}"),
+            ("3-letter prefix", lambda: rng.choice(words[:50])[:3] + "*"),
+        ]
+        for backend in (get_search_backend(), IContainsBackend()):
+            self.stdout.write(self.style.MIGRATE_HEADING(type(backend).__name__))
+            for label, make_query in queries:
+
+                def first_page():
+                    # What the search endpoint does: total count plus the first 20 hits
+                    results = backend.search(rng.choice(user_ids), make_query())
+                    results.count()
+                    return results[0:20]
+
+                samples = bench.measure(first_page, repeat)
+                self.stdout.write("  " + bench.format_summary(label, samples))
@@ -0,0 +1,100 @@
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from chats.models import ChatMembership, Message
+from chats.serializers import (MessageSerializer, RecentChatSerializer,
+                               message_data, recent_chat_data)
+from core import bench
+from users.models import UserProfile
+from users.serializers import UserSerializer, user_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-row CPU cost of the DRF serializers against the fast dict encoders used "
+        "by the read endpoints (in-memory objects, no database access)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100, help="Rows per page")
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        request = APIRequestFactory().get("/api/chats/", SERVER_NAME="localhost")
+        now = timezone.now()
+        users = []
+        for i in range(rows):
+            user = User(pk=i + 1, username=f"user{i}@example.com", email=f"user{i}@example.com")
+            user.profile = UserProfile(
+                user=user,
+                name=f"User {i}",
+                gender="other",
+                dob=date(2000, 1, 1),
+                createdAt=now,
+                avatarUrl=f"/media/avatars/avatar_{i + 1}.png" if i % 2 else None,
+                avatarColor="#123456",
+            )
+            users.append(user)
+        messages = [
+            Message(
+                id=i + 1,
+                sender_id=1,
+                receiver_id=2,
+                content=f"Message number {i}",
+                timestamp=now - timedelta(seconds=i),
+                read=bool(i % 3),
+            )
+            for i in range(rows)
+        ]
+        memberships = [
+            ChatMembership(
+                user_id=1, partner=user, last_message=message, unread_count=i % 5
+            )
+            for i, (user, message) in enumerate(zip(users, messages))
+        ]
+        chats = [
+            {
+                "user": membership.partner,
+                "lastMessage": membership.last_message,
+                "unreadCount": membership.unread_count,
+            }
+            for membership in memberships
+        ]
+
+        # The fast paths resolve the active timezone once per page, as the views do
+        tz = timezone.get_current_timezone()
+        cases = [
+            (
+                "messages",
+                lambda: MessageSerializer(messages, many=True).data,
+                lambda: [message_data(message, tz) for message in messages],
+            ),
+            (
+                "users",
+                lambda: UserSerializer(users, many=True, context={"request": request}).data,
+                lambda: [user_data(user, request, tz) for user in users],
+            ),
+            (
+                "recent chats",
+                lambda: RecentChatSerializer(
+                    chats, many=True, context={"request": request}
+                ).data,
+                lambda: [
+                    recent_chat_data(membership, request, tz) for membership in memberships
+                ],
+            ),
+        ]
+        for label, slow, fast in cases:
+            assert [dict(row) for row in slow()] == fast(), label
+            for kind, fn in (("DRF serializer", slow), ("fast encoder", fast)):
+                samples = bench.measure(fn, repeat)
+                per_row = bench.summarize(samples)["p50"] * 1000 / rows
+                self.stdout.write(
+                    bench.format_summary(f"{label}, {kind} ({rows} rows)", samples)
+                    + f"  {per_row:7.2f}us/row"
+                )
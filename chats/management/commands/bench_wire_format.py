@@ -0,0 +1,127 @@
+import logging
+import random
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chats.models import ChatMembership, Message, conversation_key
+from core import bench, compression
+from core.renderers import MessagePackRenderer, ORJSONRenderer
+
+WORDS = (
+    "the a to and you I it is that for on are with be at this have we not lunch "
+    "tomorrow meeting later sounds good thanks see what about when can time today"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Render time and bytes on the wire for a 100-message history page and a "
+        "500-partner inbox: DRF's JSON renderer, orjson and MessagePack, each as is, "
+        "gzipped and brotli-compressed, then the same requests end to end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--partners", type=int, default=500)
+        parser.add_argument("--messages", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        logging.getLogger("core.metrics").setLevel(logging.ERROR)
+        user_ids = bench.seed_users(options["partners"] + 1)
+        try:
+            me, partners = user_ids[0], user_ids[1:]
+            self._seed_messages(me, partners, options["messages"])
+            client = Client(
+                HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(User.objects.get(id=me))}"
+            )
+            endpoints = [
+                (
+                    f"{options['messages']}-message history",
+                    reverse("chat_messages", kwargs={"userId": partners[0]}),
+                    {"limit": options["messages"]},
+                ),
+                (
+                    f"{options['partners']}-partner inbox",
+                    reverse("recent_chats"),
+                    {"limit": options["partners"]},
+                ),
+            ]
+            with override_settings(ALLOWED_HOSTS=["testserver"]):
+                for label, url, params in endpoints:
+                    data = client.get(url, params).json()
+                    self.stdout.write(self.style.MIGRATE_HEADING(label))
+                    self._renderers(data, options["repeat"])
+                    self._requests(client, url, params, options["repeat"])
+        finally:
+            bench.cleanup(stdout=self.stdout)
+
+    def _seed_messages(self, me, partners, count):
+        rng = random.Random(0)
+
+        def message(sender, receiver):
+            return Message(
+                sender_id=sender,
+                receiver_id=receiver,
+                conversation_key=conversation_key(sender, receiver),
+                content=" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20))),
+            )
+
+        # The history with the first partner, then one message from every partner
+        messages = [
+            message(*((me, partners[0]) if rng.random() < 0.5 else (partners[0], me)))
+            for _ in range(count - 1)
+        ]
+        messages += [message(partner, me) for partner in partners]
+        ChatMembership.record_messages(Message.objects.bulk_create(messages))
+
+    def _renderers(self, data, repeat):
+        brotli = compression.brotli
+        quality = settings.RESPONSE_COMPRESSION["BROTLI_QUALITY"]
+        renderers = [
+            ("DRF JSONRenderer", JSONRenderer()),
+            ("ORJSONRenderer", ORJSONRenderer()),
+            ("MessagePackRenderer", MessagePackRenderer()),
+        ]
+        for label, renderer in renderers:
+            body = renderer.render(data)
+            samples = bench.measure(lambda: renderer.render(data), repeat)
+            self.stdout.write(
+                "  " + bench.format_summary(f"render, {label}", samples) + f"  {len(body):>8} B"
+            )
+            codecs = [("gzip", lambda: compress_string(body, max_random_bytes=100))]
+            if brotli is not None:
+                codecs.append((f"br q{quality}", lambda: brotli.compress(body, quality=quality)))
+            for codec, fn in codecs:
+                samples = bench.measure(fn, repeat)
+                self.stdout.write(
+                    "  "
+                    + bench.format_summary(f"  + {codec}", samples)
+                    + f"  {len(fn()):>8} B"
+                )
+
+    def _requests(self, client, url, params, repeat):
+        cases = [
+            ("GET, JSON", {}),
+            ("GET, JSON, gzip", {"HTTP_ACCEPT_ENCODING": "gzip"}),
+            ("GET, JSON, br", {"HTTP_ACCEPT_ENCODING": "br, gzip"}),
+            ("GET, MessagePack", {"HTTP_ACCEPT": "application/msgpack"}),
+            (
+                "GET, MessagePack, br",
+                {"HTTP_ACCEPT": "application/msgpack", "HTTP_ACCEPT_ENCODING": "br, gzip"},
+            ),
+        ]
+        for label, headers in cases:
+            response = client.get(url, params, **headers)
+            samples = bench.measure(lambda: client.get(url, params, **headers), repeat)
+            self.stdout.write(
+                "  "
+                + bench.format_summary(label, samples)
+                + f"  {len(response.content):>8} B"
+            )
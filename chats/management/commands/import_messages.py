@@ -0,0 +1,130 @@
+import json
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from chats.models import ChatMembership, Message, conversation_key
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a JSONL file of messages into chats.Message in fixed-size batches. "
+        'Each line is {"senderId", "receiverId", "content", "timestamp"?, "read"?}'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSONL file to import ('-' for stdin)")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of messages inserted per transaction",
+        )
+        parser.add_argument(
+            "--skip-memberships",
+            action="store_true",
+            help="Don't update the inbox table while importing; run "
+            "backfill_chat_memberships afterwards instead",
+        )
+        parser.add_argument(
+            "--strict",
+            action="store_true",
+            help="Abort on the first invalid line instead of skipping it",
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.skip_memberships = options["skip_memberships"]
+        self.strict = options["strict"]
+        self.imported = 0
+        self.skipped = 0
+
+        if options["path"] == "-":
+            self._import(sys.stdin)
+        else:
+            try:
+                with open(options["path"], encoding="utf-8") as source:
+                    self._import(source)
+            except OSError as exc:
+                raise CommandError(f"Cannot read {options['path']}: {exc}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {self.imported} messages, skipped {self.skipped} lines"
+            )
+        )
+
+    def _import(self, source):
+        batch = []
+        for lineno, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            row = self._parse(lineno, line)
+            if row is not None:
+                batch.append((lineno, row))
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def _parse(self, lineno, line):
+        try:
+            data = json.loads(line)
+            row = {
+                "sender_id": int(data["senderId"]),
+                "receiver_id": int(data["receiverId"]),
+                "content": str(data["content"]),
+                "read": bool(data.get("read", False)),
+                "timestamp": timezone.now(),
+            }
+            if data.get("timestamp"):
+                timestamp = parse_datetime(data["timestamp"])
+                if timestamp is None:
+                    raise ValueError("timestamp is not ISO 8601")
+                if timezone.is_naive(timestamp):
+                    timestamp = timezone.make_aware(timestamp)
+                row["timestamp"] = timestamp
+        except (ValueError, TypeError, KeyError) as exc:
+            self._skip(lineno, f"invalid line ({exc!r})")
+            return None
+        if not row["content"]:
+            self._skip(lineno, "empty content")
+            return None
+        return row
+
+    def _skip(self, lineno, reason):
+        if self.strict:
+            raise CommandError(f"Line {lineno}: {reason}")
+        self.skipped += 1
+        self.stderr.write(f"Skipping line {lineno}: {reason}")
+
+    def _flush(self, batch):
+        # One id__in query per batch to drop rows pointing at unknown users
+        user_ids = {row["sender_id"] for _, row in batch} | {
+            row["receiver_id"] for _, row in batch
+        }
+        known = set(User.objects.filter(id__in=user_ids).values_list("id", flat=True))
+        messages = []
+        for lineno, row in batch:
+            if row["sender_id"] not in known or row["receiver_id"] not in known:
+                self._skip(lineno, "unknown sender or receiver")
+                continue
+            messages.append(
+                Message(
+                    conversation_key=conversation_key(
+                        row["sender_id"], row["receiver_id"]
+                    ),
+                    **row,
+                )
+            )
+        with transaction.atomic():
+            created = Message.objects.bulk_create(messages)
+            if not self.skip_memberships:
+                ChatMembership.record_messages(created)
+        self.imported += len(created)
+        self.stdout.write(f"Imported {self.imported} messages")
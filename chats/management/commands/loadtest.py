@@ -0,0 +1,245 @@
+import asyncio
+import json
+import platform
+import random
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import bench
+
+ACTIONS = ("login", "send", "list", "inbox", "read")
+DEFAULT_MIX = "login=1,send=2,list=4,inbox=4,read=1"
+APPS = {"asgi": "core.asgi:application", "wsgi": "core.wsgi:application"}
+
+
+def parse_mix(value):
+    """``"send=2,list=4"`` -> ``{"send": 2.0, "list": 4.0}``."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise CommandError(f"Unknown action {name!r}; use {', '.join(ACTIONS)}")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f"Invalid weight for {name!r}: {weight!r}")
+    if not any(mix.values()):
+        raise CommandError("--mix needs at least one action with a positive weight")
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a weighted mix of logins, sends, history and inbox reads and mark-read "
+        "calls from many concurrent clients against the WSGI or ASGI app (or a running "
+        "server), then report requests/s and p50/p95/p99 latency per action. Results "
+        "can be saved as JSON and compared with an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--server", choices=sorted(APPS), default="asgi")
+        parser.add_argument(
+            "--url",
+            help="Drive an already running server on the same database instead",
+        )
+        parser.add_argument("--clients", type=int, default=50)
+        parser.add_argument("--duration", type=float, default=30)
+        parser.add_argument(
+            "--warmup",
+            type=float,
+            default=5,
+            help="Seconds of traffic left out of the results",
+        )
+        parser.add_argument(
+            "--think",
+            type=float,
+            default=0,
+            help="Mean seconds each client waits between requests (0: back to back)",
+        )
+        parser.add_argument("--mix", default=DEFAULT_MIX)
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--messages", type=int, default=20000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+        parser.add_argument("--compare", help="Print the change against this JSON file")
+        parser.add_argument(
+            "--reuse",
+            action="store_true",
+            help="Run against the bench data left by a previous --keep run",
+        )
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options["mix"])
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                baseline = json.load(file)
+        bench.raise_open_file_limit(options["clients"] + 256)
+        if options["reuse"]:
+            user_ids = list(bench.bench_users().order_by("id").values_list("id", flat=True))
+            if len(user_ids) < 2:
+                raise CommandError("No bench data to reuse; run with --keep first")
+        else:
+            user_ids = bench.seed_users(options["users"], stdout=self.stdout)
+        # Everyone talks to their neighbours, so each user has a few busy chats
+        pairs = [
+            (a, b) for i, a in enumerate(user_ids) for b in user_ids[i + 1 : i + 4]
+        ]
+        if not options["reuse"]:
+            bench.seed_messages(pairs, options["messages"], stdout=self.stdout)
+            call_command("backfill_chat_memberships", stdout=self.stdout)
+        users = User.objects.in_bulk(user_ids)
+        partners = {uid: [] for uid in user_ids}
+        for a, b in pairs:
+            partners[a].append(b)
+            partners[b].append(a)
+        clients = [
+            {
+                "email": users[uid].email,
+                "token": str(AccessToken.for_user(users[uid])),
+                "partners": partners[uid],
+            }
+            for uid in user_ids
+        ]
+        try:
+            if options["url"]:
+                url = urlsplit(options["url"])
+                results = asyncio.run(
+                    self._drive(url.hostname, url.port or 80, clients, mix, options)
+                )
+            else:
+                port = bench.free_port()
+                server = bench.start_server(
+                    APPS[options["server"]],
+                    port,
+                    interface="wsgi" if options["server"] == "wsgi" else "auto",
+                )
+                try:
+                    results = asyncio.run(
+                        self._drive("127.0.0.1", port, clients, mix, options)
+                    )
+                finally:
+                    server.terminate()
+                    server.wait()
+        finally:
+            if not options["keep"]:
+                bench.cleanup(stdout=self.stdout)
+
+        results["run"] = {
+            "started_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "server": options["url"] or options["server"],
+            "mix": mix,
+            **{
+                key: options[key]
+                for key in ("clients", "duration", "warmup", "think", "users", "messages", "seed")
+            },
+        }
+        self._report(results, baseline)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    async def _drive(self, host, port, clients, mix, options):
+        names, weights = zip(*mix.items())
+        latencies = {name: [] for name in names}
+        errors = {name: 0 for name in names}
+        started = time.perf_counter()
+        measure_from = started + options["warmup"]
+        deadline = measure_from + options["duration"]
+
+        def request_for(name, user, rng):
+            partner = rng.choice(user["partners"])
+            if name == "login":
+                body = {"email": user["email"], "password": bench.BENCH_PASSWORD}
+                return "POST", "/api/users/login/", {}, body
+            headers = {"Authorization": f"Bearer {user['token']}"}
+            if name == "send":
+                body = {"receiverId": partner, "content": "load test"}
+                return "POST", "/api/chats/messages/", headers, body
+            if name == "list":
+                return "GET", f"/api/chats/messages/{partner}/?limit=50", headers, None
+            if name == "inbox":
+                return "GET", "/api/chats/?limit=20", headers, None
+            return "POST", f"/api/chats/messages/{partner}/read", headers, None
+
+        async def client(index):
+            # One generator per client keeps the sequence of requests reproducible
+            rng = random.Random(options["seed"] * 1_000_003 + index)
+            user = clients[index % len(clients)]
+            if options["think"]:
+                await asyncio.sleep(rng.uniform(0, options["think"]))
+            while (now := time.perf_counter()) < deadline:
+                name = rng.choices(names, weights)[0]
+                method, path, headers, body = request_for(name, user, rng)
+                try:
+                    status, _ = await bench.http_request(
+                        host, port, method, path, headers, body
+                    )
+                except OSError:
+                    status = 0
+                if now >= measure_from:
+                    if status in (200, 201):
+                        latencies[name].append(time.perf_counter() - now)
+                    else:
+                        errors[name] += 1
+                if options["think"]:
+                    await asyncio.sleep(rng.expovariate(1 / options["think"]))
+
+        await asyncio.gather(*(client(i) for i in range(options["clients"])))
+        elapsed = time.perf_counter() - measure_from
+
+        def stats(samples, failed):
+            return {
+                "requests": len(samples),
+                "errors": failed,
+                "requests_per_s": round(len(samples) / elapsed, 1),
+                "latency_ms": bench.summarize(samples) if samples else None,
+            }
+
+        every = [s for samples in latencies.values() for s in samples]
+        return {
+            "total": stats(every, sum(errors.values())),
+            "actions": {
+                name: stats(latencies[name], errors[name]) for name in sorted(names)
+            },
+        }
+
+    def _report(self, results, baseline):
+        rows = [("total", results["total"])] + sorted(results["actions"].items())
+        for name, row in rows:
+            latency = row["latency_ms"] or {}
+            line = (
+                f"{name:<8} {row['requests_per_s']:>9.1f} req/s "
+                f"errors={row['errors']:<5} "
+                + " ".join(f"{p}={latency.get(p, 0):8.2f}ms" for p in ("p50", "p95", "p99"))
+            )
+            if baseline:
+                before = (
+                    baseline["total"] if name == "total" else baseline["actions"].get(name)
+                )
+                if before:
+                    line += "  vs baseline: " + self._changes(row, before)
+            self.stdout.write(line)
+
+    @staticmethod
+    def _changes(row, before):
+        def change(new, old):
+            return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+        parts = [f"req/s {change(row['requests_per_s'], before['requests_per_s'])}"]
+        if row["latency_ms"] and before["latency_ms"]:
+            parts += [
+                f"{p} {change(row['latency_ms'][p], before['latency_ms'][p])}"
+                for p in ("p50", "p95", "p99")
+            ]
+        return " ".join(parts)
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import bench
+
+
+def _thread_count(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the DRF views with their async twins (ASYNC_API_VIEWS) under "
+        "core.asgi: start uvicorn once per mode, then drive many concurrent clients "
+        "that pause between requests through the hot chat endpoints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--modes", default="sync,async")
+        parser.add_argument("--clients", type=int, default=500)
+        parser.add_argument("--duration", type=float, default=20)
+        parser.add_argument(
+            "--think",
+            type=float,
+            default=0.5,
+            help="Mean seconds each client waits between requests",
+        )
+        parser.add_argument(
+            "--writes",
+            type=float,
+            default=0.1,
+            help="Share of requests that send a message or mark a chat read",
+        )
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--messages", type=int, default=20000)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        modes = options["modes"].split(",")
+        if set(modes) - {"sync", "async"}:
+            raise CommandError("--modes takes sync and/or async")
+        bench.raise_open_file_limit(options["clients"] + 256)
+        user_ids = bench.seed_users(options["users"])
+        # Everyone talks to their neighbours, so each user has a few busy chats
+        pairs = [
+            (a, b) for i, a in enumerate(user_ids) for b in user_ids[i + 1 : i + 4]
+        ]
+        bench.seed_messages(pairs, options["messages"], stdout=self.stdout)
+        call_command("backfill_chat_memberships", stdout=self.stdout)
+        users = User.objects.in_bulk(user_ids)
+        tokens = {uid: str(AccessToken.for_user(users[uid])) for uid in user_ids}
+        partners = {uid: [] for uid in user_ids}
+        for a, b in pairs:
+            partners[a].append(b)
+            partners[b].append(a)
+        results = {}
+        try:
+            for mode in modes:
+                results[mode] = self._run_mode(mode, tokens, partners, options)
+                self.stdout.write(json.dumps({mode: results[mode]}, indent=2))
+        finally:
+            if not options["keep"]:
+                bench.cleanup(stdout=self.stdout)
+
+    def _run_mode(self, mode, tokens, partners, options):
+        port = bench.free_port()
+        server = bench.start_server(
+            "core.asgi:application",
+            port,
+            env={"ASYNC_API_VIEWS": "1" if mode == "async" else "0"},
+        )
+        try:
+            return asyncio.run(self._drive(port, server.pid, tokens, partners, options))
+        finally:
+            server.terminate()
+            server.wait()
+
+    async def _drive(self, port, pid, tokens, partners, options):
+        host = "127.0.0.1"
+        rng = random.Random(0)
+        latencies = {}
+        errors = {}
+        threads = []
+        deadline = time.perf_counter() + options["duration"]
+
+        def pick(user_id):
+            partner = rng.choice(partners[user_id])
+            if rng.random() < options["writes"]:
+                if rng.random() < 0.5:
+                    return "send", "POST", "/api/chats/messages/", {
+                        "receiverId": partner,
+                        "content": "load test",
+                    }
+                return "read", "POST", f"/api/chats/messages/{partner}/read", None
+            return rng.choice(
+                [
+                    ("history", "GET", f"/api/chats/messages/{partner}/?limit=50", None),
+                    ("recent", "GET", "/api/chats/?limit=20", None),
+                    ("me", "GET", "/api/users/me/", None),
+                ]
+            )
+
+        async def client(user_id):
+            headers = {"Authorization": f"Bearer {tokens[user_id]}"}
+            # Stagger the start so clients don't arrive in lockstep
+            await asyncio.sleep(rng.uniform(0, options["think"]))
+            while time.perf_counter() < deadline:
+                name, method, path, body = pick(user_id)
+                started = time.perf_counter()
+                try:
+                    status, _ = await bench.http_request(
+                        host, port, method, path, headers, body
+                    )
+                except OSError:
+                    status = 0
+                if status in (200, 201):
+                    latencies.setdefault(name, []).append(
+                        time.perf_counter() - started
+                    )
+                else:
+                    errors[name] = errors.get(name, 0) + 1
+                await asyncio.sleep(rng.expovariate(1 / options["think"]))
+
+        async def sample_threads():
+            while time.perf_counter() < deadline:
+                threads.append(_thread_count(pid))
+                await asyncio.sleep(0.5)
+
+        user_ids = list(tokens)
+        started = time.perf_counter()
+        await asyncio.gather(
+            sample_threads(),
+            *(client(user_ids[i % len(user_ids)]) for i in range(options["clients"])),
+        )
+        elapsed = time.perf_counter() - started
+        every = [s for samples in latencies.values() for s in samples]
+        return {
+            "clients": options["clients"],
+            "requests_per_s": round(len(every) / elapsed, 1),
+            "errors": errors,
+            "server_threads_max": max(filter(None, threads), default=None),
+            "latency_ms": {
+                "all": bench.summarize(every) if every else None,
+                **{name: bench.summarize(s) for name, s in sorted(latencies.items())},
+            },
+        }
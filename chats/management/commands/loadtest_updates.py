@@ -0,0 +1,115 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold many concurrent long-poll requests against a running server, then "
+        "send one message per user and measure how fast the waiters wake up. "
+        "Start the server first, e.g. 'uvicorn core.asgi:application'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--clients", type=int, default=5000)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument(
+            "--settle",
+            type=float,
+            default=10,
+            help="Seconds to wait for every client to be parked before sending",
+        )
+        parser.add_argument("--timeout", type=int, default=25)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        limit = bench.raise_open_file_limit(options["clients"] + 256)
+        if limit < options["clients"] + 256:
+            raise CommandError(
+                f"Open file limit is {limit}; raise it (ulimit -n) to hold "
+                f"{options['clients']} connections"
+            )
+        user_ids = bench.seed_users(options["users"] + 1)
+        users = User.objects.in_bulk(user_ids)
+        tokens = {uid: str(AccessToken.for_user(users[uid])) for uid in user_ids}
+        try:
+            result = asyncio.run(
+                self._run(url.hostname, url.port or 80, user_ids, tokens, options)
+            )
+        finally:
+            if not options["keep"]:
+                bench.cleanup(stdout=self.stdout)
+        self.stdout.write(json.dumps(result, indent=2))
+
+    async def _run(self, host, port, user_ids, tokens, options):
+        sender, receivers = user_ids[0], user_ids[1:]
+        sent_at = {}
+        wake_latencies, outcomes = [], {"messages": 0, "empty": 0, "errors": 0}
+
+        async def wait(receiver):
+            path = f"/api/chats/updates?since=0&timeout={options['timeout']}"
+            headers = {"Authorization": f"Bearer {tokens[receiver]}"}
+            try:
+                status, body = await bench.http_request(host, port, "GET", path, headers)
+            except OSError:
+                outcomes["errors"] += 1
+                return
+            if status != 200:
+                outcomes["errors"] += 1
+            elif json.loads(body)["messages"]:
+                outcomes["messages"] += 1
+                if receiver in sent_at:
+                    wake_latencies.append(time.perf_counter() - sent_at[receiver])
+            else:
+                outcomes["empty"] += 1
+
+        started = time.perf_counter()
+        waiters = [
+            asyncio.ensure_future(wait(receivers[i % len(receivers)]))
+            for i in range(options["clients"])
+        ]
+        await asyncio.sleep(options["settle"])
+        parked = sum(not w.done() for w in waiters)
+
+        headers = {"Authorization": f"Bearer {tokens[sender]}"}
+
+        async def send(receiver):
+            sent_at[receiver] = time.perf_counter()
+            status, _ = await bench.http_request(
+                host,
+                port,
+                "POST",
+                "/api/chats/messages/",
+                headers,
+                {"receiverId": receiver, "content": "wake up"},
+            )
+            if status != 201:
+                del sent_at[receiver]
+            return status == 201
+
+        # Sequential sends keep SQLite write contention out of the wake-up numbers
+        failed_sends = 0
+        for receiver in receivers:
+            failed_sends += not await send(receiver)
+        await asyncio.gather(*waiters)
+
+        return {
+            "clients": options["clients"],
+            "parked_before_send": parked,
+            "failed_sends": failed_sends,
+            **outcomes,
+            "wake_latency_ms": (
+                bench.summarize(wake_latencies) if wake_latencies else None
+            ),
+            "elapsed_s": round(time.perf_counter() - started, 2),
+        }
+
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from chats.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-index every chats.Message and chats.ArchivedMessage for full-text search. "
+        "Messages are indexed as they are written and migrations index existing ones; "
+        "this repairs an index that got out of step, e.g. after restoring the table "
+        "from a backup"
+    )
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        self.stdout.write(f"Using {type(backend).__name__}")
+        self.stdout.write(self.style.SUCCESS(backend.rebuild()))
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from chats.models import ChatMembership, Message
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute ChatMembership.unread_count from chats.Message and fix the rows "
+        "that drifted. Safe to run while the site is live, e.g. nightly from cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="users",
+            help="Only repair this user's counters (repeatable)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users checked per transaction",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drifted counters without changing them",
+        )
+
+    def handle(self, *args, **options):
+        # Served by the partial (receiver, sender) WHERE read = false index on Message
+        unread = Coalesce(
+            Subquery(
+                Message.objects.filter(
+                    receiver=OuterRef("user"), sender=OuterRef("partner"), read=False
+                )
+                .order_by()
+                .values("receiver")
+                .annotate(count=Count("id"))
+                .values("count")
+            ),
+            0,
+        )
+        user_ids = options["users"] or list(
+            ChatMembership.objects.order_by("user")
+            .values_list("user", flat=True)
+            .distinct()
+        )
+        batch_size = options["batch_size"]
+        drifted_total = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start : start + batch_size]
+            with transaction.atomic():
+                drifted = (
+                    ChatMembership.objects.filter(user__in=batch)
+                    .annotate(actual=unread)
+                    .exclude(unread_count=F("actual"))
+                )
+                for user_id, partner_id, stored, actual in drifted.values_list(
+                    "user", "partner", "unread_count", "actual"
+                ):
+                    self.stdout.write(
+                        f"user {user_id} / partner {partner_id}: {stored} -> {actual}"
+                    )
+                    drifted_total += 1
+                if not options["dry_run"]:
+                    # Recomputed in the UPDATE itself, so messages sent or read since
+                    # the check above are still counted correctly
+                    drifted.update(unread_count=unread)
+
+        verb = "Found" if options["dry_run"] else "Repaired"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {drifted_total} drifted counters across {len(user_ids)} users"
+            )
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2025-05-26 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="read",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:02
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat, Greatest, Least
+
+BATCH_SIZE = 50000
+
+
+def backfill_conversation_key(apps, schema_editor):
+    Message = apps.get_model("chats", "Message")
+    messages = Message.objects.using(schema_editor.connection.alias)
+    key = Concat(
+        Cast(Least("sender_id", "receiver_id"), CharField()),
+        Value(":"),
+        Cast(Greatest("sender_id", "receiver_id"), CharField()),
+        output_field=CharField(),
+    )
+    last_id = messages.aggregate(models.Max("id"))["id__max"] or 0
+    # Walk the primary key in fixed ranges so no single UPDATE locks the table
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        messages.filter(id__gte=start, id__lt=start + BATCH_SIZE).update(
+            conversation_key=key
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0003_chatmembership"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="conversation_key",
+            field=models.CharField(default="", editable=False, max_length=41),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name="message",
+            name="timestamp",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(
+            backfill_conversation_key, migrations.RunPython.noop, elidable=True
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["conversation_key", "-timestamp", "-id"],
+                name="chats_msg_conversation",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                condition=models.Q(("read", False)),
+                fields=["receiver", "sender"],
+                name="chats_msg_unread",
+            ),
+        ),
+    ]
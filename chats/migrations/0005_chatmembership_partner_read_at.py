@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0004_message_conversation_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatmembership",
+            name="partner_read_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+from chats.search import SQLITE_MESSAGE_TRIGGERS
+from core.schema import run_sql
+
+# Full-text index over chats_message.content, queried by chats.search. The database
+# keeps it current on every insert, update and delete.
+#
+# On SQLite the triggers belong to chats_message: a later migration that makes Django
+# rebuild that table (rather than ALTER it in place) drops them and must recreate them
+# with chats.search.SQLITE_MESSAGE_TRIGGERS.
+
+# SQLite indexes the participants as "u<id>" tokens next to the content, so "my
+# messages matching X" is one FTS5 AND rather than every match of X filtered
+# afterwards. The FTS5 table keeps its own copy of both columns (snippets are cut from
+# it), so nothing else in the schema depends on chats_message and Django can still
+# rebuild that table.
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE chats_message_fts USING fts5(
+        content,
+        participants,
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    # Only the content column counts towards relevance
+    "INSERT INTO chats_message_fts(chats_message_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+    """
+    INSERT INTO chats_message_fts(rowid, content, participants)
+    SELECT id, content, 'u' || sender_id || ' u' || receiver_id FROM chats_message
+    """,
+    *SQLITE_MESSAGE_TRIGGERS,
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS chats_message_fts_update",
+    "DROP TRIGGER IF EXISTS chats_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chats_message_fts_insert",
+    "DROP TABLE IF EXISTS chats_message_fts",
+]
+
+POSTGRES_INSTALL = [
+    "CREATE INDEX chats_msg_content_search ON chats_message "
+    "USING GIN (to_tsvector('simple', content))",
+]
+POSTGRES_UNINSTALL = ["DROP INDEX IF EXISTS chats_msg_content_search"]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0005_chatmembership_partner_read_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_sql({"sqlite": SQLITE_INSTALL, "postgresql": POSTGRES_INSTALL}),
+            run_sql({"sqlite": SQLITE_UNINSTALL, "postgresql": POSTGRES_UNINSTALL}),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0006_message_search_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmembership",
+            index=models.Index(
+                condition=models.Q(("unread_count__gt", 0)),
+                fields=["user"],
+                name="chats_membership_unread",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from chats.search import SQLITE_MESSAGE_TRIGGERS
+from core.schema import run_sql
+
+# Removing the attachment column on the way back rebuilds chats_message on SQLite,
+# which drops the search index triggers that 0006 put on it
+restore_triggers = run_sql({"sqlite": SQLITE_MESSAGE_TRIGGERS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0007_chatmembership_unread_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Unapplied last, after the column is gone
+        migrations.RunPython(migrations.RunPython.noop, restore_triggers),
+        migrations.CreateModel(
+            name="Attachment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sha256", models.CharField(max_length=64)),
+                ("kind", models.CharField(max_length=16)),
+                ("name", models.CharField(max_length=255)),
+                ("size", models.BigIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "uploader",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="attachments",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="attachment",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="messages",
+                to="chats.attachment",
+            ),
+        ),
+    ]
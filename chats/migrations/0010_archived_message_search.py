@@ -0,0 +1,65 @@
+from django.db import migrations
+
+from core.schema import run_sql
+
+# Index archived messages next to the hot ones, so search keeps finding messages once
+# chats.retention moves them. An archived message keeps its id, and it is deleted from
+# chats_message before it is inserted here, so each id is in the index once.
+#
+# On SQLite the triggers belong to chats_archivedmessage: a later migration that makes
+# Django rebuild that table (rather than ALTER it in place) drops them and must
+# recreate them.
+SQLITE_INSTALL = [
+    """
+    INSERT INTO chats_message_fts(rowid, content, participants)
+    SELECT id, content, 'u' || sender_id || ' u' || receiver_id
+    FROM chats_archivedmessage
+    """,
+    """
+    CREATE TRIGGER chats_archivedmessage_fts_insert
+    AFTER INSERT ON chats_archivedmessage BEGIN
+        INSERT INTO chats_message_fts(rowid, content, participants)
+        VALUES (new.id, new.content, 'u' || new.sender_id || ' u' || new.receiver_id);
+    END
+    """,
+    """
+    CREATE TRIGGER chats_archivedmessage_fts_delete
+    AFTER DELETE ON chats_archivedmessage BEGIN
+        DELETE FROM chats_message_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER chats_archivedmessage_fts_update
+    AFTER UPDATE OF content, sender_id, receiver_id ON chats_archivedmessage BEGIN
+        DELETE FROM chats_message_fts WHERE rowid = old.id;
+        INSERT INTO chats_message_fts(rowid, content, participants)
+        VALUES (new.id, new.content, 'u' || new.sender_id || ' u' || new.receiver_id);
+    END
+    """,
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS chats_archivedmessage_fts_update",
+    "DROP TRIGGER IF EXISTS chats_archivedmessage_fts_delete",
+    "DROP TRIGGER IF EXISTS chats_archivedmessage_fts_insert",
+    "DELETE FROM chats_message_fts WHERE rowid IN (SELECT id FROM chats_archivedmessage)",
+]
+
+POSTGRES_INSTALL = [
+    "CREATE INDEX chats_archive_content_search ON chats_archivedmessage "
+    "USING GIN (to_tsvector('simple', content))",
+]
+POSTGRES_UNINSTALL = ["DROP INDEX IF EXISTS chats_archive_content_search"]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chats", "0009_archivedmessage"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_sql({"sqlite": SQLITE_INSTALL, "postgresql": POSTGRES_INSTALL}),
+            run_sql({"sqlite": SQLITE_UNINSTALL, "postgresql": POSTGRES_UNINSTALL}),
+        ),
+    ]
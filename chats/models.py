@@ -1,5 +1,40 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+
+def conversation_key(user_a_id, user_b_id):
+    """Order-independent key shared by every message between two users."""
+    low, high = sorted((user_a_id, user_b_id))
+    return f"{low}:{high}"
+
+
+class Attachment(models.Model):
+    """
+    A file attached to a message. The bytes are stored once per content hash under
+    ``MEDIA_ROOT/attachments`` (``uploads.pipeline.store_by_hash``), so a row is only
+    the name and size the uploader gave it.
+    """
+
+    uploader = models.ForeignKey(
+        User, related_name="attachments", on_delete=models.CASCADE
+    )
+    sha256 = models.CharField(max_length=64)
+    kind = models.CharField(max_length=16)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.kind}, {self.size} bytes)"
+
+    @property
+    def path(self):
+        from uploads.pipeline import hashed_name
+
+        return hashed_name("attachments", self.sha256, self.kind)
 
 
 class Message(models.Model):
@@ -9,9 +44,188 @@ class Message(models.Model):
     receiver = models.ForeignKey(
         User, related_name="received_messages", on_delete=models.CASCADE
     )
+    conversation_key = models.CharField(max_length=41, editable=False)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     read = models.BooleanField(default=False)
+    attachment = models.ForeignKey(
+        Attachment, related_name="messages", null=True, blank=True, on_delete=models.SET_NULL
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["conversation_key", "-timestamp", "-id"],
+                name="chats_msg_conversation",
+            ),
+            models.Index(
+                fields=["receiver", "sender"],
+                condition=models.Q(read=False),
+                name="chats_msg_unread",
+            ),
+        ]
 
     def __str__(self):
         return f"From {self.sender} to {self.receiver}: {self.content[:20]}"
+
+    def save(self, *args, **kwargs):
+        if not self.conversation_key:
+            self.conversation_key = conversation_key(self.sender_id, self.receiver_id)
+        super().save(*args, **kwargs)
+
+
+class ArchivedMessage(models.Model):
+    """
+    Messages moved out of ``Message`` by ``archive_messages`` (see ``chats.retention``).
+    Same ids and columns, so archived rows serialize and paginate like hot ones.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    sender = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    receiver = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    conversation_key = models.CharField(max_length=41)
+    content = models.TextField()
+    timestamp = models.DateTimeField()
+    read = models.BooleanField(default=False)
+    attachment = models.ForeignKey(
+        Attachment, related_name="+", null=True, blank=True, on_delete=models.SET_NULL
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["conversation_key", "-timestamp", "-id"],
+                name="chats_archive_conversation",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Archived from {self.sender} to {self.receiver}: {self.content[:20]}"
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(
+            id=message.id,
+            sender_id=message.sender_id,
+            receiver_id=message.receiver_id,
+            conversation_key=message.conversation_key,
+            content=message.content,
+            timestamp=message.timestamp,
+            read=message.read,
+            attachment_id=message.attachment_id,
+        )
+
+
+class ChatMembership(models.Model):
+    """
+    Denormalized inbox entry: one row per (user, partner) pair that have exchanged
+    messages, holding what the recent chats list needs without touching Message.
+    """
+
+    user = models.ForeignKey(
+        User, related_name="chat_memberships", on_delete=models.CASCADE
+    )
+    partner = models.ForeignKey(User, related_name="+", on_delete=models.CASCADE)
+    last_message = models.ForeignKey(
+        Message, related_name="+", null=True, on_delete=models.SET_NULL
+    )
+    last_timestamp = models.DateTimeField()
+    unread_count = models.PositiveIntegerField(default=0)
+    # When ``partner`` last read messages from ``user`` (drives read receipts)
+    partner_read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "partner"], name="chats_membership_user_partner_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-last_timestamp", "-id"], name="chats_membership_inbox"
+            ),
+            # The unread badge only reads the conversations that have unread messages
+            models.Index(
+                fields=["user"],
+                name="chats_membership_unread",
+                condition=models.Q(unread_count__gt=0),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} <-> {self.partner} ({self.unread_count} unread)"
+
+    @classmethod
+    def record_message(cls, message):
+        """Update both sides of the conversation for a newly stored message."""
+        cls.record_messages([message])
+
+    @classmethod
+    def record_messages(cls, messages):
+        """
+        Batch form of ``record_message``: one pair of row updates per conversation
+        direction rather than per message.
+        """
+        latest, unread = {}, {}
+        for message in messages:
+            if message.sender_id == message.receiver_id:
+                continue
+            pair = (message.sender_id, message.receiver_id)
+            current = latest.get(pair)
+            if current is None or (message.timestamp, message.id) > (
+                current.timestamp,
+                current.id,
+            ):
+                latest[pair] = message
+            unread[pair] = unread.get(pair, 0) + (not message.read)
+        with transaction.atomic():
+            for (sender_id, receiver_id), message in latest.items():
+                cls._touch(sender_id, receiver_id, message, unread=0)
+                cls._touch(
+                    receiver_id, sender_id, message, unread=unread[sender_id, receiver_id]
+                )
+
+    @classmethod
+    def mark_read(cls, user, partner, count):
+        """
+        Drop ``count`` unread messages from ``partner`` off ``user``'s counter and
+        stamp the read receipt on ``partner``'s side. Returns the receipt time.
+        """
+        if not count:
+            return None
+        read_at = timezone.now()
+        cls.objects.filter(user=user, partner=partner).update(
+            unread_count=Greatest(F("unread_count") - count, 0)
+        )
+        cls.objects.filter(user=partner, partner=user).update(partner_read_at=read_at)
+        return read_at
+
+    @classmethod
+    def _touch(cls, user_id, partner_id, message, unread):
+        # Only move the "last message" pointer forward, so that late writers
+        # (bot replies, imports) cannot replace a newer message with an older one.
+        is_newer = models.Q(last_timestamp__lte=message.timestamp)
+        updated = cls.objects.filter(user_id=user_id, partner_id=partner_id).update(
+            last_message=Case(
+                When(is_newer, then=Value(message.id)),
+                default=F("last_message"),
+                output_field=models.BigIntegerField(),
+            ),
+            last_timestamp=Greatest(F("last_timestamp"), Value(message.timestamp)),
+            unread_count=F("unread_count") + unread,
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    user_id=user_id,
+                    partner_id=partner_id,
+                    last_message=message,
+                    last_timestamp=message.timestamp,
+                    unread_count=unread,
+                )
+        except IntegrityError:
+            # Someone else created the row concurrently; apply our change on top.
+            cls._touch(user_id, partner_id, message, unread)
@@ -0,0 +1,123 @@
+"""
+Real-time event fan-out for connected chat clients.
+
+Views publish events to a per-user group through the channel layer configured in
+``settings.CHAT_CHANNEL_LAYER``; the WebSocket endpoint subscribes to the group of
+the authenticated user and forwards whatever arrives. A layer backend only needs
+``subscribe(group)`` returning an object with ``async get()``, ``get_nowait()`` and
+``close()``, and a thread-safe ``publish(group, event)``.
+"""
+
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+MESSAGE_NEW = "message.new"
+MESSAGE_READ = "message.read"
+TYPING = "typing"
+
+
+class Subscription:
+    def __init__(self, layer, group, capacity):
+        self.layer = layer
+        self.group = group
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=capacity)
+
+    def deliver(self, event):
+        # Runs on the subscriber's loop. A client that cannot keep up loses its
+        # oldest events rather than growing the queue without bound.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def get_nowait(self):
+        """Return a pending event; raises ``asyncio.QueueEmpty`` if there is none."""
+        return self.queue.get_nowait()
+
+    def close(self):
+        self.layer.discard(self)
+
+
+class InMemoryChannelLayer:
+    """Channel layer for a single process (development and tests)."""
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self._groups = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, group):
+        """Subscribe the running event loop to ``group``."""
+        subscription = Subscription(self, group, self.capacity)
+        with self._lock:
+            self._groups[group].add(subscription)
+        return subscription
+
+    def discard(self, subscription):
+        with self._lock:
+            members = self._groups.get(subscription.group)
+            if members is not None:
+                members.discard(subscription)
+                if not members:
+                    del self._groups[subscription.group]
+
+    def publish(self, group, event):
+        """Deliver ``event`` to every subscriber of ``group``; safe from any thread."""
+        with self._lock:
+            members = list(self._groups.get(group, ()))
+        for subscription in members:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:  # The subscriber's loop has already shut down
+                self.discard(subscription)
+
+    def group_size(self, group):
+        with self._lock:
+            return len(self._groups.get(group, ()))
+
+
+_layer = None
+_layer_lock = threading.Lock()
+
+
+def get_channel_layer():
+    global _layer
+    if _layer is None:
+        with _layer_lock:
+            if _layer is None:
+                config = settings.CHAT_CHANNEL_LAYER
+                backend = import_string(config["BACKEND"])
+                _layer = backend(**config.get("OPTIONS", {}))
+    return _layer
+
+
+def user_group(user_id):
+    return f"user.{user_id}"
+
+
+def publish_to_users(user_ids, event):
+    """Publish ``event`` to each user once the current transaction commits."""
+
+    def publish():
+        layer = get_channel_layer()
+        for user_id in set(user_ids):
+            layer.publish(user_group(user_id), event)
+
+    transaction.on_commit(publish)
+
+
+def publish_new_message(message):
+    from chats.serializers import MessageSerializer
+
+    publish_to_users(
+        [message.sender_id, message.receiver_id],
+        {"type": MESSAGE_NEW, "message": MessageSerializer(message).data},
+    )
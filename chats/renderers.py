@@ -0,0 +1,35 @@
+import csv
+import io
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class JSONLinesRenderer(JSONRenderer):
+    """
+    Newline-delimited JSON. Export views stream their rows themselves; this renderer
+    lets ``?format=jsonl`` through content negotiation and renders error bodies as a
+    single JSON line.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "jsonl"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(data, accepted_media_type, renderer_context) + b"\n"
+
+
+class CSVRenderer(BaseRenderer):
+    """CSV counterpart of ``JSONLinesRenderer``; a dict body becomes one header row and one value row."""
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(data.keys())
+        writer.writerow(data.values())
+        return buffer.getvalue().encode(self.charset)
@@ -0,0 +1,144 @@
+"""
+Message retention: old messages live in ``ArchivedMessage`` instead of ``Message``.
+
+``archive_messages`` moves read messages older than ``CHAT_RETENTION["ARCHIVE_AFTER"]``
+in small batches, each one transaction that copies the rows and deletes them from the
+hot table, so an interrupted run leaves every message in exactly one of the two and the
+next run carries on. Two kinds of old message stay hot: unread ones, which the unread
+counters and "mark as read" work on, and the last message of a conversation, which the
+inbox (``ChatMembership.last_message``) points at.
+
+Everything archived is older than the cutoff, so readers only need the archive once a
+page reaches back past it: ``MessageHistory`` (page numbers) and
+``ChatMessagesCursorPagination`` (cursors) merge archived rows in with the hot ones by
+``(timestamp, id)``. Search indexes both tables (``chats.search``).
+"""
+
+import heapq
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from chats.models import ArchivedMessage, ChatMembership, Message
+
+
+def archive_cutoff():
+    return timezone.now() - settings.CHAT_RETENTION["ARCHIVE_AFTER"]
+
+
+def archivable(cutoff):
+    kept = ChatMembership.objects.filter(last_message__isnull=False).values("last_message")
+    return Message.objects.filter(timestamp__lt=cutoff, read=True).exclude(id__in=kept)
+
+
+def archive_batch(cutoff, after_id=0, batch_size=None):
+    """
+    Move the next ``batch_size`` archivable messages with ids above ``after_id``.
+    Returns ``(moved, last_id)``; ``last_id`` is None once nothing is left.
+    """
+    batch_size = batch_size or settings.CHAT_RETENTION["BATCH_SIZE"]
+    with transaction.atomic():
+        batch = list(archivable(cutoff).filter(id__gt=after_id).order_by("id")[:batch_size])
+        if not batch:
+            return 0, None
+        # Out of the hot table first: the search index holds each id once
+        Message.objects.filter(id__in=[message.id for message in batch]).delete()
+        ArchivedMessage.objects.bulk_create(
+            [ArchivedMessage.from_message(message) for message in batch]
+        )
+    return len(batch), batch[-1].id
+
+
+class MessageHistory:
+    """
+    A conversation's hot and archived messages merged newest first by
+    ``(timestamp, id)``, for Django's ``Paginator``. Both querysets are ordered that
+    way. Hot rows newer than everything archived come first as they are, so a page
+    only reads the archive once its offset runs past them; the hot rows kept past the
+    cutoff (unread ones, the inbox's last message) are merged in with the archive.
+    """
+
+    def __init__(self, hot, archived):
+        self.hot = hot
+        self.archived = archived
+        self.hot_count = None
+        self.recent_count = None  # Hot rows newer than the newest archived one
+
+    def count(self):
+        self.hot_count = self.recent_count = self.hot.count()
+        archived_count = self.archived.count()
+        if archived_count:
+            newest = self.archived.values_list("timestamp", "id").first()
+            self.recent_count = self.hot.filter(_newer_than(*newest)).count()
+        return self.hot_count + archived_count
+
+    async def acount(self):
+        self.hot_count = self.recent_count = await self.hot.acount()
+        archived_count = await self.archived.acount()
+        if archived_count:
+            newest = await self.archived.values_list("timestamp", "id").afirst()
+            self.recent_count = await self.hot.filter(_newer_than(*newest)).acount()
+        return self.hot_count + archived_count
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("MessageHistory only supports slicing")
+        if self.hot_count is None:
+            self.count()
+        return _HistorySlice(self, key.start or 0, key.stop)
+
+
+def _newer_than(timestamp, message_id):
+    return Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id)
+
+
+def _key(row):
+    return row.timestamp, row.id
+
+
+class _HistorySlice:
+    def __init__(self, history, start, stop):
+        recent = history.recent_count
+        self.recent = history.hot[start : min(stop, recent)] if start < recent else None
+        # What the page takes from the merge of the older hot rows and the archive
+        self.start, self.stop = max(start - recent, 0), stop - recent
+        if self.stop > 0:
+            self.older_hot = history.hot[recent:stop]
+            self.archived = history.archived
+
+    def __iter__(self):
+        if self.recent is not None:
+            yield from self.recent
+        if self.stop > 0:
+            older = list(self.older_hot)
+            skip = self._skip(older)
+            yield from self._merge(older, list(self._archived(skip)), skip)
+
+    async def __aiter__(self):
+        if self.recent is not None:
+            async for row in self.recent:
+                yield row
+        if self.stop > 0:
+            older = [row async for row in self.older_hot]
+            skip = self._skip(older)
+            for row in self._merge(older, [row async for row in self._archived(skip)], skip):
+                yield row
+
+    def _skip(self, older):
+        # Archived rows certain to come before the page, whatever the older hot rows are
+        return max(self.start - len(older), 0)
+
+    def _archived(self, skip):
+        # From the last skipped row, which places the older hot rows around the skip
+        return self.archived[max(skip - 1, 0) : self.stop]
+
+    def _merge(self, older, archived, skip):
+        position = 0
+        if skip and archived:
+            last_skipped, archived = _key(archived[0]), archived[1:]
+            position = skip + sum(_key(row) > last_skipped for row in older)
+            older = [row for row in older if _key(row) < last_skipped]
+        merged = list(heapq.merge(older, archived, key=_key, reverse=True))
+        return merged[self.start - position : self.stop - position]
@@ -0,0 +1,302 @@
+"""
+Full-text search over chat messages.
+
+The index lives in the database and is kept up to date by the database itself (FTS5
+triggers on SQLite, an expression GIN index on Postgres), so ``bulk_create``, imports
+and bot replies are searchable without any application code. Each vendor has a
+backend that knows how to query and rebuild its index; other databases fall back to
+``icontains``.
+"""
+
+import re
+
+from django.db import connection as default_connection
+from django.db import transaction
+from django.db.models import Q
+
+# Hot and archived messages (chats.retention); both are searched
+MESSAGE_TABLES = ("chats_message", "chats_archivedmessage")
+
+# The SQLite index's triggers on chats_message (migration 0006). Django drops them
+# whenever a migration rebuilds that table rather than ALTERing it in place; such
+# migrations run these again afterwards. Kept in one place so they cannot drift.
+SQLITE_MESSAGE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS chats_message_fts_update",
+    "DROP TRIGGER IF EXISTS chats_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chats_message_fts_insert",
+    """
+    CREATE TRIGGER chats_message_fts_insert AFTER INSERT ON chats_message BEGIN
+        INSERT INTO chats_message_fts(rowid, content, participants)
+        VALUES (new.id, new.content, 'u' || new.sender_id || ' u' || new.receiver_id);
+    END
+    """,
+    """
+    CREATE TRIGGER chats_message_fts_delete AFTER DELETE ON chats_message BEGIN
+        DELETE FROM chats_message_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER chats_message_fts_update
+    AFTER UPDATE OF content, sender_id, receiver_id ON chats_message BEGIN
+        DELETE FROM chats_message_fts WHERE rowid = old.id;
+        INSERT INTO chats_message_fts(rowid, content, participants)
+        VALUES (new.id, new.content, 'u' || new.sender_id || ' u' || new.receiver_id);
+    END
+    """,
+]
+
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+SNIPPET_WORDS = 12
+
+_TERM_RE = re.compile(r"\w+")
+
+
+def query_terms(query):
+    """Split user input into plain word terms; search syntax is never passed through."""
+    return _TERM_RE.findall(query or "")
+
+
+def is_prefix_query(query):
+    """A trailing ``*`` makes the last term match as a prefix (``lun*``)."""
+    return (query or "").rstrip().endswith("*")
+
+
+class SearchResults:
+    """
+    Lazy hit list for Django's ``Paginator``: ``count()`` and each page slice run one
+    query against the backend.
+    """
+
+    def __init__(self, backend, user_id, terms, prefix=False):
+        self.backend = backend
+        self.user_id = user_id
+        self.terms = terms
+        self.prefix = prefix
+
+    def count(self):
+        return self.backend.count(self.user_id, self.terms, self.prefix)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("SearchResults only supports slicing")
+        offset = key.start or 0
+        return self.backend.hits(
+            self.user_id, self.terms, self.prefix, offset, key.stop - offset
+        )
+
+
+class SearchBackend:
+    """
+    ``count`` and ``hits`` only see messages sent or received by ``user_id`` that
+    contain every term; with ``prefix`` the last term may be the start of a word. Hits
+    are dicts with ``id``, ``snippet`` and ``rank`` (higher is better), best first.
+    """
+
+    def __init__(self, connection=None):
+        self.connection = connection or default_connection
+
+    def search(self, user_id, query):
+        return SearchResults(
+            self, user_id, query_terms(query), prefix=is_prefix_query(query)
+        )
+
+    def count(self, user_id, terms, prefix):
+        raise NotImplementedError
+
+    def hits(self, user_id, terms, prefix, offset, limit):
+        raise NotImplementedError
+
+    def rebuild(self):
+        """Re-index every stored message. Returns a short description of what was done."""
+        return "Nothing to rebuild"
+
+    def _fetch(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    FTS5 table with its own copy of each message's content, hot (migration 0006) and
+    archived (0010). Participants are indexed as ``u<id>`` tokens, so scoping to a
+    user is part of the match.
+    """
+
+    table = "chats_message_fts"
+
+    def match_expression(self, user_id, terms, prefix):
+        quoted = [f'"{term}"' for term in terms]
+        if prefix:
+            quoted[-1] += "*"
+        return f'content : ({" ".join(quoted)}) AND participants : "u{user_id}"'
+
+    def count(self, user_id, terms, prefix):
+        (count,) = self._fetch(
+            f"SELECT COUNT(*) FROM {self.table} WHERE {self.table} MATCH %s",
+            [self.match_expression(user_id, terms, prefix)],
+        )[0]
+        return count
+
+    def hits(self, user_id, terms, prefix, offset, limit):
+        rows = self._fetch(
+            f"SELECT rowid, snippet({self.table}, 0, %s, %s, '…', %s), rank "
+            f"FROM {self.table} WHERE {self.table} MATCH %s "
+            f"ORDER BY rank, rowid DESC LIMIT %s OFFSET %s",
+            [
+                SNIPPET_START,
+                SNIPPET_END,
+                SNIPPET_WORDS,
+                self.match_expression(user_id, terms, prefix),
+                limit,
+                offset,
+            ],
+        )
+        # bm25() is lower-is-better; flip it so every backend ranks the same way
+        return [
+            {"id": message_id, "snippet": snippet, "rank": -rank}
+            for message_id, snippet, rank in rows
+        ]
+
+    def rebuild(self):
+        with transaction.atomic(using=self.connection.alias):
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {self.table}")
+                for source in MESSAGE_TABLES:
+                    cursor.execute(
+                        f"INSERT INTO {self.table}(rowid, content, participants) "
+                        f"SELECT id, content, 'u' || sender_id || ' u' || receiver_id "
+                        f"FROM {source}"
+                    )
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('optimize')")
+        return f"Rebuilt {self.table} from {' and '.join(MESSAGE_TABLES)}"
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    GIN indexes on ``to_tsvector('simple', content)`` of hot (migration 0006) and
+    archived (0010) messages.
+    """
+
+    indexes = ("chats_msg_content_search", "chats_archive_content_search")
+    config = "simple"  # No stemming or stop words: chats mix languages
+
+    def tsquery(self, terms, prefix):
+        quoted = [f"'{term}'" for term in terms]
+        if prefix:
+            quoted[-1] += ":*"
+        return " & ".join(quoted)
+
+    def matches(self, user_id, terms, prefix):
+        """
+        SQL and params for the user's matching ``(id, content)`` rows of every message
+        table; each branch of the ``UNION ALL`` can use its table's index.
+        """
+        branch = (
+            "SELECT id, content FROM {} "
+            "WHERE to_tsvector(%s, content) @@ to_tsquery(%s, %s) "
+            "AND (sender_id = %s OR receiver_id = %s)"
+        )
+        params = [self.config, self.config, self.tsquery(terms, prefix), user_id, user_id]
+        return (
+            " UNION ALL ".join(branch.format(table) for table in MESSAGE_TABLES),
+            params * len(MESSAGE_TABLES),
+        )
+
+    def count(self, user_id, terms, prefix):
+        sql, params = self.matches(user_id, terms, prefix)
+        (count,) = self._fetch(f"SELECT COUNT(*) FROM ({sql}) matches", params)[0]
+        return count
+
+    def hits(self, user_id, terms, prefix, offset, limit):
+        options = (
+            f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, "
+            f"MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}"
+        )
+        sql, params = self.matches(user_id, terms, prefix)
+        rows = self._fetch(
+            "SELECT id, ts_headline(%s, content, q, %s), "
+            "ts_rank(to_tsvector(%s, content), q) AS rank "
+            f"FROM ({sql}) matches, to_tsquery(%s, %s) q "
+            "ORDER BY rank DESC, id DESC LIMIT %s OFFSET %s",
+            [
+                self.config,
+                options,
+                self.config,
+                *params,
+                self.config,
+                self.tsquery(terms, prefix),
+                limit,
+                offset,
+            ],
+        )
+        return [
+            {"id": message_id, "snippet": snippet, "rank": rank}
+            for message_id, snippet, rank in rows
+        ]
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            for index in self.indexes:
+                cursor.execute(f"REINDEX INDEX {index}")
+        return f"Reindexed {' and '.join(self.indexes)}"
+
+
+class IContainsBackend(SearchBackend):
+    """
+    Unindexed fallback (and the benchmark baseline): a ``LIKE`` scan per term, which
+    also matches inside words, so ``prefix`` makes no difference.
+    """
+
+    def _querysets(self, user_id, terms):
+        from chats.models import ArchivedMessage, Message
+
+        for model in (Message, ArchivedMessage):
+            messages = model.objects.using(self.connection.alias).filter(
+                Q(sender_id=user_id) | Q(receiver_id=user_id)
+            )
+            for term in terms:
+                messages = messages.filter(content__icontains=term)
+            yield messages
+
+    def count(self, user_id, terms, prefix):
+        return sum(messages.count() for messages in self._querysets(user_id, terms))
+
+    def hits(self, user_id, terms, prefix, offset, limit):
+        hot, archived = (
+            messages.values_list("id", "content", "timestamp")
+            for messages in self._querysets(user_id, terms)
+        )
+        rows = hot.union(archived, all=True).order_by("-timestamp", "-id")
+        return [
+            {"id": message_id, "snippet": _snippet(content, terms), "rank": 0.0}
+            for message_id, content, _ in rows[offset : offset + limit]
+        ]
+
+
+def _snippet(content, terms):
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    words = content.split()
+    first = next((i for i, word in enumerate(words) if pattern.search(word)), 0)
+    start = max(0, first - SNIPPET_WORDS // 2)
+    window = " ".join(words[start : start + SNIPPET_WORDS])
+    window = pattern.sub(lambda m: f"{SNIPPET_START}{m.group(0)}{SNIPPET_END}", window)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + SNIPPET_WORDS < len(words) else ""
+    return f"{prefix}{window}{suffix}"
+
+
+BACKENDS = {
+    "sqlite": SQLiteFTS5Backend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_search_backend(connection=None):
+    connection = connection or default_connection
+    return BACKENDS.get(connection.vendor, IContainsBackend)(connection)
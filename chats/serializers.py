@@ -1,23 +1,77 @@
+from django.conf import settings
 from django.contrib.auth.models import User
 from rest_framework import serializers
 
-from chats.models import Message
+from chats.models import Attachment, Message
+from core.serialization import format_datetime
+
+
+class AttachmentSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Attachment
+        fields = ["id", "name", "kind", "size", "url"]
+
+    def get_url(self, obj):
+        return settings.MEDIA_URL + obj.path
+
+
+def attachment_data(attachment):
+    """``AttachmentSerializer(attachment).data`` built directly."""
+    return {
+        "id": attachment.id,
+        "name": attachment.name,
+        "kind": attachment.kind,
+        "size": attachment.size,
+        "url": settings.MEDIA_URL + attachment.path,
+    }
 
 
 class MessageSerializer(serializers.ModelSerializer):
-    senderId = serializers.IntegerField(source="sender.id", read_only=True)
-    receiverId = serializers.IntegerField(source="receiver.id")
+    senderId = serializers.IntegerField(source="sender_id", read_only=True)
+    receiverId = serializers.IntegerField(source="receiver_id")
     read = serializers.BooleanField(read_only=True)
+    attachment = AttachmentSerializer(read_only=True)
 
     class Meta:
         model = Message
-        fields = ["id", "senderId", "receiverId", "content", "timestamp", "read"]
-        read_only_fields = ["id", "senderId", "timestamp", "read"]
+        fields = ["id", "senderId", "receiverId", "content", "timestamp", "read", "attachment"]
+        read_only_fields = ["id", "senderId", "timestamp", "read", "attachment"]
+
+
+def message_data(message, tz=None):
+    """``MessageSerializer(message).data`` without DRF's per-field machinery."""
+    return {
+        "id": message.id,
+        "senderId": message.sender_id,
+        "receiverId": message.receiver_id,
+        "content": message.content,
+        "timestamp": format_datetime(message.timestamp, tz),
+        "read": message.read,
+        # Views that list messages select_related("attachment")
+        "attachment": attachment_data(message.attachment) if message.attachment_id else None,
+    }
 
 
 class NewMessageRequestSerializer(serializers.Serializer):
     receiverId = serializers.IntegerField()
-    content = serializers.CharField()
+    content = serializers.CharField(allow_blank=True)
+    attachmentId = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if not data["content"] and "attachmentId" not in data:
+            raise serializers.ValidationError(
+                {"content": ["This field may not be blank."]}
+            )
+        return data
+
+
+class BulkMessagesRequestSerializer(serializers.Serializer):
+    # Items are validated one by one so each can fail on its own
+    messages = serializers.ListField(
+        child=serializers.JSONField(), allow_empty=False, max_length=5000
+    )
 
 
 class RecentChatSerializer(serializers.Serializer):
@@ -29,3 +83,15 @@ class RecentChatSerializer(serializers.Serializer):
         from users.serializers import UserSerializer
         request = self.context.get('request')
         return UserSerializer(obj['user'], context={'request': request}).data
+
+
+def recent_chat_data(membership, request=None, tz=None):
+    """``RecentChatSerializer`` output for one inbox row, built directly."""
+    from users.serializers import user_data
+
+    last_message = membership.last_message
+    return {
+        "user": user_data(membership.partner, request, tz),
+        "lastMessage": message_data(last_message, tz) if last_message else None,
+        "unreadCount": membership.unread_count,
+    }
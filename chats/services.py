@@ -0,0 +1,19 @@
+"""Writes shared by the API views and background jobs."""
+
+from django.db import transaction
+
+from chats.models import ChatMembership, Message
+from chats.realtime import publish_new_message
+from core import routers
+
+
+def store_message(sender, receiver, content, attachment=None):
+    """Save a message, update both inboxes and notify both users, atomically."""
+    with transaction.atomic():
+        message = Message.objects.create(
+            sender=sender, receiver=receiver, content=content, attachment=attachment
+        )
+        ChatMembership.record_message(message)
+        publish_new_message(message)
+    routers.remember_write(sender.id)
+    return message
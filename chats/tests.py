@@ -1,4 +1,1234 @@
+import asyncio
+import contextvars
+import gzip
+import json
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
-# If there were chat-related tests in users/msgtrik/tests.py, migrate them here.
-# If there were message-related tests in messages/tests.py, migrate them here.
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import (APIClient, APIRequestFactory, APITestCase,
+                                 APITransactionTestCase)
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from chats import async_views
+from chats import urls as chats_urls
+from chats.models import (ArchivedMessage, ChatMembership, Message,
+                          conversation_key)
+from chats.search import IContainsBackend, get_search_backend
+from chats.serializers import (MessageSerializer, RecentChatSerializer, message_data,
+                               recent_chat_data)
+from chats.services import store_message
+from chats.views import ChatMessagesCursorPagination, mark_conversation_read
+from chats.websocket import websocket_application
+from core import bench, compression, metrics, renderers
+from jobs.models import Job
+from jobs.worker import run_pending
+from users.management.commands.create_bot_users import BOT_EMAILS
+from users.cache import invalidate
+from users.models import UserProfile
+from users import search as user_search
+from users import urls as users_urls
+from users.revocation import get_revocation_list
+from users.serializers import (EmailTokenObtainPairSerializer, UserSerializer,
+                               user_data)
+from users.tests import png_bytes
+
+
+def make_user(email, name=None, password=None):
+    # No password by default: hashing one is the slowest part of most tests
+    user = User.objects.create_user(username=email, email=email, password=password)
+    UserProfile.objects.create(
+        user=user, name=name or email.split("@")[0], gender="other", dob="2000-01-01"
+    )
+    # Rolled-back tests hand out the same ids again; drop whatever the cache holds
+    invalidate(user.id)
+    return user
+
+
+class ChatMembershipTests(APITestCase):
+    def setUp(self):
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+        self.carol = make_user("carol.test@example.com")
+
+    def send(self, sender, receiver, content="hi"):
+        self.client.force_authenticate(sender)
+        response = self.client.post(
+            reverse("send_message"), {"receiverId": receiver.id, "content": content}
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def test_send_updates_both_sides(self):
+        message = self.send(self.alice, self.bob)
+        self.send(self.alice, self.bob)
+        bob_entry = ChatMembership.objects.get(user=self.bob, partner=self.alice)
+        alice_entry = ChatMembership.objects.get(user=self.alice, partner=self.bob)
+        self.assertEqual(bob_entry.unread_count, 2)
+        self.assertEqual(alice_entry.unread_count, 0)
+        self.assertEqual(bob_entry.last_message_id, message["id"] + 1)
+
+    def test_bot_reply_is_sent_by_a_background_job(self):
+        bot = make_user(BOT_EMAILS[0])
+        self.send(self.alice, bot, "ping")
+        job = Job.objects.get()
+        self.assertEqual(job.payload["userId"], self.alice.id)
+        Job.objects.update(run_at=job.created_at)  # Skip the thinking delay
+        run_pending()
+        reply = Message.objects.get(sender=bot)
+        self.assertIn("ping", reply.content)
+        self.assertEqual(
+            ChatMembership.objects.get(user=self.alice, partner=bot).last_message, reply
+        )
+
+    def test_mark_read_resets_counter(self):
+        self.send(self.alice, self.bob)
+        self.send(self.alice, self.bob)
+        self.client.force_authenticate(self.bob)
+        response = self.client.post(
+            reverse("mark_messages_as_read", args=[self.alice.id])
+        )
+        self.assertEqual(response.data["updated"], 2)
+        entry = ChatMembership.objects.get(user=self.bob, partner=self.alice)
+        self.assertEqual(entry.unread_count, 0)
+
+    def test_unread_counts_come_from_counters(self):
+        self.send(self.alice, self.carol)
+        self.send(self.bob, self.carol)
+        self.send(self.bob, self.carol)
+        self.send(self.carol, self.alice)  # Carol's own message doesn't count
+        self.client.force_authenticate(self.carol)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("unread_counts"))
+        self.assertEqual(response.data["total"], 3)
+        # Most recent conversation first; Carol's reply made that Alice's
+        self.assertEqual(
+            response.data["chats"],
+            [
+                {"userId": self.alice.id, "unreadCount": 1},
+                {"userId": self.bob.id, "unreadCount": 2},
+            ],
+        )
+
+    def test_repair_fixes_drifted_counters(self):
+        self.send(self.alice, self.bob)
+        self.send(self.alice, self.bob)
+        ChatMembership.objects.filter(user=self.bob).update(unread_count=7)
+        ChatMembership.objects.filter(user=self.alice).update(unread_count=1)
+        out = StringIO()
+        call_command("repair_unread_counts", "--dry-run", stdout=out)
+        self.assertIn("Found 2 drifted", out.getvalue())
+        self.assertEqual(ChatMembership.objects.get(user=self.bob).unread_count, 7)
+        call_command("repair_unread_counts", stdout=StringIO())
+        self.assertEqual(
+            dict(ChatMembership.objects.values_list("user", "unread_count")),
+            {self.bob.id: 2, self.alice.id: 0},
+        )
+
+    def test_recent_chats_ordered_by_last_activity(self):
+        self.send(self.bob, self.alice, "from bob")
+        self.send(self.carol, self.alice, "from carol")
+        self.client.force_authenticate(self.alice)
+        # Validators, count, page
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("recent_chats"))
+        chats = response.data["chats"]
+        self.assertEqual([c["user"]["id"] for c in chats], [self.carol.id, self.bob.id])
+        self.assertEqual(chats[0]["lastMessage"]["content"], "from carol")
+        self.assertEqual(chats[0]["unreadCount"], 1)
+        self.assertEqual(response.data["pagination"]["total"], 2)
+
+    def test_backfill_matches_live_bookkeeping(self):
+        self.send(self.alice, self.bob)
+        self.send(self.bob, self.alice)
+        self.send(self.carol, self.bob)
+        # Imported later (higher id) but older: not the conversation's last message
+        ChatMembership.record_message(
+            Message.objects.create(
+                sender=self.alice,
+                receiver=self.bob,
+                content="imported",
+                timestamp=timezone.now() - timedelta(days=1),
+            )
+        )
+        expected = set(
+            ChatMembership.objects.values_list(
+                "user", "partner", "last_message", "unread_count"
+            )
+        )
+        call_command("backfill_chat_memberships", "--clear", stdout=StringIO())
+        actual = set(
+            ChatMembership.objects.values_list(
+                "user", "partner", "last_message", "unread_count"
+            )
+        )
+        self.assertEqual(actual, expected)
+        self.assertEqual(Message.objects.count(), 4)
+
+    def test_bulk_send_reports_each_item(self):
+        self.client.force_authenticate(self.alice)
+        items = [
+            {"receiverId": self.bob.id, "content": "one"},
+            {"receiverId": 999999, "content": "nobody"},
+            {"receiverId": self.carol.id},
+            {"receiverId": self.bob.id, "content": "two"},
+        ]
+        response = self.client.post(
+            reverse("bulk_send_messages"), {"messages": items}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["created"], response.data["failed"]), (2, 2))
+        statuses = [item["status"] for item in response.data["results"]]
+        self.assertEqual(statuses, [201, 404, 400, 201])
+        entry = ChatMembership.objects.get(user=self.bob, partner=self.alice)
+        self.assertEqual(entry.unread_count, 2)
+        self.assertEqual(entry.last_message.content, "two")
+
+    def test_import_messages_streams_jsonl(self):
+        lines = [
+            {
+                "senderId": self.alice.id,
+                "receiverId": self.bob.id,
+                "content": "a",
+                "timestamp": "2024-01-01T10:00:00Z",
+                "read": True,
+            },
+            {
+                "senderId": self.bob.id,
+                "receiverId": self.alice.id,
+                "content": "b",
+                "timestamp": "2024-01-01T10:01:00Z",
+            },
+            {"senderId": self.bob.id, "receiverId": 999999, "content": "lost"},
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as source:
+            source.writelines(json.dumps(line) + "\n" for line in lines)
+            source.write("not json\n")
+            source.flush()
+            call_command(
+                "import_messages",
+                source.name,
+                "--batch-size",
+                "2",
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+            with self.assertRaises(CommandError):
+                call_command("import_messages", source.name, "--strict", stdout=StringIO())
+        self.assertEqual(Message.objects.filter(content__in="ab").count(), 2)
+        entry = ChatMembership.objects.get(user=self.alice, partner=self.bob)
+        self.assertEqual(entry.last_message.content, "b")
+        self.assertEqual(entry.unread_count, 1)
+
+
+class ChatMessagesTests(APITestCase):
+    def setUp(self):
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+
+    def test_conversation_key_is_order_independent(self):
+        first = Message.objects.create(sender=self.alice, receiver=self.bob, content="a")
+        second = Message.objects.create(sender=self.bob, receiver=self.alice, content="b")
+        self.assertEqual(first.conversation_key, second.conversation_key)
+        self.assertEqual(
+            first.conversation_key, conversation_key(self.bob.id, self.alice.id)
+        )
+
+    def test_history_returns_both_directions_newest_first(self):
+        Message.objects.create(sender=self.alice, receiver=self.bob, content="a")
+        Message.objects.create(sender=self.bob, receiver=self.alice, content="b")
+        self.client.force_authenticate(self.alice)
+        response = self.client.get(reverse("chat_messages", args=[self.bob.id]))
+        self.assertEqual([m["content"] for m in response.data["messages"]], ["b", "a"])
+        self.assertEqual(response.data["pagination"]["total"], 2)
+
+    def test_cursor_pagination_walks_history_without_count(self):
+        for i in range(5):
+            Message.objects.create(sender=self.alice, receiver=self.bob, content=str(i))
+        self.client.force_authenticate(self.alice)
+        url = reverse("chat_messages", args=[self.bob.id])
+        seen = []
+        cursor = ""
+        while cursor is not None:
+            response = self.client.get(url, {"before": cursor, "limit": 2})
+            self.assertNotIn("total", response.data["pagination"])
+            seen += [m["content"] for m in response.data["messages"]]
+            cursor = response.data["pagination"]["next"]
+        self.assertEqual(seen, ["4", "3", "2", "1", "0"])
+
+        newest = self.client.get(url, {"before": "", "limit": 2, "includeTotal": "true"})
+        self.assertEqual(newest.data["pagination"]["total"], 5)
+        Message.objects.create(sender=self.bob, receiver=self.alice, content="new")
+        response = self.client.get(url, {"after": newest.data["pagination"]["prev"]})
+        self.assertEqual([m["content"] for m in response.data["messages"]], ["new"])
+        self.assertFalse(response.data["pagination"]["hasMoreNewer"])
+
+    def test_export_streams_in_constant_memory(self):
+        # Enough rows that holding them all (as model instances or one big string)
+        # would blow well past the bound; streaming only ever holds one chunk.
+        bench.seed_messages([(self.alice.id, self.bob.id)], 10_000)
+        self.client.force_authenticate(self.alice)
+        url = reverse("chat_export", args=[self.bob.id])
+        for fmt, header_lines in (("jsonl", 0), ("csv", 1)):
+            tracemalloc.start()
+            try:
+                response = self.client.get(url, {"format": fmt})
+                lines = sum(chunk.count(b"\n") for chunk in response.streaming_content)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(lines, 10_000 + header_lines)
+            self.assertLess(peak, 6 * 1024 * 1024)
+
+    def test_export_matches_message_serializer(self):
+        message = Message.objects.create(sender=self.alice, receiver=self.bob, content="a")
+        self.client.force_authenticate(self.bob)
+        response = self.client.get(reverse("chat_export", args=[self.alice.id]))
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(rows, [dict(MessageSerializer(message).data)])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.force_authenticate(self.alice)
+        url = reverse("chat_messages", args=[self.bob.id])
+        response = self.client.get(url, {"before": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        # Well formed, but with a naive timestamp
+        naive = ChatMessagesCursorPagination.encode_cursor(
+            Message(id=1, timestamp=datetime(2000, 1, 1))
+        )
+        for param in ("before", "after"):
+            response = self.client.get(url, {param: naive})
+            self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+        store_message(self.alice, self.bob, "hi")
+        self.client.force_authenticate(self.bob)
+
+    def get(self, name, validator=None, **kwargs):
+        headers = {"If-None-Match": validator} if validator else {}
+        return self.client.get(reverse(name, kwargs=kwargs), headers=headers)
+
+    def assertValidatorChanges(self, name, change, **kwargs):
+        etag = self.get(name, **kwargs)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(name, etag, **kwargs)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(len(queries), 1)  # No messages, no serializers
+        change()
+        response = self.get(name, etag, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        return response
+
+    def test_inbox_changes_on_send_read_and_profile_update(self):
+        response = self.assertValidatorChanges(
+            "recent_chats", lambda: store_message(self.alice, self.bob, "again")
+        )
+        self.assertEqual(response.data["chats"][0]["unreadCount"], 2)
+        response = self.assertValidatorChanges(
+            "recent_chats", lambda: mark_conversation_read(self.bob, self.alice)
+        )
+        self.assertEqual(response.data["chats"][0]["unreadCount"], 0)
+
+        def rename():
+            self.alice.profile.name = "Alice"
+            self.alice.profile.save()
+
+        response = self.assertValidatorChanges("recent_chats", rename)
+        self.assertEqual(response.data["chats"][0]["user"]["profile"]["name"], "Alice")
+
+        # The sender's inbox shows the read receipt on the last message
+        self.client.force_authenticate(self.alice)
+        store_message(self.alice, self.bob, "last")
+        response = self.assertValidatorChanges(
+            "recent_chats", lambda: mark_conversation_read(self.bob, self.alice)
+        )
+        self.assertTrue(response.data["chats"][0]["lastMessage"]["read"])
+
+    def test_history_changes_on_send_and_read_from_either_side(self):
+        for change in (
+            lambda: store_message(self.bob, self.alice, "reply"),
+            lambda: mark_conversation_read(self.bob, self.alice),
+            lambda: mark_conversation_read(self.alice, self.bob),
+        ):
+            self.assertValidatorChanges("chat_messages", change, userId=self.alice.id)
+        first = self.get("chat_messages", userId=self.alice.id)
+        paged = self.client.get(reverse("chat_messages", args=[self.alice.id]), {"limit": 1})
+        self.assertNotEqual(first["ETag"], paged["ETag"])
+        # No inbox rows for a chat with yourself, so no validators
+        self.assertNotIn("ETag", self.get("chat_messages", userId=self.bob.id))
+
+    def test_last_modified_waits_for_its_second_to_pass(self):
+        self.assertNotIn("Last-Modified", self.get("recent_chats"))
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        ChatMembership.objects.update(last_timestamp=an_hour_ago)
+        UserProfile.objects.update(updatedAt=an_hour_ago)
+        last_modified = self.get("recent_chats")["Last-Modified"]
+        headers = {"If-Modified-Since": last_modified}
+        response = self.client.get(reverse("recent_chats"), headers=headers)
+        self.assertEqual(response.status_code, 304)
+        mark_conversation_read(self.bob, self.alice)
+        response = self.client.get(reverse("recent_chats"), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response)
+
+    async def test_async_views_share_the_validators(self):
+        factory = AsyncRequestFactory()
+        auth = {"Authorization": f"Bearer {AccessToken.for_user(self.bob)}"}
+        for view, name, kwargs in (
+            (async_views.RecentChatsView, "recent_chats", {}),
+            (async_views.ChatMessagesView, "chat_messages", {"userId": self.alice.id}),
+        ):
+            etag = (await sync_to_async(self.get)(name, **kwargs))["ETag"]
+            request = factory.get(
+                reverse(name, kwargs=kwargs), headers={**auth, "If-None-Match": etag}
+            )
+            response = await view.as_view()(request, **kwargs)
+            self.assertEqual((response.status_code, response["ETag"]), (304, etag))
+
+
+class RetentionTests(APITestCase):
+    def setUp(self):
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+        key = conversation_key(self.alice.id, self.bob.id)
+        old = timezone.now() - settings.CHAT_RETENTION["ARCHIVE_AFTER"] - timedelta(days=1)
+        recent = timezone.now() - timedelta(hours=1)
+        # m0..m29 old and read, m30 old but unread, m31..m35 recent
+        Message.objects.bulk_create(
+            [
+                Message(
+                    sender=self.bob,
+                    receiver=self.alice,
+                    conversation_key=key,
+                    content=f"m{i}",
+                    timestamp=(old if i <= 30 else recent) + timedelta(minutes=i),
+                    read=i < 30 or i > 30,
+                )
+                for i in range(36)
+            ]
+        )
+        ChatMembership.record_messages(Message.objects.all())
+        self.expected = [f"m{i}" for i in reversed(range(36))]
+
+    def archive(self):
+        out = StringIO()
+        call_command("archive_messages", batch_size=7, pause=0, stdout=out)
+        return out.getvalue()
+
+    def test_old_read_messages_move_in_batches(self):
+        self.assertIn("Archived 30 messages", self.archive())
+        self.assertEqual(ArchivedMessage.objects.count(), 30)
+        self.assertEqual(
+            sorted(Message.objects.values_list("content", flat=True)),
+            sorted(self.expected[:6]),
+        )
+        # Nothing left to move; a second run is a no-op
+        self.assertIn("Archived 0 messages", self.archive())
+        self.assertEqual(ArchivedMessage.objects.count(), 30)
+
+    def test_history_and_export_read_through_to_the_archive(self):
+        self.archive()
+        self.client.force_authenticate(self.alice)
+        url = reverse("chat_messages", args=[self.bob.id])
+
+        contents, cursor = [], ""
+        while cursor is not None:
+            data = self.client.get(url, {"before": cursor, "limit": 10}).data
+            contents += [message["content"] for message in data["messages"]]
+            cursor = data["pagination"]["next"]
+            oldest_page = data
+        self.assertEqual(contents, self.expected)
+        newer = self.client.get(url, {"after": oldest_page["pagination"]["prev"], "limit": 10})
+        self.assertEqual(
+            [message["content"] for message in newer.data["messages"]], self.expected[20:30]
+        )
+
+        data = self.client.get(url, {"page": 4, "limit": 10}).data
+        self.assertEqual(data["pagination"]["total"], 36)
+        self.assertEqual([message["content"] for message in data["messages"]], self.expected[30:])
+
+        response = self.client.get(reverse("chat_export", args=[self.bob.id]))
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["content"] for row in rows], self.expected[::-1])
+
+    def test_search_finds_archived_messages(self):
+        self.archive()
+        self.client.force_authenticate(self.alice)
+
+        def search():
+            response = self.client.get(reverse("message_search"), {"q": "m5"})
+            return [result["message"]["content"] for result in response.data["results"]]
+
+        self.assertEqual(search(), ["m5"])
+        call_command("rebuild_message_search", stdout=StringIO())
+        self.assertEqual(search(), ["m5"])
+        archived = ArchivedMessage.objects.get(content="m5")
+        hits = IContainsBackend().search(self.alice.id, "m5")
+        self.assertEqual(hits.count(), 1)
+        self.assertEqual([hit["id"] for hit in hits[0:10]], [archived.id])
+        archived.delete()
+        self.assertEqual(search(), [])
+
+    def test_page_numbers_merge_old_hot_messages_into_the_archive(self):
+        # m10 stays hot, unread, among archived messages on either side of it
+        Message.objects.filter(content="m10").update(read=False)
+        self.archive()
+        self.assertEqual(Message.objects.count(), 7)
+        self.client.force_authenticate(self.alice)
+        url = reverse("chat_messages", args=[self.bob.id])
+        for limit in (4, 7, 10, 25):
+            contents = []
+            for page in range(1, -(-36 // limit) + 1):
+                data = self.client.get(url, {"page": page, "limit": limit}).data
+                contents += [message["content"] for message in data["messages"]]
+            self.assertEqual(contents, self.expected)
+
+        request = AsyncRequestFactory().get(
+            "/",
+            {"page": 3, "limit": 10},
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.alice)}"},
+        )
+        response = async_to_sync(async_views.ChatMessagesView.as_view())(
+            request, userId=self.bob.id
+        )
+        messages = json.loads(response.content)["messages"]
+        self.assertEqual([message["content"] for message in messages], self.expected[20:30])
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.alice = make_user("alice.test@example.com")
+        for email in ("bob.test@example.com", "carol.test@example.com"):
+            message = Message.objects.create(
+                sender=make_user(email), receiver=self.alice, content="hi"
+            )
+            ChatMembership.record_message(message)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.alice)}"
+        )
+
+    def test_queries_and_latency_are_recorded_per_view(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse("recent_chats"))
+        queries = len(captured)
+        recent = metrics.registry.snapshot()["recent_chats"]
+        self.assertEqual(recent["queries"][2], queries)
+        self.assertEqual(recent["latency"][1][-1], 1)
+        self.assertEqual(recent["statuses"], {200: 1})
+        self.assertGreater(recent["render_time"], 0)
+
+        # Without METRICS_TOKEN, staff only
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+        User.objects.filter(id=self.alice.id).update(is_staff=True)
+        invalidate(self.alice.id)
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('http_request_duration_seconds_count{view="recent_chats"} 1', text)
+        self.assertIn(f'http_request_db_queries_sum{{view="recent_chats"}} {queries}', text)
+
+    async def test_views_that_encode_their_own_response_record_render_time(self):
+        await self.async_client.get(
+            reverse("chat_updates"),
+            {"timeout": 0},
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.alice)}"},
+        )
+        self.assertGreater(metrics.registry.snapshot()["chat_updates"]["render_time"], 0)
+
+    def test_requests_over_budget_are_logged(self):
+        config = {**settings.REQUEST_METRICS, "QUERY_BUDGET": 1, "TOKEN": "secret"}
+        with self.settings(REQUEST_METRICS=config):
+            with self.assertLogs("core.metrics", "WARNING") as logs:
+                self.client.get(reverse("recent_chats"))
+            self.assertIn("(recent_chats)", logs.output[0])
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+            self.client.credentials(HTTP_AUTHORIZATION="Bearer secret")
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class QueryCountTests(APITestCase):
+    """
+    Every route in users/urls.py and chats/urls.py runs the same number of queries
+    however much data there is: each request is measured once, then again after more
+    partners and messages were added, and the two counts must match.
+    """
+
+    # (new partners, new messages with bob) added before each measurement
+    GROWTH = [(3, 60), (12, 240)]
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.alice = make_user("alice.test@example.com", password="secret")
+        User.objects.filter(id=self.alice.id).update(is_staff=True)
+        self.bob = make_user("bob.test@example.com")
+        self.carol = make_user("carol.test@example.com")
+        # A first message creates inbox rows; every measured send is a later one
+        ChatMembership.record_message(
+            Message.objects.create(sender=self.alice, receiver=self.carol, content="hi")
+        )
+        self.partners = 0
+        self.registered = 0
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.alice)}"
+        )
+
+    def grow(self, partners, messages):
+        new = [
+            make_user(f"partner{self.partners + i}.test@example.com")
+            for i in range(partners)
+        ]
+        self.partners += partners
+        pairs = [(partner, self.alice) for partner in new for _ in range(2)]
+        pairs += [(self.bob, self.alice), (self.alice, self.bob)] * (messages // 2)
+        created = Message.objects.bulk_create(
+            [
+                Message(
+                    sender=sender,
+                    receiver=receiver,
+                    conversation_key=conversation_key(sender.id, receiver.id),
+                    content=f"hello {i}",
+                )
+                for i, (sender, receiver) in enumerate(pairs)
+            ]
+        )
+        ChatMembership.record_messages(created)
+
+    def register(self):
+        self.registered += 1
+        return self.client.post(
+            reverse("register"),
+            {
+                "name": "New",
+                "email": f"new{self.registered}.test@example.com",
+                "password": "secret",
+                "gender": "other",
+                "dob": "2000-01-01",
+            },
+        )
+
+    def search_users(self):
+        # Measure the search itself, not the result cache
+        user_search.get_result_cache().clear()
+        return self.client.get(reverse("user_search"), {"q": "partner", "limit": 5})
+
+    def logout(self):
+        # With tokens of its own: the client's token must keep working
+        refresh = RefreshToken.for_user(self.alice)
+        client = APIClient(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        return client.post(reverse("logout"), {"refresh": str(refresh)})
+
+    def revoke_sessions(self):
+        # Carol's sessions, as a token from login would carry her current version
+        carol = User.objects.select_related("profile").get(id=self.carol.id)
+        token = EmailTokenObtainPairSerializer.get_token(carol).access_token
+        return APIClient(HTTP_AUTHORIZATION=f"Bearer {token}").post(
+            reverse("revoke_sessions")
+        )
+
+    def routes(self):
+        """Route name -> a request to it, repeatable any number of times."""
+        refresh = str(RefreshToken.for_user(self.alice))
+        chat = {"userId": self.bob.id}
+        return {
+            # users/urls.py
+            "current_user": lambda: self.client.get(reverse("current_user")),
+            "current_user PUT": lambda: self.client.put(
+                reverse("current_user"), {"profile": {"name": "Alice"}}, format="json"
+            ),
+            "upload_avatar": lambda: self.client.post(
+                reverse("upload_avatar"),
+                {"avatar": SimpleUploadedFile("me.png", png_bytes())},
+                format="multipart",
+            ),
+            "register": self.register,
+            "login": lambda: self.client.post(
+                reverse("login"), {"email": self.alice.email, "password": "secret"}
+            ),
+            "token_refresh": lambda: self.client.post(
+                reverse("token_refresh"), {"refresh": refresh}
+            ),
+            "user_by_email": lambda: self.client.get(
+                reverse("user_by_email", args=[self.bob.email])
+            ),
+            "user_cache_stats": lambda: self.client.get(reverse("user_cache_stats")),
+            "user_search": self.search_users,
+            "logout": self.logout,
+            "revoke_sessions": self.revoke_sessions,
+            # chats/urls.py
+            "recent_chats": lambda: self.client.get(reverse("recent_chats")),
+            "send_message": lambda: self.client.post(
+                reverse("send_message"), {"receiverId": self.bob.id, "content": "hi"}
+            ),
+            "upload_attachment": lambda: self.client.post(
+                reverse("upload_attachment"),
+                {"file": SimpleUploadedFile("a.pdf", b"%PDF-1.4\n%%EOF\n")},
+                format="multipart",
+            ),
+            "bulk_send_messages": lambda: self.client.post(
+                reverse("bulk_send_messages"),
+                {
+                    "messages": [
+                        {"receiverId": self.bob.id, "content": "hi"},
+                        {"receiverId": self.carol.id, "content": "hi"},
+                    ]
+                },
+                format="json",
+            ),
+            "chat_messages": lambda: self.client.get(reverse("chat_messages", kwargs=chat)),
+            "chat_messages cursor": lambda: self.client.get(
+                reverse("chat_messages", kwargs=chat), {"before": ""}
+            ),
+            "chat_export": lambda: self.client.get(reverse("chat_export", kwargs=chat)),
+            "mark_messages_as_read": lambda: self.client.post(
+                reverse("mark_messages_as_read", kwargs=chat)
+            ),
+            "message_search": lambda: self.client.get(
+                reverse("message_search"), {"q": "hello"}
+            ),
+            "unread_counts": lambda: self.client.get(reverse("unread_counts")),
+            "chat_updates": lambda: self.client.get(
+                reverse("chat_updates"), {"since": 0, "timeout": 0}
+            ),
+        }
+
+    def measure(self, request):
+        # Every measurement starts from the same (cold) user cache, and with no poll
+        # of the revocation list due
+        invalidate(self.alice.id)
+        invalidate(self.carol.id)
+        get_revocation_list().sync()
+        with CaptureQueriesContext(connection) as captured:
+            response = request()
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400, getattr(response, "data", None))
+        return [query["sql"] for query in captured.captured_queries]
+
+    def test_every_route_is_covered(self):
+        names = {
+            pattern.name
+            for pattern in users_urls.urlpatterns + chats_urls.urlpatterns
+        }
+        covered = {name.split()[0] for name in self.routes()}
+        self.assertEqual(names - covered, set())
+
+    def test_query_counts_do_not_grow_with_data(self):
+        for name, request in self.routes().items():
+            with self.subTest(route=name):
+                runs = []
+                for partners, messages in self.GROWTH:
+                    self.grow(partners, messages)
+                    runs.append(self.measure(request))
+                small, large = runs
+                if len(small) != len(large):
+                    self.fail(
+                        f"{name} ran {len(small)} queries, then {len(large)} with more "
+                        "data.\n\nWith less data:\n"
+                        + "\n".join(small)
+                        + "\n\nWith more data:\n"
+                        + "\n".join(large)
+                    )
+
+
+class FastSerializerTests(APITestCase):
+    def test_fast_encoders_match_drf_serializers(self):
+        alice = make_user("alice.test@example.com")
+        bob = make_user("bob.test@example.com")
+        UserProfile.objects.filter(user=bob).update(
+            avatarUrl="/media/avatars/avatar_2.png", avatarColor="#ff0000"
+        )
+        message = Message.objects.create(sender=alice, receiver=bob, content="hi")
+        ChatMembership.record_message(message)
+        request = APIRequestFactory().get("/")
+        membership = ChatMembership.objects.select_related(
+            "partner__profile", "last_message"
+        ).get(user=alice)
+        expected = RecentChatSerializer(
+            {
+                "user": membership.partner,
+                "lastMessage": membership.last_message,
+                "unreadCount": membership.unread_count,
+            },
+            context={"request": request},
+        ).data
+        actual = recent_chat_data(membership, request)
+        self.assertEqual(json.dumps(actual), json.dumps(expected))
+        self.assertEqual(
+            actual["user"]["profile"]["avatarUrl"],
+            "http://testserver/media/avatars/avatar_2.png",
+        )
+
+        # Values that never went through the database (a str dob) match as well
+        self.assertEqual(user_data(alice), UserSerializer(alice).data)
+        self.assertEqual(message_data(message), MessageSerializer(message).data)
+
+
+class WireFormatTests(APITestCase):
+    def setUp(self):
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+        self.client.force_authenticate(self.alice)
+        for i in range(30):
+            store_message(self.alice, self.bob, f"Message number {i} \u2028 café")
+        self.url = reverse("chat_messages", kwargs={"userId": self.bob.id})
+
+    def test_orjson_renderer_matches_drf(self):
+        payload = {
+            "messages": self.client.get(self.url).json()["messages"],
+            "at": timezone.now(),
+            "amount": Decimal("1.50"),
+            "ids": (1, 2),
+            1: "int keys",
+        }
+        self.assertEqual(
+            renderers.ORJSONRenderer().render(payload), JSONRenderer().render(payload)
+        )
+        response = self.client.post(
+            reverse("send_message"), "{", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @unittest.skipIf(renderers.msgpack is None, "MessagePack needs msgpack")
+    def test_msgpack_through_accept(self):
+        expected = self.client.get(self.url).json()
+        response = self.client.get(self.url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(renderers.msgpack.unpackb(response.content), expected)
+        response = self.client.get(self.url, {"format": "msgpack"})
+        self.assertEqual(renderers.msgpack.unpackb(response.content), expected)
+
+        request = AsyncRequestFactory().get(
+            "/",
+            headers={
+                "Authorization": f"Bearer {AccessToken.for_user(self.alice)}",
+                "Accept": "application/msgpack",
+            },
+        )
+        response = async_to_sync(async_views.ChatMessagesView.as_view())(
+            request, userId=self.bob.id
+        )
+        self.assertEqual(renderers.msgpack.unpackb(response.content), expected)
+
+    def test_compression(self):
+        plain = self.client.get(self.url).content
+        self.assertGreater(len(plain), settings.RESPONSE_COMPRESSION["MIN_SIZE"])
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.content), plain)
+        self.assertLess(len(response.content), len(plain) / 3)
+        self.assertTrue(response["ETag"].startswith('W/"'))
+        if compression.brotli is not None:
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br")
+            self.assertEqual(response["Content-Encoding"], "br")
+            self.assertEqual(compression.brotli.decompress(response.content), plain)
+        for accept_encoding in ["identity", "br;q=0, gzip;q=0", ""]:
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertFalse(response.has_header("Content-Encoding"))
+            self.assertEqual(response.content, plain)
+        # Small bodies go out as they are
+        response = self.client.get(reverse("unread_counts"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_choose_encoding(self):
+        cases = [
+            ("gzip, deflate, br", "br"),
+            ("br;q=0, gzip", "gzip"),
+            ("GZIP;q=0.5", "gzip"),
+            ("*", "br"),
+            ("*, br;q=0", "gzip"),
+            ("deflate", None),
+        ]
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(
+                    compression.choose_encoding(header, ["br", "gzip"]), expected
+                )
+
+
+class MessageSearchTests(APITestCase):
+    def setUp(self):
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+        self.carol = make_user("carol.test@example.com")
+        Message.objects.bulk_create(
+            [
+                Message(
+                    sender=sender,
+                    receiver=receiver,
+                    conversation_key=conversation_key(sender.id, receiver.id),
+                    content=content,
+                )
+                for sender, receiver, content in [
+                    (self.alice, self.bob, "Lunch at the Café tomorrow?"),
+                    (self.bob, self.alice, "lunch lunch lunch, always lunch"),
+                    (self.bob, self.alice, "See you at noon"),
+                    (self.bob, self.carol, "lunch without alice"),
+                ]
+            ]
+        )
+
+    def search(self, user, q, **params):
+        self.client.force_authenticate(user)
+        return self.client.get(reverse("message_search"), {"q": q, **params})
+
+    def test_search_is_ranked_and_scoped_to_own_conversations(self):
+        response = self.search(self.alice, "LUNCH")
+        self.assertEqual(response.data["pagination"]["total"], 2)
+        results = response.data["results"]
+        self.assertEqual(results[0]["message"]["content"], "lunch lunch lunch, always lunch")
+        self.assertEqual({r["userId"] for r in results}, {self.bob.id})
+        self.assertIn("<mark>Lunch</mark>", results[1]["snippet"])
+
+        # Diacritics are folded; a trailing * makes the last term a prefix
+        self.assertEqual(self.search(self.alice, "cafe tomor").data["results"], [])
+        response = self.search(self.alice, "cafe tomor*")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(self.search(self.alice, '"*').status_code, 400)
+
+    def test_rebuild_indexes_existing_messages(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM chats_message_fts")
+        self.assertEqual(self.search(self.alice, "noon").data["results"], [])
+        call_command("rebuild_message_search", stdout=StringIO())
+        self.assertEqual(len(self.search(self.alice, "noon").data["results"]), 1)
+
+    def test_hits_for_messages_gone_since_are_skipped(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO chats_message_fts(rowid, content, participants) "
+                "VALUES (999999, 'lunch', %s)",
+                [f"u{self.alice.id} u{self.bob.id}"],
+            )
+        response = self.search(self.alice, "lunch")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_icontains_fallback_finds_the_same_messages(self):
+        fts = get_search_backend().search(self.bob.id, "lunch")
+        scan = IContainsBackend().search(self.bob.id, "lunch")
+        self.assertEqual(fts.count(), scan.count())
+        self.assertEqual({h["id"] for h in fts[0:10]}, {h["id"] for h in scan[0:10]})
+
+
+class MessageSearchMigrationTests(APITransactionTestCase):
+    def tearDown(self):
+        call_command("migrate", verbosity=0)
+        super().tearDown()
+
+    def test_index_survives_migrating_back_through_attachments(self):
+        # Unapplying 0008 makes SQLite rebuild chats_message
+        call_command("migrate", "chats", "0007", verbosity=0)
+        call_command("migrate", verbosity=0)
+        alice = make_user("alice.test@example.com")
+        bob = make_user("bob.test@example.com")
+        store_message(alice, bob, "Lunch at noon?")
+        self.client.force_authenticate(alice)
+        response = self.client.get(reverse("message_search"), {"q": "noon"})
+        self.assertEqual(len(response.data["results"]), 1)
+
+
+class WebSocketTests(APITestCase):
+    def setUp(self):
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+
+    def connect(self, token, path="/ws/chats/"):
+        scope = {
+            "type": "websocket",
+            "path": path,
+            "query_string": f"token={token}".encode(),
+            "headers": [],
+        }
+        return ApplicationCommunicator(websocket_application, scope)
+
+    def send_message(self):
+        self.client.force_authenticate(self.alice)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("send_message"), {"receiverId": self.bob.id, "content": "hey"}
+            )
+
+    async def test_rejects_invalid_token(self):
+        communicator = self.connect("garbage")
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual(
+            await communicator.receive_output(), {"type": "websocket.close", "code": 4401}
+        )
+
+    async def test_pushes_new_messages_and_typing(self):
+        communicator = self.connect(AccessToken.for_user(self.bob))
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual(
+            await communicator.receive_output(), {"type": "websocket.accept"}
+        )
+
+        await sync_to_async(self.send_message)()
+        event = json.loads((await communicator.receive_output())["text"])
+        self.assertEqual(event["type"], "message.new")
+        self.assertEqual(event["message"]["content"], "hey")
+
+        alice = self.connect(AccessToken.for_user(self.alice))
+        await alice.send_input({"type": "websocket.connect"})
+        await alice.receive_output()
+        await communicator.send_input(
+            {"type": "websocket.receive", "text": json.dumps({"type": "typing", "receiverId": self.alice.id})}
+        )
+        event = json.loads((await alice.receive_output())["text"])
+        self.assertEqual(event, {"type": "typing", "userId": self.bob.id, "isTyping": True})
+
+        for connection in (communicator, alice):
+            await connection.send_input({"type": "websocket.disconnect", "code": 1000})
+            await connection.wait()
+
+
+    async def test_typing_is_only_relayed_to_conversation_partners(self):
+        carol = await sync_to_async(make_user)("carol.test@example.com")
+        alice = self.connect(AccessToken.for_user(self.alice))
+        await alice.send_input({"type": "websocket.connect"})
+        await alice.receive_output()
+        stranger = self.connect(AccessToken.for_user(carol))
+        await stranger.send_input({"type": "websocket.connect"})
+        await stranger.receive_output()
+        await stranger.send_input(
+            {
+                "type": "websocket.receive",
+                "text": json.dumps({"type": "typing", "receiverId": self.alice.id}),
+            }
+        )
+        self.assertTrue(await alice.receive_nothing())
+
+        for connection in (stranger, alice):
+            await connection.send_input({"type": "websocket.disconnect", "code": 1000})
+            await connection.wait()
+
+
+class ChatUpdatesTests(APITestCase):
+    def setUp(self):
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.bob)}"}
+
+    def send_message(self):
+        self.client.force_authenticate(self.alice)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("send_message"), {"receiverId": self.bob.id, "content": "hey"}
+            ).data
+
+    async def test_returns_immediately_when_newer_messages_exist(self):
+        await sync_to_async(self.send_message)()
+        response = await self.async_client.get(
+            reverse("chat_updates"), {"since": 0, "timeout": 5}, headers=self.headers
+        )
+        data = response.json()
+        self.assertEqual([m["content"] for m in data["messages"]], ["hey"])
+        self.assertEqual(data["since"], data["messages"][0]["id"])
+
+    async def test_times_out_without_updates(self):
+        response = await self.async_client.get(
+            reverse("chat_updates"), {"timeout": 0.1}, headers=self.headers
+        )
+        self.assertEqual(response.json()["messages"], [])
+
+    async def test_wakes_up_on_new_message(self):
+        waiter = asyncio.ensure_future(
+            self.async_client.get(
+                reverse("chat_updates"), {"since": 0, "timeout": 5}, headers=self.headers
+            )
+        )
+        await asyncio.sleep(0.2)
+        self.assertFalse(waiter.done())
+        await sync_to_async(self.send_message)()
+        response = await asyncio.wait_for(waiter, 2)
+        self.assertEqual(len(response.json()["messages"]), 1)
+
+    async def test_reports_read_receipts(self):
+        message = await sync_to_async(self.send_message)()
+        response = await self.async_client.get(
+            reverse("chat_updates"),
+            {"since": message["id"], "timeout": 0},
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.alice)}"},
+        )
+        read_since = response.json()["readSince"]
+
+        def mark_read():
+            self.client.force_authenticate(self.bob)
+            self.client.post(reverse("mark_messages_as_read", args=[self.alice.id]))
+
+        await sync_to_async(mark_read)()
+        response = await self.async_client.get(
+            reverse("chat_updates"),
+            {"since": message["id"], "readSince": read_since, "timeout": 0},
+            headers={"Authorization": f"Bearer {AccessToken.for_user(self.alice)}"},
+        )
+        self.assertEqual([r["userId"] for r in response.json()["reads"]], [self.bob.id])
+
+    async def test_requires_token(self):
+        response = await self.async_client.get(reverse("chat_updates"))
+        self.assertEqual(response.status_code, 401)
+
+
+class AsyncViewsTests(APITestCase):
+    """The async views must answer exactly like the DRF views they stand in for."""
+
+    def setUp(self):
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+        self.client.force_authenticate(self.alice)
+        factory = AsyncRequestFactory()
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.alice)}"}
+        self.get = lambda params=None: factory.get("/", params, headers=headers)
+        self.post = lambda data=None: factory.post(
+            "/", data, content_type="application/json", headers=headers
+        )
+
+    def sync_get(self, name, params=None, **kwargs):
+        return self.client.get(reverse(name, kwargs=kwargs), params).json()
+
+    async def call(self, view, request, **kwargs):
+        response = await view.as_view()(request, **kwargs)
+        return response.status_code, json.loads(response.content)
+
+    async def test_send_then_read_history_like_the_sync_views(self):
+        for i in range(3):
+            status, data = await self.call(
+                async_views.SendMessageView,
+                self.post({"receiverId": self.bob.id, "content": f"m{i}"}),
+            )
+            self.assertEqual(status, 201)
+        self.assertEqual(data["content"], "m2")
+        membership = await ChatMembership.objects.aget(user=self.bob, partner=self.alice)
+        self.assertEqual(membership.unread_count, 3)
+
+        for params in ({"limit": 2, "page": 2}, {"before": "", "limit": 2}):
+            status, data = await self.call(
+                async_views.ChatMessagesView, self.get(params), userId=self.bob.id
+            )
+            expected = await sync_to_async(self.sync_get)(
+                "chat_messages", params, userId=self.bob.id
+            )
+            self.assertEqual(data, expected)
+
+        status, data = await self.call(async_views.RecentChatsView, self.get())
+        self.assertEqual(data, await sync_to_async(self.sync_get)("recent_chats"))
+
+    async def test_mark_read(self):
+        await Message.objects.acreate(
+            sender=self.bob,
+            receiver=self.alice,
+            content="hi",
+            conversation_key=conversation_key(self.bob.id, self.alice.id),
+        )
+        status, data = await self.call(
+            async_views.MarkMessagesAsReadView, self.post(), userId=self.bob.id
+        )
+        self.assertEqual(data["updated"], 1)
+        self.assertFalse(await Message.objects.filter(read=False).aexists())
+
+    async def test_errors(self):
+        status, data = await self.call(
+            async_views.ChatMessagesView, self.get({"page": 5}), userId=self.bob.id
+        )
+        expected = await sync_to_async(self.client.get)(
+            reverse("chat_messages", kwargs={"userId": self.bob.id}), {"page": 5}
+        )
+        self.assertEqual((status, data), (404, expected.json()))
+        cases = [
+            (self.get(), 0, 404),
+            (self.get({"before": "nonsense"}), self.bob.id, 400),
+            (AsyncRequestFactory().get("/"), self.bob.id, 401),
+        ]
+        for request, user_id, expected in cases:
+            status, data = await self.call(
+                async_views.ChatMessagesView, request, userId=user_id
+            )
+            self.assertEqual((status, data["code"]), (expected, expected))
+        status, _ = await self.call(async_views.SendMessageView, self.post("{"))
+        self.assertEqual(status, 400)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(APITransactionTestCase):
+    """Primary and replica are separate SQLite databases that never replicate."""
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+        # Copy only the accounts, so a read's result shows which database served it
+        for user in (self.alice, self.bob):
+            user.save(using="replica")
+            user.profile.save(using="replica")
+            invalidate(user.id)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.alice)}"
+        )
+
+    def history(self):
+        response = self.client.get(
+            reverse("chat_messages", kwargs={"userId": self.bob.id})
+        )
+        return [message["content"] for message in response.data["messages"]]
+
+    def test_reads_stick_to_primary_after_the_user_writes(self):
+        Message.objects.create(
+            sender=self.bob,
+            receiver=self.alice,
+            content="old",
+            conversation_key=conversation_key(self.bob.id, self.alice.id),
+        )
+        self.assertEqual(self.history(), [])
+
+        self.client.post(
+            reverse("send_message"), {"receiverId": self.bob.id, "content": "hi"}
+        )
+        self.assertFalse(Message.objects.using("replica").exists())
+        self.assertEqual(self.history(), ["hi", "old"])
+
+        cache.clear()  # The stickiness window has passed
+        self.assertEqual(self.history(), [])
+
+    def test_transactions_and_writers_read_from_primary(self):
+        def read_alias():
+            return User.objects.all().db
+
+        def read_after_write():
+            User.objects.filter(id=self.alice.id).update(first_name="A")
+            return read_alias()
+
+        # A fresh context stands in for a new request
+        self.assertEqual(contextvars.Context().run(read_alias), "replica")
+        self.assertEqual(contextvars.Context().run(read_after_write), "default")
+        with transaction.atomic():
+            self.assertEqual(contextvars.Context().run(read_alias), "default")
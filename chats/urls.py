@@ -1,10 +1,23 @@
+from django.conf import settings
 from django.urls import path
 
-from chats.views import ChatMessagesView, RecentChatsView, SendMessageView, MarkMessagesAsReadView
+from chats import async_views, views
+from chats.views import (AttachmentUploadView, BulkSendMessagesView,
+                         ChatExportView, ChatUpdatesView, MessageSearchView,
+                         UnreadCountsView)
+
+# The hot endpoints have async twins with the same names and responses
+api = async_views if settings.ASYNC_API_VIEWS else views
 
 urlpatterns = [
-    path("", RecentChatsView.as_view(), name="recent_chats"),
-    path("messages/", SendMessageView.as_view(), name="send_message"),
-    path("messages/<int:userId>/", ChatMessagesView.as_view(), name="chat_messages"),
-    path("messages/<int:userId>/read", MarkMessagesAsReadView.as_view(), name="mark_messages_as_read"),
+    path("", api.RecentChatsView.as_view(), name="recent_chats"),
+    path("messages/", api.SendMessageView.as_view(), name="send_message"),
+    path("attachments", AttachmentUploadView.as_view(), name="upload_attachment"),
+    path("messages/bulk", BulkSendMessagesView.as_view(), name="bulk_send_messages"),
+    path("messages/<int:userId>/", api.ChatMessagesView.as_view(), name="chat_messages"),
+    path("messages/<int:userId>/export", ChatExportView.as_view(), name="chat_export"),
+    path("messages/<int:userId>/read", api.MarkMessagesAsReadView.as_view(), name="mark_messages_as_read"),
+    path("search", MessageSearchView.as_view(), name="message_search"),
+    path("unread", UnreadCountsView.as_view(), name="unread_counts"),
+    path("updates", ChatUpdatesView.as_view(), name="chat_updates"),
 ]
@@ -1,35 +1,112 @@
-import threading
-import time
+import asyncio
+import base64
+import binascii
+import heapq
+import logging
+import os
+from datetime import datetime
+from datetime import timezone as dt_timezone
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views import View
+from rest_framework import serializers
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from chats.models import Message
-from chats.serializers import (MessageSerializer, NewMessageRequestSerializer,
-                               RecentChatSerializer)
+from chats import conditional, export
+from chats.jobs import BOT_REPLY
+from chats.models import (ArchivedMessage, Attachment, ChatMembership, Message,
+                          conversation_key)
+from chats.realtime import (MESSAGE_NEW, MESSAGE_READ, get_channel_layer,
+                            publish_to_users, user_group)
+from chats.renderers import CSVRenderer, JSONLinesRenderer
+from chats.retention import MessageHistory, archive_cutoff
+from chats.search import get_search_backend, query_terms
+from chats.serializers import (AttachmentSerializer,
+                               BulkMessagesRequestSerializer, MessageSerializer,
+                               NewMessageRequestSerializer, message_data,
+                               recent_chat_data)
+from chats.services import store_message
+from core import metrics, routers
+from jobs.queue import QueueFull, enqueue
+from uploads.pipeline import (UploadRejected, get_purpose, receive_file,
+                              store_by_hash)
+from users.authentication import aauthenticate
 from users.management.commands.create_bot_users import BOT_EMAILS
 
+logger = logging.getLogger(__name__)
+
 
 def _handle_bot_replies(request, receiver, content):
-    # Auto-reply bot logic (testing only)
+    # Auto-reply bot logic (testing only); the reply is sent by a background job
     if receiver.email in BOT_EMAILS:
+        try:
+            enqueue(
+                BOT_REPLY,
+                {"botId": receiver.id, "userId": request.user.id, "content": content},
+                delay=0.5,  # Simulate thinking delay
+            )
+        except QueueFull:
+            logger.warning("Job queue is full, dropping bot reply to %s", request.user)
 
-        def bot_reply():
-            time.sleep(0.5)  # Simulate thinking delay
-            reply_content = f"Auto-reply from {receiver.first_name or receiver.username}: I received your message: '{content}'"
-            Message.objects.create(
-                sender=receiver, 
-                receiver=request.user,
-                content=reply_content
+
+def mark_conversation_read(user, sender):
+    """Mark everything ``sender`` sent to ``user`` as read; returns how many changed."""
+    with transaction.atomic():
+        updated = Message.objects.filter(sender=sender, receiver=user, read=False).update(read=True)
+        read_at = ChatMembership.mark_read(user, sender, updated)
+        if updated:
+            publish_to_users(
+                [sender.id, user.id],
+                {
+                    "type": MESSAGE_READ,
+                    "readerId": user.id,
+                    "senderId": sender.id,
+                    "updated": updated,
+                    "readAt": serializers.DateTimeField().to_representation(read_at),
+                },
             )
+    routers.remember_write(user.id)
+    return updated
+
+
+def finish_attachment_upload(request, path, kind, filename):
+    """Upload finisher for the "attachment" purpose: store the file for a message."""
+    size = os.path.getsize(path)
+    digest = store_by_hash(path, "attachments", kind)
+    attachment = Attachment.objects.create(
+        uploader=request.user, sha256=digest, kind=kind, name=filename, size=size
+    )
+    return AttachmentSerializer(attachment).data, 201
+
+
+class AttachmentUploadView(APIView):
+    """
+    Upload a file to attach to a message, in one multipart request (field ``file``)
+    checked while it streams in. Larger files go through a resumable upload with
+    purpose "attachment". Either way the result's ``id`` is sent as ``attachmentId``.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            upload = receive_file(request, get_purpose("attachment"), "file")
+        except UploadRejected as exc:
+            return Response({"code": exc.status, "message": exc.message}, status=exc.status)
+        data, status_code = finish_attachment_upload(
+            request, upload.temporary_file_path(), upload.kind, upload.name
+        )
+        return Response(data, status=status_code)
 
-        threading.Thread(target=bot_reply, daemon=True).start()
 
 class SendMessageView(APIView):
     permission_classes = [IsAuthenticated]
@@ -45,10 +122,18 @@ class SendMessageView(APIView):
                 return Response(
                     {"code": 404, "message": "Receiver not found"}, status=404
                 )
-            message = Message.objects.create(
-                sender=request.user, receiver=receiver, content=content
-            )
-
+            attachment = None
+            if "attachmentId" in serializer.validated_data:
+                try:
+                    # Only the uploader can attach a file
+                    attachment = Attachment.objects.get(
+                        id=serializer.validated_data["attachmentId"], uploader=request.user
+                    )
+                except Attachment.DoesNotExist:
+                    return Response(
+                        {"code": 404, "message": "Attachment not found"}, status=404
+                    )
+            message = store_message(request.user, receiver, content, attachment)
             _handle_bot_replies(request, receiver, content)
 
             return Response(MessageSerializer(message).data, status=201)
@@ -58,95 +143,434 @@ class SendMessageView(APIView):
         )
 
 
+class BulkSendMessagesView(APIView):
+    """
+    Send many messages in one request (imports, broadcasts). Receivers are
+    resolved with one ``id__in`` lookup and messages are inserted with
+    ``bulk_create``; every item gets its own result, so bad items don't sink the
+    rest of the batch.
+    """
+
+    permission_classes = [IsAuthenticated]
+    batch_size = 500
+
+    def post(self, request):
+        serializer = BulkMessagesRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"code": 400, "message": "Invalid input", "details": serializer.errors},
+                status=400,
+            )
+        items = serializer.validated_data["messages"]
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            item_serializer = NewMessageRequestSerializer(data=item)
+            if item_serializer.is_valid():
+                valid.append((index, item_serializer.validated_data))
+            else:
+                results[index] = {
+                    "index": index,
+                    "status": 400,
+                    "message": "Invalid input",
+                    "details": item_serializer.errors,
+                }
+
+        receivers = User.objects.in_bulk({data["receiverId"] for _, data in valid})
+        attachments = Attachment.objects.filter(uploader=request.user).in_bulk(
+            {data["attachmentId"] for _, data in valid if "attachmentId" in data}
+        )
+        pending = []
+        for index, data in valid:
+            receiver = receivers.get(data["receiverId"])
+            attachment = attachments.get(data.get("attachmentId"))
+            if receiver is None or ("attachmentId" in data and attachment is None):
+                results[index] = {
+                    "index": index,
+                    "status": 404,
+                    "message": (
+                        "Receiver not found" if receiver is None else "Attachment not found"
+                    ),
+                }
+                continue
+            pending.append(
+                (
+                    index,
+                    Message(
+                        sender=request.user,
+                        receiver=receiver,
+                        conversation_key=conversation_key(request.user.id, receiver.id),
+                        content=data["content"],
+                        attachment=attachment,
+                    ),
+                )
+            )
+
+        with transaction.atomic():
+            created = Message.objects.bulk_create(
+                [message for _, message in pending], batch_size=self.batch_size
+            )
+            ChatMembership.record_messages(created)
+            data = MessageSerializer(created, many=True).data
+            for message, message_data in zip(created, data):
+                publish_to_users(
+                    [message.sender_id, message.receiver_id],
+                    {"type": MESSAGE_NEW, "message": message_data},
+                )
+        routers.remember_write(request.user.id)
+        for (index, message), message_data in zip(pending, data):
+            results[index] = {"index": index, "status": 201, "message": message_data}
+            _handle_bot_replies(request, message.receiver, message.content)
+
+        return Response(
+            {
+                "created": len(pending),
+                "failed": len(items) - len(pending),
+                "results": results,
+            }
+        )
+
+
 class ChatMessagesPagination(PageNumberPagination):
     page_size = 50
     page_size_query_param = "limit"
     max_page_size = 100
 
 
+class ChatMessagesCursorPagination:
+    """
+    Keyset pagination over ``(timestamp, id)``, opted into with ``?before=<cursor>``
+    (older messages; pass it empty to start from the newest) or ``?after=<cursor>``
+    (newer messages). Unlike page numbers it never counts the conversation unless
+    the client asks for ``includeTotal=true``, and its cost does not depend on how
+    far back the client has scrolled. Archived messages (``chats.retention``) are
+    only read once a page reaches back past the archive cutoff.
+    """
+
+    page_size = ChatMessagesPagination.page_size
+    max_page_size = ChatMessagesPagination.max_page_size
+
+    class InvalidCursor(ValueError):
+        pass
+
+    @staticmethod
+    def is_requested(request):
+        return "before" in request.query_params or "after" in request.query_params
+
+    @staticmethod
+    def encode_cursor(message):
+        raw = f"{message.timestamp.isoformat()}|{message.id}".encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            timestamp, message_id = raw.split("|")
+            timestamp, message_id = datetime.fromisoformat(timestamp), int(message_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+            raise cls.InvalidCursor(cursor) from exc
+        if timestamp.tzinfo is None:  # Not one of ours; can't compare to aware times
+            raise cls.InvalidCursor(cursor)
+        return timestamp, message_id
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get("limit", self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(limit, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, archived=None):
+        """
+        Return ``(page, pagination)`` with the page ordered newest first. ``archived``
+        is the same conversation's ``ArchivedMessage`` queryset.
+        """
+        rows_query, include_total = self._rows_query(queryset, request)
+        rows = list(rows_query)
+        if archived is not None and self._reaches_archive(request, rows):
+            archived_query, _ = self._rows_query(archived, request)
+            rows = self._merge(request, rows, list(archived_query))
+        total = None
+        if include_total:
+            total = queryset.count() + (archived.count() if archived is not None else 0)
+        return self._page(request, rows, total)
+
+    async def apaginate_queryset(self, queryset, request, archived=None):
+        """``paginate_queryset`` for async views."""
+        rows_query, include_total = self._rows_query(queryset, request)
+        rows = [row async for row in rows_query]
+        if archived is not None and self._reaches_archive(request, rows):
+            archived_query, _ = self._rows_query(archived, request)
+            rows = self._merge(request, rows, [row async for row in archived_query])
+        total = None
+        if include_total:
+            total = await queryset.acount()
+            if archived is not None:
+                total += await archived.acount()
+        return self._page(request, rows, total)
+
+    def _reaches_archive(self, request, rows):
+        # Everything archived is older than the cutoff
+        cutoff = archive_cutoff()
+        after = request.query_params.get("after")
+        if after:
+            return self.decode_cursor(after)[0] < cutoff
+        return len(rows) <= self.get_limit(request) or rows[-1].timestamp < cutoff
+
+    def _merge(self, request, rows, archived_rows):
+        newest_first = not request.query_params.get("after")
+        merged = heapq.merge(
+            rows,
+            archived_rows,
+            key=lambda row: (row.timestamp, row.id),
+            reverse=newest_first,
+        )
+        return list(merged)[: self.get_limit(request) + 1]
+
+    def _rows_query(self, queryset, request):
+        limit = self.get_limit(request)
+        before = request.query_params.get("before")
+        after = request.query_params.get("after")
+        include_total = request.query_params.get("includeTotal") == "true"
+        if after:
+            timestamp, message_id = self.decode_cursor(after)
+            # The redundant range term lets the database seek the index instead
+            # of filtering the whole conversation on the OR.
+            newer = Q(timestamp__gte=timestamp) & (
+                Q(timestamp__gt=timestamp) | Q(id__gt=message_id)
+            )
+            return queryset.filter(newer).order_by("timestamp", "id")[: limit + 1], include_total
+        if before:
+            timestamp, message_id = self.decode_cursor(before)
+            older = Q(timestamp__lte=timestamp) & (
+                Q(timestamp__lt=timestamp) | Q(id__lt=message_id)
+            )
+            queryset = queryset.filter(older)
+        return queryset.order_by("-timestamp", "-id")[: limit + 1], include_total
+
+    def _page(self, request, rows, total):
+        limit = self.get_limit(request)
+        before = request.query_params.get("before")
+        after = request.query_params.get("after")
+        if after:
+            has_more_newer, rows = len(rows) > limit, rows[:limit]
+            page = rows[::-1]
+            has_more_older = True
+        else:
+            has_more_older, page = len(rows) > limit, rows[:limit]
+            has_more_newer = bool(before)
+
+        pagination = {
+            "limit": limit,
+            "next": (
+                self.encode_cursor(page[-1]) if page and has_more_older else None
+            ),
+            "prev": self.encode_cursor(page[0]) if page else (after or before or None),
+            "hasMoreNewer": has_more_newer,
+        }
+        if total is not None:
+            pagination["total"] = total
+        return page, pagination
+
+
+class RecentChatsPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = "limit"
+    max_page_size = 500
+
+
+def _pagination_payload(paginator, request, data):
+    pagination_provider = hasattr(paginator, "page") and paginator.page is not None
+    return {
+        "total": (
+            paginator.page.paginator.count if pagination_provider else len(data)
+        ),
+        "pages": paginator.page.paginator.num_pages if pagination_provider else 1,
+        "page": paginator.page.number if pagination_provider else 1,
+        "limit": (
+            paginator.get_page_size(request) if pagination_provider else len(data)
+        ),
+    }
+
+
 class ChatMessagesView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, userId):
+        validators = conditional.conversation_validators(request, userId)
+        if validators and (not_modified := validators.not_modified(request)):
+            return not_modified
         try:
             other_user = User.objects.get(id=userId)
         except User.DoesNotExist:
             return Response({"code": 404, "message": "User not found"}, status=404)
-        messages = Message.objects.filter(
-            (
-                models.Q(sender=request.user, receiver=other_user)
-                | models.Q(sender=other_user, receiver=request.user)
-            )
-        ).order_by("-timestamp")  # Newest messages first
-        paginator = ChatMessagesPagination()
-        page = paginator.paginate_queryset(messages, request)
-        data = MessageSerializer(page, many=True).data
+        key = conversation_key(request.user.id, other_user.id)
+        messages = (
+            Message.objects.filter(conversation_key=key)
+            .select_related("attachment")
+            .order_by("-timestamp", "-id")  # Newest messages first
+        )
+        archived = (
+            ArchivedMessage.objects.filter(conversation_key=key)
+            .select_related("attachment")
+            .order_by("-timestamp", "-id")
+        )
+        if ChatMessagesCursorPagination.is_requested(request):
+            try:
+                page, pagination = ChatMessagesCursorPagination().paginate_queryset(
+                    messages, request, archived
+                )
+            except ChatMessagesCursorPagination.InvalidCursor:
+                return Response({"code": 400, "message": "Invalid cursor"}, status=400)
+            tz = timezone.get_current_timezone()
+            data = [message_data(message, tz) for message in page]
+            response = Response({"messages": data, "pagination": pagination})
+        else:
+            paginator = ChatMessagesPagination()
+            page = paginator.paginate_queryset(MessageHistory(messages, archived), request)
+            tz = timezone.get_current_timezone()
+            data = [message_data(message, tz) for message in page]
+            pagination = _pagination_payload(paginator, request, data)
+            response = Response({"messages": data, "pagination": pagination})
+        return validators.apply(response) if validators else response
 
-        pagination_provider = hasattr(paginator, "page") and paginator.page is not None
-        pagination = {
-            "total": (
-                paginator.page.paginator.count if pagination_provider else len(data)
-            ),
-            "pages": paginator.page.paginator.num_pages if pagination_provider else 1,
-            "page": paginator.page.number if pagination_provider else 1,
-            "limit": (
-                paginator.get_page_size(request) if pagination_provider else len(data)
-            ),
-        }
 
-        return Response({"messages": data, "pagination": pagination})
+class ChatExportView(APIView):
+    """
+    Full conversation export as JSON lines or CSV, oldest message first. The body is
+    streamed from a database iterator, so memory use does not depend on the size of
+    the conversation.
+    """
+
+    permission_classes = [IsAuthenticated]
+    # Negotiated from ?format=jsonl|csv (DRF's format override); JSON lines by default
+    renderer_classes = [JSONLinesRenderer, CSVRenderer]
+
+    def get(self, request, userId):
+        try:
+            other_user = User.objects.get(id=userId)
+        except User.DoesNotExist:
+            return Response({"code": 404, "message": "User not found"}, status=404)
+        key = conversation_key(request.user.id, other_user.id)
+        renderer = request.accepted_renderer
+        chunks = export.FORMATS[renderer.format](
+            export.export_rows(
+                ArchivedMessage.objects.filter(conversation_key=key),
+                Message.objects.filter(conversation_key=key),
+            )
+        )
+        if isinstance(request._request, ASGIRequest):
+            chunks = export.aiterate(chunks)
+        response = StreamingHttpResponse(
+            chunks, content_type=f"{renderer.media_type}; charset=utf-8"
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="chat-{request.user.id}-{other_user.id}.{renderer.format}"'
+        )
+        return response
 
 
 class RecentChatsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        sent = Message.objects.filter(sender=user).values_list("receiver", flat=True)
-        received = Message.objects.filter(receiver=user).values_list(
-            "sender", flat=True
-        )
-        chat_user_ids = set(list(sent) + list(received))
-        chat_user_ids.discard(user.id)
-        chats = []
-        for other_id in chat_user_ids:
-            try:
-                other_user = User.objects.get(id=other_id)
-            except User.DoesNotExist:
-                continue
-            last_msg = (
-                Message.objects.filter(
-                    (
-                        Q(sender=user, receiver=other_user)
-                        | Q(sender=other_user, receiver=user)
-                    )
-                )
-                .order_by("-timestamp")
-                .first()
+        validators = conditional.inbox_validators(request)
+        if not_modified := validators.not_modified(request):
+            return not_modified
+        # One indexed query over the user's inbox entries, newest activity first
+        memberships = (
+            ChatMembership.objects.filter(user=request.user)
+            .select_related("partner__profile", "last_message__attachment")
+            .order_by("-last_timestamp", "-id")
+        )
+        paginator = RecentChatsPagination()
+        page = paginator.paginate_queryset(memberships, request)
+        tz = timezone.get_current_timezone()
+        data = [recent_chat_data(membership, request, tz) for membership in page]
+        return validators.apply(
+            Response(
+                {"chats": data, "pagination": _pagination_payload(paginator, request, data)}
             )
-            unread_count = Message.objects.filter(
-                sender=other_user, receiver=user, read=False
-            ).count()  # Only count unread messages
-            chats.append(
+        )
+
+
+class MessageSearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "limit"
+    max_page_size = 100
+
+
+class MessageSearchView(APIView):
+    """
+    Ranked full-text search over the requesting user's own conversations, archived
+    messages included, backed by the database's full-text index (see ``chats.search``).
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get("q", "")
+        if not query_terms(query):
+            return Response({"code": 400, "message": "Missing search query"}, status=400)
+        paginator = MessageSearchPagination()
+        hits = paginator.paginate_queryset(
+            get_search_backend().search(request.user.id, query), request
+        )
+        ids = [hit["id"] for hit in hits]
+        messages = Message.objects.select_related("attachment").in_bulk(ids)
+        if len(messages) < len(ids):  # Archived (chats.retention) or deleted
+            missing = [message_id for message_id in ids if message_id not in messages]
+            messages |= ArchivedMessage.objects.select_related("attachment").in_bulk(missing)
+        results = []
+        for hit in hits:
+            message = messages.get(hit["id"])
+            if message is None:  # Deleted since the search ran
+                continue
+            results.append(
                 {
-                    "user": other_user,
-                    "lastMessage": last_msg,
-                    "unreadCount": unread_count,
+                    "message": MessageSerializer(message).data,
+                    "userId": (
+                        message.receiver_id
+                        if message.sender_id == request.user.id
+                        else message.sender_id
+                    ),
+                    "snippet": hit["snippet"],
+                    "rank": hit["rank"],
                 }
             )
-        # After building the chats list, sort by lastMessage.timestamp (descending)
-        chats.sort(
-            key=lambda c: c["lastMessage"].timestamp if c["lastMessage"] else "",
-            reverse=True,
+        return Response(
+            {
+                "results": results,
+                "pagination": _pagination_payload(paginator, request, results),
+            }
         )
-        serializer = RecentChatSerializer(
-            chats, many=True, context={"request": request}
+
+
+class UnreadCountsView(APIView):
+    """
+    Unread badge: the total and a per-partner breakdown, read from the counters that
+    ``ChatMembership`` keeps as messages are sent and read. One indexed query, however
+    many conversations the user has.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        counts = list(
+            ChatMembership.objects.filter(user=request.user, unread_count__gt=0)
+            .order_by("-last_timestamp", "-id")
+            .values_list("partner_id", "unread_count")
+        )
+        return Response(
+            {
+                "total": sum(count for _, count in counts),
+                "chats": [
+                    {"userId": partner_id, "unreadCount": count}
+                    for partner_id, count in counts
+                ],
+            }
         )
-        # Add 'read' status to lastMessage if present
-        for chat, data in zip(chats, serializer.data):
-            if chat["lastMessage"]:
-                data["lastMessage"]["read"] = chat["lastMessage"].read
-        return Response({"chats": serializer.data})
 
 
 class MarkMessagesAsReadView(APIView):
@@ -158,9 +582,129 @@ class MarkMessagesAsReadView(APIView):
         except User.DoesNotExist:
             return Response({"code": 404, "message": "User not found"}, status=404)
         # Mark all messages from other_user to current user as read
-        updated = Message.objects.filter(sender=other_user, receiver=request.user, read=False).update(read=True)
+        updated = mark_conversation_read(request.user, other_user)
         return Response({
             "success": True,
             "message": f"Messages marked as read",
             "updated": updated
         })
+
+
+class ChatUpdatesView(View):
+    """
+    Long-poll for new messages and read receipts since the client's cursors.
+
+    Returns at once when something changed, otherwise waits on the channel layer
+    until an event arrives or ``timeout`` seconds pass. The view is async, so under
+    ASGI a waiting client costs a coroutine rather than a busy worker thread, and a
+    woken client is answered from the event itself without going back to the
+    database.
+    """
+
+    default_timeout = 25
+    max_timeout = 60
+    max_messages = 100
+
+    async def get(self, request):
+        user = await aauthenticate(request)
+        if user is None:
+            return JsonResponse(
+                {"code": 401, "message": "Invalid or missing access token"}, status=401
+            )
+        try:
+            since = int(request.GET["since"]) if "since" in request.GET else None
+            timeout = float(request.GET.get("timeout", self.default_timeout))
+            read_since = (
+                datetime.fromisoformat(request.GET["readSince"].replace("Z", "+00:00"))
+                if "readSince" in request.GET
+                else timezone.now()
+            )
+        except ValueError:
+            return JsonResponse(
+                {"code": 400, "message": "Invalid since, readSince or timeout"},
+                status=400,
+            )
+        timeout = min(max(timeout, 0), self.max_timeout)
+        if timezone.is_naive(read_since):
+            read_since = timezone.make_aware(read_since, dt_timezone.utc)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # Subscribe before looking at the database so no event can slip in between
+        subscription = get_channel_layer().subscribe(user_group(user.id))
+        try:
+            if since is None:
+                since = await self._latest_message_id(user)
+            updates = await self._collect(user, since, read_since)
+            while not (updates["messages"] or updates["reads"]):
+                remaining = deadline - loop.time()
+                try:
+                    if remaining > 0:
+                        event = await asyncio.wait_for(subscription.get(), remaining)
+                    else:
+                        # Out of time, but an event may have queued while we were
+                        # busy querying; don't drop it on the floor.
+                        event = subscription.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                self._apply_event(updates, user, event)
+                while True:  # Fold in anything else that arrived alongside
+                    try:
+                        self._apply_event(updates, user, subscription.get_nowait())
+                    except asyncio.QueueEmpty:
+                        break
+        finally:
+            subscription.close()
+        with metrics.render_timer():
+            response = JsonResponse(updates)
+        return response
+
+    @staticmethod
+    def _apply_event(updates, user, event):
+        if event["type"] == MESSAGE_NEW and event["message"]["id"] > updates["since"]:
+            updates["messages"].append(event["message"])
+            updates["since"] = event["message"]["id"]
+        elif event["type"] == MESSAGE_READ and event["senderId"] == user.id:
+            updates["reads"].append(
+                {"userId": event["readerId"], "readAt": event["readAt"]}
+            )
+            updates["readSince"] = max(
+                updates["readSince"], event["readAt"], key=parse_datetime
+            )
+
+    @staticmethod
+    async def _latest_message_id(user):
+        latest = (
+            await Message.objects.filter(Q(receiver=user) | Q(sender=user))
+            .order_by("-id")
+            .values_list("id", flat=True)
+            .afirst()
+        )
+        return latest or 0
+
+    async def _collect(self, user, since, read_since):
+        messages = [
+            message
+            async for message in Message.objects.filter(
+                Q(receiver=user) | Q(sender=user), id__gt=since
+            )
+            .select_related("attachment")
+            .order_by("id")[: self.max_messages]
+        ]
+        reads = [
+            read
+            async for read in ChatMembership.objects.filter(
+                user=user, partner_read_at__gt=read_since
+            ).values_list("partner_id", "partner_read_at")
+        ]
+        # DRF's formatting keeps microseconds, so readSince round-trips exactly
+        timestamp = serializers.DateTimeField().to_representation
+        return {
+            "messages": list(MessageSerializer(messages, many=True).data),
+            "reads": [
+                {"userId": partner_id, "readAt": timestamp(read_at)}
+                for partner_id, read_at in reads
+            ],
+            "since": messages[-1].id if messages else since,
+            "readSince": timestamp(max([read_since] + [r[1] for r in reads])),
+        }
@@ -0,0 +1,111 @@
+"""
+ASGI WebSocket endpoint that pushes chat events to the connected user.
+
+Clients connect to ``/ws/chats/`` with their SimpleJWT access token either as the
+``token`` query parameter (browsers cannot set headers on WebSockets) or as an
+``Authorization: Bearer`` header. Server events are JSON objects with a ``type``
+of ``message.new``, ``message.read`` or ``typing``. Clients may send
+``{"type": "typing", "receiverId": <id>}`` to notify their chat partner; events for
+users they have no conversation with are dropped.
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework_simplejwt.settings import api_settings
+
+from chats.models import ChatMembership
+from chats.realtime import TYPING, get_channel_layer, user_group
+from users.authentication import aget_user_for_token
+
+WEBSOCKET_PATH = "/ws/chats/"
+
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_NOT_FOUND = 4404
+
+
+def _raw_token(scope):
+    token = parse_qs(scope.get("query_string", b"").decode()).get("token")
+    if token:
+        return token[0]
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            parts = value.decode().split()
+            if len(parts) == 2 and parts[0] in api_settings.AUTH_HEADER_TYPES:
+                return parts[1]
+    return None
+
+
+async def handle_client_event(user, text, layer, partners):
+    """
+    Relay a client event. ``partners`` holds the ids already checked to share a
+    conversation with ``user``, so typing only costs a query once per partner.
+    """
+    try:
+        event = json.loads(text or "")
+    except ValueError:
+        return
+    if not isinstance(event, dict):
+        return
+    receiver_id = event.get("receiverId")
+    if event.get("type") == TYPING and isinstance(receiver_id, int):
+        if receiver_id not in partners:
+            if not await ChatMembership.objects.filter(
+                user=user, partner_id=receiver_id
+            ).aexists():
+                return
+            partners.add(receiver_id)
+        layer.publish(
+            user_group(receiver_id),
+            {
+                "type": TYPING,
+                "userId": user.id,
+                "isTyping": bool(event.get("isTyping", True)),
+            },
+        )
+
+
+async def websocket_application(scope, receive, send):
+    connect = await receive()
+    if connect["type"] != "websocket.connect":
+        return
+    if scope["path"] != WEBSOCKET_PATH:
+        await send({"type": "websocket.close", "code": CLOSE_NOT_FOUND})
+        return
+    user = await aget_user_for_token(_raw_token(scope))
+    if user is None:
+        await send({"type": "websocket.close", "code": CLOSE_UNAUTHORIZED})
+        return
+    await send({"type": "websocket.accept"})
+
+    layer = get_channel_layer()
+    subscription = layer.subscribe(user_group(user.id))
+    partners = set()
+    receive_task = asyncio.ensure_future(receive())
+    event_task = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait(
+                {receive_task, event_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if event_task in done:
+                await send(
+                    {
+                        "type": "websocket.send",
+                        "text": json.dumps(event_task.result(), cls=DjangoJSONEncoder),
+                    }
+                )
+                event_task = asyncio.ensure_future(subscription.get())
+            if receive_task in done:
+                message = receive_task.result()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message["type"] == "websocket.receive":
+                    await handle_client_event(user, message.get("text"), layer, partners)
+                receive_task = asyncio.ensure_future(receive())
+    finally:
+        receive_task.cancel()
+        event_task.cancel()
+        subscription.close()
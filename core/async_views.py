@@ -0,0 +1,117 @@
+"""
+Base class for async API views that run natively under ASGI.
+
+DRF's ``APIView`` is sync only, so under ASGI Django runs every DRF request in a
+worker thread. ``AsyncAPIView`` is a plain Django ``View`` with async handlers: it
+authenticates the bearer token through the async user cache, parses JSON bodies and
+answers through the same renderers as the DRF views (``render_response``), keeping
+the API's ``{"code", "message"}`` errors.
+Request bodies may be JSON or form data; multipart uploads stay on the DRF views.
+"""
+
+import json
+
+from django.core.paginator import InvalidPage
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.settings import api_settings
+
+from core import metrics
+from users.authentication import aauthenticate
+
+
+class APIError(Exception):
+    """Raise from a handler to answer with ``{"code": status, "message": message}``."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def render_response(request, data, status=200):
+    """
+    ``data`` rendered as a DRF view's ``Response`` would be: negotiated from ``Accept``
+    (or ``?format=``) among ``DEFAULT_RENDERER_CLASSES``, leaving out the browsable API.
+    """
+    renderers = [
+        renderer()
+        for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+        if renderer.format != "api"
+    ]
+    renderer, accepted_media_type = DefaultContentNegotiation().select_renderer(
+        request, renderers
+    )
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f"{content_type}; charset={renderer.charset}"
+    with metrics.render_timer():
+        body = renderer.render(data, accepted_media_type, {"request": request})
+    return HttpResponse(body, status=status, content_type=content_type)
+
+
+def error_response(status, message, **extra):
+    return JsonResponse({"code": status, "message": message, **extra}, status=status)
+
+
+class AsyncAPIView(View):
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token authentication only, like the DRF views, so no CSRF check
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = getattr(self, request.method.lower(), None)
+        if request.method.lower() not in self.http_method_names or handler is None:
+            return self.http_method_not_allowed(request, *args, **kwargs)
+        request.user = await aauthenticate(request)
+        if request.user is None:
+            return error_response(401, "Invalid or missing access token")
+        # Lets DRF helpers such as the paginators read the query string
+        request.query_params = request.GET
+        if request.content_type == "application/json":
+            try:
+                request.data = json.loads(request.body) if request.body else {}
+            except ValueError:
+                return error_response(400, "Invalid JSON body")
+        else:
+            request.data = request.POST
+        try:
+            return await handler(request, *args, **kwargs)
+        except APIError as exc:
+            return error_response(exc.status, exc.message)
+        except APIException as exc:
+            # What DRF's default exception handler would have answered
+            return JsonResponse({"detail": exc.detail}, status=exc.status_code)
+
+
+async def apaginate(paginator, queryset, request):
+    """
+    Async ``PageNumberPagination.paginate_queryset`` for a queryset (or anything with
+    ``acount()`` and async-iterable slices): returns the page's rows and the API's
+    ``{total, pages, page, limit}`` payload.
+    """
+    page_size = paginator.get_page_size(request)
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    # Fill Paginator's cached count so validating the page doesn't query again
+    django_paginator.count = await queryset.acount()
+    page_number = paginator.get_page_number(request, django_paginator)
+    try:
+        number = django_paginator.validate_number(page_number)
+    except InvalidPage as exc:
+        raise NotFound(
+            paginator.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            )
+        )
+    bottom = (number - 1) * page_size
+    rows = [row async for row in queryset[bottom : bottom + page_size]]
+    return rows, {
+        "total": django_paginator.count,
+        "pages": django_paginator.num_pages,
+        "page": number,
+        "limit": page_size,
+    }
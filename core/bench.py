@@ -0,0 +1,270 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks seed synthetic users under the ``@bench.invalid`` email domain so they
+can be told apart from real accounts and removed afterwards with ``cleanup``. Those
+that change the schema run in a ``scratch_database`` instead.
+"""
+
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import override_settings
+from django.utils import timezone
+
+from core.stats import summarize
+
+BENCH_DOMAIN = "bench.invalid"
+BENCH_PASSWORD = "benchpass"
+
+
+@contextmanager
+def scratch_database():
+    """
+    Run the block against a new, migrated database in place of "default", as the test
+    runner does, and drop it afterwards; reads stay on it too. On SQLite it is a file in
+    a temporary directory rather than the test runner's in-memory database.
+    """
+    test_settings = connection.settings_dict["TEST"]
+    test_name = test_settings["NAME"]
+    directory = None
+    if connection.vendor == "sqlite":
+        directory = tempfile.mkdtemp()
+        test_settings["NAME"] = os.path.join(directory, "bench.sqlite3")
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        with override_settings(DATABASE_REPLICAS=[]):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings["NAME"] = test_name
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_users():
+    return User.objects.filter(email__endswith=f"@{BENCH_DOMAIN}")
+
+
+def seed_users(count, batch_size=10000, stdout=None, name=None):
+    """
+    Create ``count`` bench users (with profiles) and return their ids.
+    ``name(rng, i)`` builds each profile name.
+    """
+    from users.models import UserProfile
+
+    rng = random.Random(0)
+    # Hashing once keeps seeding fast; every bench user shares the same password.
+    password = make_password(BENCH_PASSWORD)
+    start = bench_users().count()
+    for offset in range(start, start + count, batch_size):
+        size = min(batch_size, start + count - offset)
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                [
+                    User(
+                        username=f"user{offset + i}@{BENCH_DOMAIN}",
+                        email=f"user{offset + i}@{BENCH_DOMAIN}",
+                        password=password,
+                    )
+                    for i in range(size)
+                ]
+            )
+            if users[0].pk is None:  # Backends without RETURNING support
+                users = list(
+                    bench_users().filter(
+                        username__in=[u.username for u in users]
+                    )
+                )
+            UserProfile.objects.bulk_create(
+                [
+                    UserProfile(
+                        user=user,
+                        name=(
+                            name(rng, offset + i)
+                            if name
+                            else f"Bench User {user.email.split('@')[0][4:]}"
+                        ),
+                        gender="other",
+                        dob="2000-01-01",
+                    )
+                    for i, user in enumerate(users)
+                ]
+            )
+        if stdout:
+            stdout.write(f"Seeded {offset + size - start}/{count} users")
+    return list(bench_users().order_by("id").values_list("id", flat=True))
+
+
+def seed_messages(pairs, count, batch_size=10000, stdout=None, content=None):
+    """
+    Create ``count`` messages spread over the given (sender, receiver) pairs, with
+    timestamps one second apart ending now. Either side may be the sender.
+    ``content(rng, i)`` builds each message body.
+    """
+    from chats.models import Message, conversation_key
+
+    rng = random.Random(0)
+    start_time = timezone.now() - timedelta(seconds=count)
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        batch = []
+        for i in range(offset, offset + size):
+            a, b = rng.choice(pairs)
+            if rng.random() < 0.5:
+                a, b = b, a
+            batch.append(
+                Message(
+                    sender_id=a,
+                    receiver_id=b,
+                    conversation_key=conversation_key(a, b),
+                    content=content(rng, i) if content else f"Synthetic message {i}",
+                    timestamp=start_time + timedelta(seconds=i),
+                    read=rng.random() < 0.9,
+                )
+            )
+        Message.objects.bulk_create(batch)
+        if stdout:
+            stdout.write(f"Seeded {offset + size}/{count} messages")
+
+
+def cleanup(stdout=None, batch_size=900):
+    """Remove every bench user together with their messages."""
+    from chats.models import ChatMembership, Message
+
+    users = bench_users()
+    deleted, _ = ChatMembership.objects.filter(
+        Q(user__in=users) | Q(partner__in=users)
+    ).delete()
+    # Messages go first, in batches: cascading a large delete from User makes Django
+    # null ChatMembership.last_message in one UPDATE with a parameter per message,
+    # which overflows SQLite's variable limit.
+    messages = Message.objects.filter(Q(sender__in=users) | Q(receiver__in=users))
+    while ids := list(messages.values_list("id", flat=True)[:batch_size]):
+        deleted += Message.objects.filter(id__in=ids).delete()[0]
+    deleted += users.delete()[0]
+    if stdout:
+        stdout.write(f"Removed {deleted} bench rows")
+
+
+def measure(fn, repeat):
+    """Call ``fn`` ``repeat`` times and return the wall-clock samples in seconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def format_summary(label, samples):
+    s = summarize(samples)
+    return (
+        f"{label:<40} n={s['n']:<5} mean={s['mean']:8.3f}ms "
+        f"p50={s['p50']:8.3f}ms p95={s['p95']:8.3f}ms p99={s['p99']:8.3f}ms"
+    )
+
+
+async def http_request(host, port, method, path, headers=None, body=None):
+    """
+    Minimal HTTP/1.1 client for load tests: one connection per request, so it can
+    hold thousands of concurrent requests without a third-party client library.
+    Returns ``(status, body_bytes)``.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        payload = b""
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: close"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        if body is not None:
+            payload = json.dumps(body).encode()
+            lines += ["Content-Type: application/json", f"Content-Length: {len(payload)}"]
+        writer.write("\r\n".join(lines).encode() + b"\r\n\r\n" + payload)
+        await writer.drain()
+        raw = await reader.read()
+    finally:
+        writer.close()
+    head, _, content = raw.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1]) if head else 0
+    return status, content
+
+
+def raise_open_file_limit(needed):
+    """Lift the soft open-file limit towards ``needed``; returns the new limit."""
+    import resource
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        soft = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    return soft
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port, env=None, interface="auto"):
+    """
+    Run ``app`` under uvicorn on ``port`` in a child process and wait until it
+    listens. ``interface="wsgi"`` serves a WSGI callable from uvicorn's thread pool.
+    The caller terminates the returned process.
+    """
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            app,
+            "--port",
+            str(port),
+            "--interface",
+            interface,
+            "--log-level",
+            "warning",
+        ],
+        env={**os.environ, **(env or {})},
+        # Failed requests are counted by status; keep tracebacks out of the report
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port, server)
+    except BaseException:
+        server.terminate()
+        server.wait()
+        raise
+    return server
+
+
+def wait_for_port(port, server, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise CommandError("uvicorn exited during startup")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError("uvicorn did not start listening in time")
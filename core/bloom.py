@@ -0,0 +1,64 @@
+"""
+A Bloom filter: a fixed-size bit array that answers "definitely not added" or
+"probably added" for a key, with no false negatives.
+
+Sized for ``capacity`` keys at a ``false_positive_rate``. Past capacity it still
+works, but the false positive rate climbs. Each key sets ``hashes`` bits derived from
+one BLAKE2b digest (double hashing), so a lookup costs one hash of the key and a few
+byte reads.
+"""
+
+import hashlib
+import math
+import struct
+
+_DIGEST = struct.Struct("<QQ")
+
+
+class BloomFilter:
+    def __init__(self, capacity, false_positive_rate=0.01):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = max(
+            8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        )
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _probe(self, key):
+        h1, h2 = _DIGEST.unpack(hashlib.blake2b(key.encode(), digest_size=16).digest())
+        return h1, h2 | 1
+
+    def add(self, key):
+        """Add ``key``; True unless all its bits were set already."""
+        h, step = self._probe(key)
+        bits, size = self.bits, self.size
+        added = False
+        for _ in range(self.hashes):
+            position = h % size
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+            h += step
+        self.count += added
+        return added
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key):
+        h, step = self._probe(key)
+        bits, size = self.bits, self.size
+        for _ in range(self.hashes):
+            position = h % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            h += step
+        return True
+
+    def __len__(self):
+        """Keys added, not counting repeats (or the odd key that was a false positive)."""
+        return self.count
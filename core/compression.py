@@ -0,0 +1,140 @@
+"""
+Response compression, in place of Django's ``GZipMiddleware``: brotli or gzip,
+whichever comes first in ``RESPONSE_COMPRESSION["ENCODINGS"]`` among the codings the
+client accepts. Brotli needs the brotli package and is skipped without it.
+
+Only the content types in ``TYPES`` are compressed. Avatars and attachments are
+already compressed, and trying again only costs CPU. Bodies under ``MIN_SIZE`` bytes
+go out as they are: they fit in a packet either way. Streaming responses (the chat
+export) are compressed as they stream.
+
+As in ``GZipMiddleware``, gzip output carries random filename bytes that make
+BREACH-style guessing from response lengths harder, and strong ETags become weak.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# What GZipMiddleware uses
+MAX_RANDOM_BYTES = 100
+
+
+def accepted_encodings(header):
+    """``{coding: q}`` from an ``Accept-Encoding`` header."""
+    accepted = {}
+    for item in header.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def choose_encoding(header, encodings):
+    """The first of ``encodings`` the client accepts and we can produce, or None."""
+    accepted = accepted_encodings(header)
+    for encoding in encodings:
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = settings.RESPONSE_COMPRESSION
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if response.has_header("Content-Encoding"):
+            return response
+        if not response.get("Content-Type", "").startswith(tuple(self.config["TYPES"])):
+            return response
+        if not response.streaming and len(response.content) < self.config["MIN_SIZE"]:
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = choose_encoding(
+            request.META.get("HTTP_ACCEPT_ENCODING", ""), self.config["ENCODINGS"]
+        )
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._acompress_stream(
+                    encoding, response.streaming_content
+                )
+            else:
+                response.streaming_content = self._compress_stream(
+                    encoding, response.streaming_content
+                )
+            # Unknown until the last chunk is out
+            del response.headers["Content-Length"]
+        else:
+            compressed = self._compress(encoding, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    def _compress(self, encoding, content):
+        if encoding == "br":
+            return brotli.compress(content, quality=self.config["BROTLI_QUALITY"])
+        return compress_string(content, max_random_bytes=MAX_RANDOM_BYTES)
+
+    def _compress_stream(self, encoding, chunks):
+        if encoding != "br":
+            yield from compress_sequence(chunks, max_random_bytes=MAX_RANDOM_BYTES)
+            return
+        compressor = brotli.Compressor(quality=self.config["BROTLI_QUALITY"])
+        for chunk in chunks:
+            if data := compressor.process(chunk):
+                yield data
+        yield compressor.finish()
+
+    async def _acompress_stream(self, encoding, chunks):
+        if encoding != "br":
+            # One gzip member per chunk, as GZipMiddleware does for async streams
+            async for chunk in chunks:
+                yield compress_string(chunk, max_random_bytes=MAX_RANDOM_BYTES)
+            return
+        compressor = brotli.Compressor(quality=self.config["BROTLI_QUALITY"])
+        async for chunk in chunks:
+            if data := compressor.process(chunk):
+                yield data
+        yield compressor.finish()
@@ -0,0 +1,302 @@
+"""
+Per-view request metrics, served in the Prometheus text format at ``/metrics``.
+
+``RequestMetricsMiddleware`` records, for every view (by URL name):
+
+- request latency as a histogram,
+- SQL queries per request as a histogram, plus total SQL time,
+- time spent rendering the response: DRF's renderers encoding the body, and the
+  views that encode their own (``render_timer``),
+- responses by status code.
+
+Queries are counted by one execute wrapper installed on every database connection,
+which only does work while a request is being measured. Numbers are per process;
+scrape each worker, or sum them in Prometheus. Requests over the query or latency
+budget in ``settings.REQUEST_METRICS`` are logged with their numbers.
+
+Latency ends when the view returns, so a streamed body is not included. Building the
+data that gets rendered (serializers, ``message_data`` and the other dict encoders) is
+view time, not render time.
+"""
+
+import bisect
+import hmac
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("request_metrics", default=None)
+
+UNMATCHED = "<unmatched>"
+
+
+class _RequestStats:
+    __slots__ = ("queries", "db_time", "render_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += perf_counter() - started
+        stats.queries += 1
+
+
+@contextmanager
+def render_timer():
+    """Count the block as rendering, for views that encode their response themselves."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        stats.render_time += perf_counter() - started
+
+
+def _install(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install_query_recorder():
+    """Count queries on every connection, including ones already open."""
+    connection_created.connect(_install, dispatch_uid="core.metrics.install")
+    for connection in connections.all(initialized_only=True):
+        _install(connection=connection)
+
+
+class Histogram:
+    """Cumulative-bucket histogram; ``counts[i]`` holds observations <= ``bounds[i]``."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last is +Inf
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for count in self.counts:
+            total += count
+            yield total
+
+
+class _ViewMetrics:
+    __slots__ = ("latency", "queries", "db_time", "render_time", "statuses")
+
+    def __init__(self, config):
+        self.latency = Histogram(config["LATENCY_BUCKETS"])
+        self.queries = Histogram(config["QUERY_BUCKETS"])
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statuses = {}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view, status, latency, stats, config):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = _ViewMetrics(config)
+            metrics.latency.observe(latency)
+            metrics.queries.observe(stats.queries)
+            metrics.db_time += stats.db_time
+            metrics.render_time += stats.render_time
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def snapshot(self):
+        """``{view: metrics}``, copied so rendering doesn't hold the lock."""
+        with self._lock:
+            return {
+                view: {
+                    "latency": (m.latency.bounds, list(m.latency.cumulative()), m.latency.sum),
+                    "queries": (m.queries.bounds, list(m.queries.cumulative()), m.queries.sum),
+                    "db_time": m.db_time,
+                    "render_time": m.render_time,
+                    "statuses": dict(m.statuses),
+                }
+                for view, m in self._views.items()
+            }
+
+
+registry = MetricsRegistry()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name, view, bounds, cumulative, total):
+    for bound, count in zip(bounds, cumulative):
+        yield f'{name}_bucket{{view="{view}",le="{bound}"}} {count}'
+    yield f'{name}_bucket{{view="{view}",le="+Inf"}} {cumulative[-1]}'
+    yield f'{name}_sum{{view="{view}"}} {total}'
+    yield f'{name}_count{{view="{view}"}} {cumulative[-1]}'
+
+
+def render_prometheus(snapshot):
+    views = sorted(snapshot.items())
+    lines = [
+        "# HELP http_request_duration_seconds Time from request to the view's response.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for view, m in views:
+        lines += _histogram_lines("http_request_duration_seconds", _label(view), *m["latency"])
+    lines += [
+        "# HELP http_request_db_queries SQL queries run by one request.",
+        "# TYPE http_request_db_queries histogram",
+    ]
+    for view, m in views:
+        lines += _histogram_lines("http_request_db_queries", _label(view), *m["queries"])
+    for name, key, help_text in (
+        ("http_request_db_seconds_total", "db_time", "Time spent in SQL queries."),
+        ("http_request_render_seconds_total", "render_time", "Time spent rendering responses."),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [f'{name}{{view="{_label(view)}"}} {m[key]}' for view, m in views]
+    lines += [
+        "# HELP http_responses_total Responses by status code.",
+        "# TYPE http_responses_total counter",
+    ]
+    for view, m in views:
+        for status, count in sorted(m["statuses"].items()):
+            lines.append(f'http_responses_total{{view="{_label(view)}",status="{status}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def _is_staff(request):
+    """Whether a Django admin session or an API access token belongs to a staff user."""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            authenticated = authentication_class().authenticate(request)
+        except APIException:
+            return False
+        if authenticated is not None:
+            return authenticated[0].is_staff
+    return False
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, for ``Bearer <REQUEST_METRICS["TOKEN"]>`` when one is
+    set, or for staff users.
+    """
+    token = settings.REQUEST_METRICS["TOKEN"]
+    has_token = token and hmac.compare_digest(
+        request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}"
+    )
+    if not has_token and not _is_staff(request):
+        return HttpResponse(status=401)
+    return HttpResponse(
+        render_prometheus(registry.snapshot()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+class RequestMetricsMiddleware:
+    """Measure each request into ``registry``; first in ``MIDDLEWARE`` to see it all."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = settings.REQUEST_METRICS
+        install_query_recorder()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = _RequestStats()
+        token = _current.set(stats)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = _RequestStats()
+        token = _current.set(stats)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, perf_counter() - started, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before DRF's Response is rendered
+        stats = _current.get()
+        if stats is not None:
+            started = perf_counter()
+
+            def rendered(response):
+                stats.render_time += perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def _finish(self, request, response, latency, stats):
+        match = request.resolver_match
+        view = match.view_name if match else UNMATCHED
+        registry.record(view, response.status_code, latency, stats, self.config)
+        slow_ms = self.config["SLOW_REQUEST_MS"]
+        budget = self.config["QUERY_BUDGET"]
+        if (slow_ms is not None and latency * 1000 > slow_ms) or (
+            budget is not None and stats.queries > budget
+        ):
+            logger.warning(
+                "Over budget: %s %s (%s) %.1f ms, %d queries, %.1f ms SQL",
+                request.method,
+                request.path,
+                view,
+                latency * 1000,
+                stats.queries,
+                stats.db_time * 1000,
+            )
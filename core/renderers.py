@@ -0,0 +1,77 @@
+"""
+The API's renderers and parser, set as the defaults in ``REST_FRAMEWORK``.
+
+``ORJSONRenderer`` and ``ORJSONParser`` are DRF's JSON renderer and parser on top of
+orjson, which encodes and decodes several times faster than the standard library.
+The bytes are the same as DRF's compact output; values orjson can't encode itself go
+through DRF's ``JSONEncoder``. Indented output (``Accept: application/json;
+indent=2``) and a missing orjson fall back to DRF.
+
+``MessagePackRenderer`` answers clients that send ``Accept: application/msgpack`` (or
+``?format=msgpack``) with the same data as MessagePack, which is smaller than JSON
+and cheaper for clients to decode.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Falls back to DRF's renderer and parser
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _default(obj):
+    # What DRF's JSON encoder makes of dates, decimals, lazy strings and the like
+    return JSONEncoder().default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    options = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=_default, option=self.options)
+        # DRF escapes these two for JavaScript, which doesn't allow them in strings
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if msgpack is None:
+            raise ImproperlyConfigured("MessagePackRenderer needs the msgpack package")
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_default)
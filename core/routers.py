@@ -0,0 +1,99 @@
+"""
+Primary/replica database routing.
+
+Writes always go to ``default`` (the primary). Reads go to a random alias from
+``settings.DATABASE_REPLICAS`` unless the current request is pinned to the primary,
+which happens when:
+
+- the request has written anything, so it reads its own writes;
+- the read runs inside a transaction on the primary;
+- the authenticated user sent or read messages (or edited their profile) within the
+  last ``DATABASE_REPLICA_STICKINESS`` seconds, so a client never sees a replica that
+  hasn't caught up with its last action. ``remember_write`` records this in the
+  default cache, so it holds across workers when that cache is shared.
+
+With no replicas configured every query goes to the primary and none of the above
+costs anything.
+"""
+
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+PRIMARY = "default"
+
+_pinned = ContextVar("pinned_to_primary", default=False)
+
+
+def _sticky_key(user_id):
+    return f"core.routers:sticky:{user_id}"
+
+
+def pin_to_primary():
+    """Send the rest of this request's reads to the primary."""
+    _pinned.set(True)
+
+
+def remember_write(user_id):
+    """Pin this request, and the user's next requests for a short while, to the primary."""
+    pin_to_primary()
+    if settings.DATABASE_REPLICAS:
+        cache.set(_sticky_key(user_id), True, settings.DATABASE_REPLICA_STICKINESS)
+
+
+def pin_if_recent_writer(user_id):
+    if settings.DATABASE_REPLICAS and cache.get(_sticky_key(user_id)):
+        pin_to_primary()
+
+
+async def apin_if_recent_writer(user_id):
+    if settings.DATABASE_REPLICAS and await cache.aget(_sticky_key(user_id)):
+        pin_to_primary()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _pinned.get() or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+
+class ReplicaPinningMiddleware:
+    """Start every request unpinned; under WSGI the context outlives the request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _pinned.set(False)
+        try:
+            return self.get_response(request)
+        finally:
+            _pinned.reset(token)
+
+    async def __acall__(self, request):
+        token = _pinned.set(False)
+        try:
+            return await self.get_response(request)
+        finally:
+            _pinned.reset(token)
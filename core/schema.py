@@ -0,0 +1,14 @@
+"""Helpers for migrations that install database-specific SQL."""
+
+
+def run_sql(statements_by_vendor):
+    """
+    A ``RunPython`` function that executes ``statements_by_vendor[vendor]`` for the
+    migrating connection's vendor ("sqlite", "postgresql"...), and nothing on others.
+    """
+
+    def operation(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return operation
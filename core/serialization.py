@@ -0,0 +1,33 @@
+"""
+Helpers for the read-only fast encoders (``chats.serializers.message_data``,
+``users.serializers.user_data``): they build plain dicts straight from model
+attributes and must produce exactly what the DRF serializers they shadow produce.
+"""
+
+from django.utils import timezone
+
+
+def format_datetime(value, tz=None):
+    """
+    Same output as DRF's ``DateTimeField`` with the default ISO 8601 format. Looking
+    up the active timezone costs more than formatting, so callers encoding many rows
+    pass ``tz=timezone.get_current_timezone()`` once.
+    """
+    if value is None:
+        return None
+    tz = tz or timezone.get_current_timezone()
+    if timezone.is_aware(value):
+        value = value.astimezone(tz)
+    else:
+        value = timezone.make_aware(value, tz)
+    text = value.isoformat()
+    if text.endswith("+00:00"):
+        text = text[:-6] + "Z"
+    return text
+
+
+def format_date(value):
+    """Same output as DRF's ``DateField`` with the default ISO 8601 format."""
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -44,9 +45,14 @@ INSTALLED_APPS = [
     # Local apps
     "users",
     "chats",
+    "jobs",
+    "uploads",
 ]
 
 MIDDLEWARE = [
+    "core.metrics.RequestMetricsMiddleware",
+    "core.compression.CompressionMiddleware",
+    "core.routers.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # CORS middleware
@@ -85,8 +91,34 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        # WAL lets readers run alongside the writer; IMMEDIATE takes the write lock
+        # when a transaction starts, so concurrent writers wait for each other (up to
+        # "timeout" seconds) instead of failing with "database is locked".
+        "OPTIONS": {
+            "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL",
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
+        # Keep connections open between requests (WSGI). On PostgreSQL use Django's
+        # connection pool instead, which requires CONN_MAX_AGE = 0:
+        #   "ENGINE": "django.db.backends.postgresql",
+        #   "OPTIONS": {"pool": {"min_size": 2, "max_size": 20, "timeout": 10}},
+        "CONN_MAX_AGE": 60,
+        "CONN_HEALTH_CHECKS": True,
+    },
 }
+# Read replica. SQLite can't replicate, so locally it opens the same file as
+# "default"; point it at a real replica in production.
+DATABASES["replica"] = {**DATABASES["default"]}
+
+# Aliases that take reads (core.routers), e.g. DATABASE_REPLICAS=replica. Empty sends
+# everything to "default".
+DATABASE_REPLICAS = [
+    alias for alias in os.environ.get("DATABASE_REPLICAS", "").split(",") if alias
+]
+DATABASE_ROUTERS = ["core.routers.PrimaryReplicaRouter"]
+# Seconds a user's reads stay on the primary after they send or read messages
+DATABASE_REPLICA_STICKINESS = 5
 
 
 # Password validation
@@ -136,11 +168,22 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST Framework settings
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
+    # orjson-backed JSON, plus MessagePack for clients that ask for it (core.renderers)
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.ORJSONRenderer",
+        "core.renderers.MessagePackRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "core.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 # JWT settings
@@ -166,6 +209,94 @@ SIMPLE_JWT = {
     "TOKEN_TYPE_CLAIM": "token_type",
     "TOKEN_USER_CLASS": "rest_framework_simplejwt.models.TokenUser",
     "JTI_CLAIM": "jti",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.RevocableTokenRefreshSerializer",
+}
+
+# Token revocation (users.revocation): logout and revoke-all are checked per request
+# against a per-process Bloom filter of revoked jtis. Other processes' revocations
+# apply within POLL_INTERVAL seconds. The filter is rebuilt every REBUILD_INTERVAL,
+# in a background thread once the table has more than INLINE_LOAD_MAX rows, with room
+# for at least MIN_CAPACITY jtis. `manage.py prune_revoked_tokens` drops expired rows.
+TOKEN_REVOCATION = {
+    "POLL_INTERVAL": 5,
+    "REBUILD_INTERVAL": 3600,
+    "FALSE_POSITIVE_RATE": 0.01,
+    "MIN_CAPACITY": 100000,
+    "INLINE_LOAD_MAX": 100000,
+}
+
+# Read-through cache for User + UserProfile used by authentication (users.cache).
+# Use "users.cache.DjangoCacheBackend" with OPTIONS {"alias": ...} to share it
+# between processes through a CACHES entry.
+USER_CACHE = {
+    "BACKEND": "users.cache.LocMemLRUBackend",
+    "OPTIONS": {"max_entries": 10000, "ttl": 300},
+}
+
+# Real-time chat events (chats.realtime). The in-memory layer only fans out within
+# one process; point BACKEND at a shared layer when running several workers.
+CHAT_CHANNEL_LAYER = {
+    "BACKEND": "chats.realtime.InMemoryChannelLayer",
+    "OPTIONS": {"capacity": 100},
+}
+
+# Message retention (chats.retention). `manage.py archive_messages` moves read messages
+# older than ARCHIVE_AFTER from chats.Message to chats.ArchivedMessage, BATCH_SIZE rows
+# per transaction with BATCH_PAUSE seconds between them so other writers get in.
+CHAT_RETENTION = {
+    "ARCHIVE_AFTER": timedelta(days=365),
+    "BATCH_SIZE": 500,
+    "BATCH_PAUSE": 0.05,
+}
+
+# Serve the hot chat and me/ endpoints with the async views (chats.async_views,
+# users.async_views) instead of the DRF ones. Only worth it under ASGI; under WSGI
+# Django runs async views in an event loop per request.
+ASYNC_API_VIEWS = os.environ.get("ASYNC_API_VIEWS", "") == "1"
+
+# Background jobs (jobs app). "inprocess" runs a worker thread inside the web process
+# (development); "worker" leaves jobs to `python manage.py run_jobs` processes.
+JOBS = {
+    "EXECUTOR": "inprocess",
+    "WORKERS": 4,
+    "MAX_QUEUE_DEPTH": 10000,
+    "MAX_ATTEMPTS": 3,
+    "RETRY_BACKOFF": 2.0,  # Seconds, raised to the attempt number
+    "POLL_INTERVAL": 1.0,
+    "STALE_AFTER": 300,  # Requeue jobs left running this long by a dead worker
+    "KEEP_FINISHED_FOR": 24 * 60 * 60,
+}
+
+# Checked file uploads (uploads app). Each purpose sets its size limit, the file kinds
+# it accepts (sniffed from the content, see uploads.pipeline.KINDS) and the function
+# that finishes an upload. Files over CHUNK_SIZE go through resumable sessions.
+UPLOADS = {
+    "CHUNK_SIZE": 1024 * 1024,
+    "EXPIRE_AFTER": 24 * 60 * 60,  # Seconds before purge_uploads drops an idle session
+    "PURPOSES": {
+        "avatar": {
+            "MAX_SIZE": 2 * 1024 * 1024,
+            "KINDS": ["png", "jpeg", "gif"],
+            "FINISH": "users.views.finish_avatar_upload",
+        },
+        "attachment": {
+            "MAX_SIZE": 25 * 1024 * 1024,
+            "KINDS": ["png", "jpeg", "gif", "webp", "pdf"],
+            "FINISH": "chats.views.finish_attachment_upload",
+        },
+    },
+}
+
+# Per-view request metrics (core.metrics), scraped from /metrics. Requests slower than
+# SLOW_REQUEST_MS or running more than QUERY_BUDGET queries are logged (None disables).
+# /metrics is for staff users, and for "Authorization: Bearer <token>" once
+# METRICS_TOKEN is set (for Prometheus).
+REQUEST_METRICS = {
+    "LATENCY_BUCKETS": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    "QUERY_BUCKETS": (1, 2, 3, 5, 10, 20, 50, 100),
+    "SLOW_REQUEST_MS": 1000,
+    "QUERY_BUDGET": 30,
+    "TOKEN": os.environ.get("METRICS_TOKEN") or None,
 }
 
 # CORS settings
@@ -179,3 +310,27 @@ AUTHENTICATION_BACKENDS = [
     "users.backend.EmailBackend",
     "django.contrib.auth.backends.ModelBackend",
 ]
+
+# Password checks at login (users.passwords). THREADS > 0 hashes in a pool of that
+# many threads, so a burst of logins can't take every core from other requests;
+# logins past MAX_PENDING queued or running checks get a 503. 0 checks inline.
+PASSWORD_CHECKS = {
+    "THREADS": int(os.environ.get("PASSWORD_CHECK_THREADS", "0")),
+    "MAX_PENDING": 64,
+}
+
+# Response compression (core.compression): the first of ENCODINGS the client accepts
+# ("br" needs the brotli package), for responses of one of TYPES and MIN_SIZE bytes
+# or more.
+RESPONSE_COMPRESSION = {
+    "ENCODINGS": ["br", "gzip"],
+    "TYPES": ["application/json", "application/msgpack", "application/x-ndjson", "text/"],
+    "MIN_SIZE": 1024,
+    "BROTLI_QUALITY": 4,
+}
+
+# Typeahead user search (users.search): pages of matching ids are cached per query,
+# so a new or renamed user can take up to ttl seconds to appear under a prefix.
+USER_SEARCH = {
+    "CACHE": {"max_entries": 4096, "ttl": 30},
+}
@@ -18,12 +18,26 @@ Including another URLconf
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
+
+from core.metrics import metrics_view
+from uploads.views import serve_hashed
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/users/", include("users.urls")),
     path("api/chats/", include("chats.urls")),
+    path("api/jobs/", include("jobs.urls")),
+    path("api/uploads/", include("uploads.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
+if settings.DEBUG:
+    # Ahead of static() so stored files get their immutable Cache-Control header
+    urlpatterns += [
+        re_path(
+            rf"^{settings.MEDIA_URL.lstrip('/')}(?P<prefix>avatars|attachments)/(?P<path>.*)$",
+            serve_hashed,
+        )
+    ]
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
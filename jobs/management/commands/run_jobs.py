@@ -0,0 +1,43 @@
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker, purge_finished
+
+
+class Command(BaseCommand):
+    help = "Run a background job worker until interrupted (SIGINT/SIGTERM finish running jobs first)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, help="Size of the job thread pool")
+        parser.add_argument(
+            "--purge-every",
+            type=int,
+            default=300,
+            help="Seconds between deletions of old finished jobs",
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(workers=options["workers"])
+
+        def shutdown(signum, frame):
+            self.stdout.write("Stopping: waiting for running jobs to finish...")
+            threading.Thread(target=worker.stop).start()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        def purge():
+            while not worker.wait_stopped(options["purge_every"]):
+                purge_finished()
+
+        threading.Thread(target=purge, daemon=True).start()
+        self.stdout.write(f"Job worker started with {worker.workers} threads")
+        started = time.monotonic()
+        worker.run()
+        worker.stop()
+        self.stdout.write(
+            self.style.SUCCESS(f"Job worker stopped after {time.monotonic() - started:.0f}s")
+        )
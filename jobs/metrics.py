@@ -0,0 +1,35 @@
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from core.stats import summarize
+from jobs.models import Job
+
+
+def snapshot(sample_size=1000):
+    """
+    Queue depth per status plus wait and run latency over the most recently
+    finished jobs. Computed from the table, so it covers every worker process.
+    """
+    depth = dict(
+        Job.objects.values_list("status").annotate(Count("id")).order_by()
+    )
+    oldest_due = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=timezone.now()
+    ).aggregate(Min("run_at"))["run_at__min"]
+    finished = Job.objects.filter(status__in=[Job.DONE, Job.FAILED]).order_by(
+        "-finished_at"
+    )[:sample_size]
+    waits, runs = [], []
+    for run_at, started_at, finished_at in finished.values_list(
+        "run_at", "started_at", "finished_at"
+    ):
+        waits.append(max((started_at - run_at).total_seconds(), 0))
+        runs.append((finished_at - started_at).total_seconds())
+    return {
+        "depth": {status: depth.get(status, 0) for status, _ in Job.STATUS_CHOICES},
+        "oldestDueAgeSeconds": (
+            (timezone.now() - oldest_due).total_seconds() if oldest_due else 0
+        ),
+        "waitLatencyMs": summarize(waits) if waits else None,
+        "runLatencyMs": summarize(runs) if runs else None,
+    }
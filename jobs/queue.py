@@ -0,0 +1,57 @@
+"""
+Enqueueing side of the background job subsystem.
+
+Handlers are registered by name with ``@register("app.job_name")`` in an app's
+``jobs.py`` and receive the job's JSON payload. Jobs are rows in ``jobs.Job``, so
+they survive restarts; ``jobs.worker`` claims and runs them.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from jobs.models import Job
+
+_handlers = {}
+
+
+class QueueFull(Exception):
+    """Raised by ``enqueue`` when the backlog exceeds ``JOBS["MAX_QUEUE_DEPTH"]``."""
+
+
+def register(name):
+    def decorator(func):
+        _handlers[name] = func
+        return func
+
+    return decorator
+
+
+def get_handler(name):
+    return _handlers[name]
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=None):
+    """
+    Queue a call to the handler registered as ``name``. Refuses new work once the
+    backlog is full, so a burst degrades into dropped jobs rather than unbounded
+    growth. Returns the created Job.
+    """
+    if name not in _handlers:
+        raise KeyError(f"No job handler registered as {name!r}")
+    config = settings.JOBS
+    if Job.objects.filter(status=Job.QUEUED).count() >= config["MAX_QUEUE_DEPTH"]:
+        raise QueueFull(name)
+    job = Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or config["MAX_ATTEMPTS"],
+    )
+    if config["EXECUTOR"] == "inprocess":
+        from jobs.worker import wake_inprocess_worker
+
+        transaction.on_commit(wake_inprocess_worker)
+    return job
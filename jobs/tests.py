@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import QueueFull, enqueue, register
+from jobs.worker import Worker, requeue_stale, run_pending
+
+calls = []
+
+
+@register("tests.record")
+def record(payload):
+    calls.append(payload)
+
+
+@register("tests.flaky")
+def flaky(payload):
+    calls.append(payload)
+    if len(calls) < payload["fail_times"] + 1:
+        raise RuntimeError("boom")
+
+
+def jobs_settings(**overrides):
+    return override_settings(JOBS={**settings.JOBS, **overrides})
+
+
+@jobs_settings(EXECUTOR="worker", RETRY_BACKOFF=0)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_due_jobs_only(self):
+        enqueue("tests.record", {"n": 1})
+        enqueue("tests.record", {"n": 2}, delay=60)
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, [{"n": 1}])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 1)
+
+    def test_retries_then_succeeds(self):
+        job = enqueue("tests.flaky", {"fail_times": 2})
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 3))
+
+    def test_gives_up_after_max_attempts(self):
+        job = enqueue("tests.flaky", {"fail_times": 5}, max_attempts=2)
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("boom", job.last_error)
+
+    @jobs_settings(EXECUTOR="worker", MAX_QUEUE_DEPTH=2)
+    def test_backpressure(self):
+        enqueue("tests.record")
+        enqueue("tests.record")
+        with self.assertRaises(QueueFull):
+            enqueue("tests.record")
+
+    def test_stale_running_jobs_are_requeued(self):
+        job = enqueue("tests.record")
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, started_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(requeue_stale(), 1)
+
+    def test_worker_dispatch_is_bounded_by_pool_size(self):
+        for _ in range(5):
+            enqueue("tests.record")
+        worker = Worker(workers=2)
+        worker._in_flight = 1
+        self.assertEqual(worker.dispatch(), 1)
+        worker.stop()
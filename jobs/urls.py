@@ -0,0 +1,7 @@
+from django.urls import path
+
+from jobs.views import JobStatsView
+
+urlpatterns = [
+    path("stats/", JobStatsView.as_view(), name="job_stats"),
+]
@@ -0,0 +1,188 @@
+"""
+Executing side of the background job subsystem.
+
+A ``Worker`` polls ``jobs.Job`` for due rows, claims them with a conditional
+UPDATE (so several workers can share one table) and runs them on a bounded
+thread pool. Failed jobs are retried with exponential backoff until they run out
+of attempts. ``stop()`` stops claiming and waits for running jobs to finish.
+
+``manage.py run_jobs`` runs a worker as its own process. With
+``JOBS["EXECUTOR"] = "inprocess"`` (development) the web process starts one in a
+background thread the first time a job is enqueued.
+"""
+
+import atexit
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import get_handler
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    def __init__(self, workers=None, poll_interval=None):
+        config = settings.JOBS
+        self.workers = workers or config["WORKERS"]
+        self.poll_interval = poll_interval or config["POLL_INTERVAL"]
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="jobs")
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def wait_stopped(self, timeout=None):
+        """Block until ``stop()`` is called or ``timeout`` passes; True if stopped."""
+        return self._stopping.wait(timeout)
+
+    def stop(self, wait=True):
+        self._stopping.set()
+        self._wake.set()
+        self._pool.shutdown(wait=wait)
+
+    def run(self):
+        """Claim and dispatch jobs until ``stop()`` is called."""
+        while not self._stopping.is_set():
+            try:
+                requeue_stale()
+                dispatched = self.dispatch()
+            except Exception:
+                logger.exception("Job worker loop failed")
+                dispatched = 0
+            finally:
+                close_old_connections()
+            if not dispatched:
+                self._wake.wait(self._idle_timeout())
+                self._wake.clear()
+
+    def dispatch(self):
+        """Claim as many due jobs as there are free pool slots and submit them."""
+        with self._lock:
+            free = self.workers - self._in_flight
+        if free <= 0:
+            return 0
+        jobs = claim(free)
+        for job in jobs:
+            with self._lock:
+                self._in_flight += 1
+            self._pool.submit(self._execute, job)
+        return len(jobs)
+
+    def _idle_timeout(self):
+        # Sleep until the next delayed job is due, but never past a poll interval
+        next_run = (
+            Job.objects.filter(status=Job.QUEUED)
+            .order_by("run_at")
+            .values_list("run_at", flat=True)
+            .first()
+        )
+        if next_run is None:
+            return self.poll_interval
+        due_in = (next_run - timezone.now()).total_seconds()
+        return min(max(due_in, 0.01), self.poll_interval)
+
+    def _execute(self, job):
+        try:
+            execute(job)
+        finally:
+            close_old_connections()
+            with self._lock:
+                self._in_flight -= 1
+            self._wake.set()
+
+
+def claim(limit):
+    """Mark up to ``limit`` due jobs as running and return them."""
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by(
+        "run_at"
+    )[:limit]
+    claimed = []
+    for job in candidates:
+        # Only one worker wins the transition from queued to running
+        won = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=now, attempts=job.attempts + 1
+        )
+        if won:
+            job.status, job.started_at, job.attempts = Job.RUNNING, now, job.attempts + 1
+            claimed.append(job)
+    return claimed
+
+
+def execute(job):
+    """Run one claimed job and record the outcome."""
+    try:
+        get_handler(job.name)(job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            backoff = settings.JOBS["RETRY_BACKOFF"] ** job.attempts
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED,
+                run_at=timezone.now() + timedelta(seconds=backoff),
+                last_error=error,
+            )
+            logger.warning("Job %s failed, retrying in %ss", job, backoff)
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, finished_at=timezone.now(), last_error=error
+            )
+            logger.error("Job %s failed permanently", job)
+    else:
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.DONE, finished_at=timezone.now()
+        )
+
+
+def requeue_stale():
+    """Give jobs back to the queue whose worker died while running them."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS["STALE_AFTER"])
+    return Job.objects.filter(status=Job.RUNNING, started_at__lt=cutoff).update(
+        status=Job.QUEUED
+    )
+
+
+def purge_finished():
+    """Delete finished jobs older than ``JOBS["KEEP_FINISHED_FOR"]`` seconds."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS["KEEP_FINISHED_FOR"])
+    deleted, _ = Job.objects.filter(
+        status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+def run_pending():
+    """Synchronously run every due job once (tests and one-off maintenance)."""
+    count = 0
+    while jobs := claim(settings.JOBS["WORKERS"]):
+        for job in jobs:
+            execute(job)
+        count += len(jobs)
+    return count
+
+
+_inprocess_worker = None
+_inprocess_lock = threading.Lock()
+
+
+def wake_inprocess_worker():
+    global _inprocess_worker
+    with _inprocess_lock:
+        if _inprocess_worker is None:
+            _inprocess_worker = Worker()
+            threading.Thread(
+                target=_inprocess_worker.run, name="jobs-worker", daemon=True
+            ).start()
+            atexit.register(_inprocess_worker.stop)
+    _inprocess_worker.wake()
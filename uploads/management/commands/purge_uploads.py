@@ -0,0 +1,53 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from uploads.models import Upload
+from uploads.pipeline import staging_dir
+
+
+class Command(BaseCommand):
+    help = (
+        "Drop resumable uploads idle for longer than UPLOADS['EXPIRE_AFTER'] and any "
+        "staging files left behind by interrupted requests, e.g. hourly from cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be removed without removing it",
+        )
+
+    def handle(self, *args, **options):
+        expire_after = settings.UPLOADS["EXPIRE_AFTER"]
+        stale = Upload.objects.filter(
+            updated_at__lt=timezone.now() - timedelta(seconds=expire_after)
+        )
+        sessions = list(stale.values_list("id", flat=True))
+        if not options["dry_run"]:
+            stale.filter(id__in=sessions).delete()
+
+        # Whatever is left in the staging directory and not touched lately belongs
+        # to no live upload: a dropped session, or a request killed mid-transfer
+        live = {f"{upload_id}.part" for upload_id in Upload.objects.values_list("id", flat=True)}
+        cutoff = time.time() - expire_after
+        removed = 0
+        with os.scandir(staging_dir()) as entries:
+            for entry in entries:
+                if entry.name in live or entry.stat().st_mtime >= cutoff:
+                    continue
+                if not options["dry_run"]:
+                    os.unlink(entry.path)
+                removed += 1
+
+        verb = "Found" if options["dry_run"] else "Removed"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {len(sessions)} stale uploads and {removed} staging files"
+            )
+        )
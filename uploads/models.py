@@ -0,0 +1,28 @@
+import os
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import models
+
+from uploads.pipeline import staging_dir
+
+
+class Upload(models.Model):
+    """A resumable upload in progress; deleted once the file is finished."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name="uploads", on_delete=models.CASCADE)
+    purpose = models.CharField(max_length=32)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    kind = models.CharField(max_length=16, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.purpose} upload {self.id} ({self.received}/{self.size})"
+
+    @property
+    def part_path(self):
+        return os.path.join(staging_dir(), f"{self.id}.part")
@@ -0,0 +1,260 @@
+"""
+Checked, streamed file uploads.
+
+Every upload has a purpose (``settings.UPLOADS["PURPOSES"]``) that fixes its size
+limit, the file kinds it accepts and the function that finishes it. Files are checked
+while they arrive: the declared size before any of the body is read, the kind from
+the first bytes of the file (never the name or the client's content type), and the
+running size on every chunk. Bytes go straight to a staging file under ``MEDIA_ROOT``,
+so a finished file is moved into place with a rename rather than copied.
+
+Small files come in one multipart request (``receive_file``); large ones in chunks
+through a resumable ``Upload`` session (``uploads.views``). Both end with the
+purpose's finish function, called as ``finish(request, path, kind, filename)``, which
+must move or remove ``path`` and returns ``(data, status)`` for the response.
+"""
+
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import locks
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+SNIFF_BYTES = 12
+
+# kind: (extension, content type)
+KINDS = {
+    "png": (".png", "image/png"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "gif": (".gif", "image/gif"),
+    "webp": (".webp", "image/webp"),
+    "pdf": (".pdf", "application/pdf"),
+}
+
+# Allowance for the multipart boundaries and headers around the file itself
+MULTIPART_OVERHEAD = 16 * 1024
+
+# Bytes read from the request body at a time
+READ_SIZE = 64 * 1024
+
+# Stored files are named by their hash, so their URLs can be cached forever
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def sniff(head):
+    """The kind of file starting with ``head``, from its magic bytes, or None."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    return None
+
+
+class UploadRejected(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Purpose:
+    def __init__(self, name, max_size, kinds, finish):
+        self.name = name
+        self.max_size = max_size
+        self.kinds = kinds
+        self._finish = finish
+
+    @cached_property
+    def finish(self):
+        return import_string(self._finish)
+
+
+def get_purpose(name):
+    config = settings.UPLOADS["PURPOSES"].get(name)
+    if config is None:
+        return None
+    return Purpose(name, config["MAX_SIZE"], config["KINDS"], config["FINISH"])
+
+
+def staging_dir():
+    path = os.path.join(settings.MEDIA_ROOT, "uploads")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class StreamCheck:
+    """
+    Running checks for one file. ``received`` and ``kind`` carry over between the
+    requests of a resumable upload.
+    """
+
+    def __init__(self, purpose, declared_size=None, received=0, kind=None):
+        self.purpose = purpose
+        self.received = received
+        self.kind = kind
+        self.head = b""
+        if declared_size is not None and declared_size > purpose.max_size:
+            raise UploadRejected(400, "File too large")
+
+    def feed(self, data):
+        self.received += len(data)
+        if self.received > self.purpose.max_size:
+            raise UploadRejected(400, "File too large")
+        if self.kind is None:
+            self.head += data[: SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self._sniff()
+
+    def finish(self):
+        if self.kind is None:  # Shorter than SNIFF_BYTES
+            self._sniff()
+
+    def _sniff(self):
+        kind = sniff(self.head)
+        if kind not in self.purpose.kinds:
+            raise UploadRejected(400, "Invalid file format")
+        self.kind = kind
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """``TemporaryUploadedFile`` in the staging directory instead of the system temp."""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        file = tempfile.NamedTemporaryFile(suffix=".upload", dir=staging_dir())
+        UploadedFile.__init__(
+            self, file, name, content_type, size, charset, content_type_extra
+        )
+
+
+class CheckedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler that checks each file as its chunks arrive and stops reading the
+    request as soon as one fails, leaving the rest of the body unread.
+    """
+
+    def __init__(self, purpose, request=None):
+        super().__init__(request)
+        self.purpose = purpose
+        self.error = None
+
+    def new_file(self, field_name, file_name, content_type, content_length, *args, **kwargs):
+        super(TemporaryFileUploadHandler, self).new_file(
+            field_name, file_name, content_type, content_length, *args, **kwargs
+        )
+        try:
+            self.check = StreamCheck(self.purpose, declared_size=content_length)
+        except UploadRejected as exc:
+            self._reject(exc)
+        self.file = StagedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            self.check.feed(raw_data)
+        except UploadRejected as exc:
+            self._reject(exc)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        try:
+            self.check.finish()
+        except UploadRejected as exc:
+            self.error = exc
+            self.file.close()  # Removes the staging file
+            return None
+        file = super().file_complete(file_size)
+        file.kind = self.check.kind
+        return file
+
+    def _reject(self, exc):
+        self.error = exc
+        raise StopUpload(connection_reset=True)
+
+
+def receive_file(request, purpose, field):
+    """
+    Parse a multipart request through ``CheckedUploadHandler`` and return the checked
+    file in ``field`` (a ``StagedUploadedFile`` with a ``kind``), or raise
+    ``UploadRejected``. Call before anything reads ``request.data`` or ``FILES``.
+    """
+    declared = int(request.META.get("CONTENT_LENGTH") or 0)
+    if declared > purpose.max_size + MULTIPART_OVERHEAD:
+        raise UploadRejected(400, "File too large")
+    handler = CheckedUploadHandler(purpose, request)
+    # On the Django request under a DRF one, where its parsers look for them
+    getattr(request, "_request", request).upload_handlers = [handler]
+    upload = request.FILES.get(field)
+    if handler.error:
+        raise handler.error
+    if upload is None:
+        raise UploadRejected(400, "No file uploaded")
+    return upload
+
+
+@contextmanager
+def locked_part(path):
+    """
+    Open the part file at ``path`` for writing under an exclusive lock, or yield None
+    if another request holds it. Nothing may write to a part file without the lock.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "wb") as part:
+        # LOCK_EX is 0 where Django has no file locking; writes then go unguarded
+        if locks.LOCK_EX and not locks.lock(part, locks.LOCK_EX | locks.LOCK_NB):
+            yield None
+            return
+        try:
+            yield part
+        finally:
+            if locks.LOCK_EX:
+                locks.unlock(part)
+
+
+def append_chunk(stream, part, offset, check):
+    """
+    Write the body of a chunk request to the locked ``part`` file at ``offset``,
+    checking it on the way; returns how many bytes arrived. Bytes past a failed check
+    are never read.
+    """
+    part.seek(offset)
+    while data := stream.read(READ_SIZE):
+        check.feed(data)
+        part.write(data)
+    part.flush()
+    return check.received - offset
+
+
+def store_by_hash(path, prefix, kind):
+    """
+    Move the finished file at ``path`` to ``<prefix>/<hash[:2]>/<hash><ext>`` under
+    ``MEDIA_ROOT``, or drop it if that content is already stored. Returns the hash.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    digest = digest.hexdigest()
+    destination = os.path.join(settings.MEDIA_ROOT, hashed_name(prefix, digest, kind))
+    if os.path.exists(destination):
+        os.unlink(path)
+    else:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(path, destination)
+    return digest
+
+
+def hashed_name(prefix, digest, kind):
+    return f"{prefix}/{digest[:2]}/{digest}{KINDS[kind][0]}"
@@ -0,0 +1,23 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class NewUploadRequestSerializer(serializers.Serializer):
+    purpose = serializers.ChoiceField(choices=[])
+    size = serializers.IntegerField(min_value=1)
+    filename = serializers.CharField(max_length=255)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["purpose"].choices = list(settings.UPLOADS["PURPOSES"])
+
+
+def upload_data(upload):
+    return {
+        "uploadId": str(upload.id),
+        "purpose": upload.purpose,
+        "filename": upload.filename,
+        "size": upload.size,
+        "received": upload.received,
+        "chunkSize": settings.UPLOADS["CHUNK_SIZE"],
+    }
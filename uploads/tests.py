@@ -0,0 +1,200 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from chats.models import Attachment
+from chats.tests import make_user
+from uploads.models import Upload
+from uploads.pipeline import (SNIFF_BYTES, StreamCheck, UploadRejected, get_purpose,
+                              locked_part, staging_dir)
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 4 + b"\n%%EOF\n"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 100
+
+
+class MediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def staged(self):
+        return os.listdir(staging_dir())
+
+
+class StreamCheckTests(SimpleTestCase):
+    def test_rejects_as_soon_as_a_check_fails(self):
+        purpose = get_purpose("avatar")
+        with self.assertRaisesMessage(UploadRejected, "File too large"):
+            StreamCheck(purpose, declared_size=purpose.max_size + 1)
+
+        # The kind is known from the first bytes, whatever the file is called
+        check = StreamCheck(purpose)
+        with self.assertRaisesMessage(UploadRejected, "Invalid file format"):
+            check.feed(b"<html><script>")
+        check = StreamCheck(purpose)
+        check.feed(PNG[:5])
+        check.feed(PNG[5:])
+        self.assertEqual(check.kind, "png")
+
+        # A client that declared nothing (or lied) is cut off at the limit
+        check.feed(b"\0" * (purpose.max_size - check.received))
+        with self.assertRaisesMessage(UploadRejected, "File too large"):
+            check.feed(b"\0")
+
+
+class SingleRequestUploadTests(MediaRootMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user("alice.test@example.com")
+        self.client.force_authenticate(self.user)
+
+    def post(self, url, field, content, name):
+        return self.client.post(
+            url, {field: SimpleUploadedFile(name, content)}, format="multipart"
+        )
+
+    def test_bogus_and_oversized_files_are_rejected_without_a_trace(self):
+        response = self.post(reverse("upload_avatar"), "avatar", b"MZ\x90\0" * 10, "me.png")
+        self.assertEqual(response.data, {"code": 400, "message": "Invalid file format"})
+        # Refused from Content-Length before any of the body is parsed
+        big = PNG + b"\0" * get_purpose("avatar").max_size
+        response = self.post(reverse("upload_avatar"), "avatar", big, "me.png")
+        self.assertEqual(response.data, {"code": 400, "message": "File too large"})
+        self.assertEqual(self.staged(), [])
+
+    def test_attachment_is_moved_into_place(self):
+        response = self.post(reverse("upload_attachment"), "file", PDF, "notes.pdf")
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachment.objects.get()
+        self.assertEqual((attachment.kind, attachment.size), ("pdf", len(PDF)))
+        self.assertEqual(response.data["url"], settings.MEDIA_URL + attachment.path)
+        with open(os.path.join(self.media_root, attachment.path), "rb") as stored:
+            self.assertEqual(stored.read(), PDF)
+        self.assertEqual(self.staged(), [])
+
+
+@override_settings(UPLOADS={**settings.UPLOADS, "CHUNK_SIZE": 256})
+class ResumableUploadTests(MediaRootMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user("alice.test@example.com")
+        self.bob = make_user("bob.test@example.com")
+        self.client.force_authenticate(self.alice)
+
+    def start(self, size=len(PDF), purpose="attachment"):
+        response = self.client.post(
+            reverse("start_upload"),
+            {"purpose": purpose, "size": size, "filename": "notes.pdf"},
+        )
+        self.assertEqual(response.status_code, 201)
+        return reverse("upload", args=[response.data["uploadId"]])
+
+    def put(self, url, offset, chunk):
+        return self.client.put(
+            url,
+            chunk,
+            content_type="application/offset+octet-stream",
+            headers={"Upload-Offset": str(offset)},
+        )
+
+    def test_chunks_resume_and_finish_into_an_attachment(self):
+        url = self.start()
+        self.assertEqual(self.put(url, 0, PDF[:256]).data["received"], 256)
+        # A client that lost its place is told where to carry on
+        response = self.put(url, 0, PDF[:256])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["received"], 256)
+        self.assertEqual(self.client.get(url).data["received"], 256)
+        response = self.put(url, 0, PDF[:300])
+        self.assertEqual(response.status_code, 409)
+
+        offset = 256
+        while offset < len(PDF):
+            response = self.put(url, offset, PDF[offset : offset + 256])
+            offset += 256
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["name"], "notes.pdf")
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(self.staged(), [])
+        attachment = Attachment.objects.get()
+        with open(os.path.join(self.media_root, attachment.path), "rb") as stored:
+            self.assertEqual(stored.read(), PDF)
+
+        response = self.client.post(
+            reverse("send_message"),
+            {"receiverId": self.bob.id, "content": "", "attachmentId": attachment.id},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.bob)
+        history = self.client.get(reverse("chat_messages", args=[self.alice.id]))
+        self.assertEqual(history.data["messages"][0]["attachment"], response.data["attachment"])
+        # Only the uploader can attach it
+        response = self.client.post(
+            reverse("send_message"),
+            {"receiverId": self.alice.id, "content": "", "attachmentId": attachment.id},
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_bad_first_chunk_ends_the_upload(self):
+        url = self.start()
+        response = self.put(url, 0, b"not a pdf at all" * 16)
+        self.assertEqual(response.data, {"code": 400, "message": "Invalid file format"})
+        self.assertFalse(Upload.objects.exists())
+        self.assertEqual(self.staged(), [])
+
+    def test_kind_is_sniffed_from_a_whole_first_chunk(self):
+        # Magic bytes split off a different file's start aren't sniffed
+        body = b"MZ\x90\x00\x03" + PNG
+        url = self.start(size=len(body))
+        response = self.put(url, 0, body[:5])
+        self.assertEqual(response.data, {"code": 400, "message": "First chunk too short"})
+        self.assertEqual(self.client.get(url).data["received"], 0)
+        response = self.put(url, 0, body[:SNIFF_BYTES])
+        self.assertEqual(response.data, {"code": 400, "message": "Invalid file format"})
+        self.assertFalse(Upload.objects.exists())
+
+    def test_only_the_request_holding_the_part_file_writes(self):
+        url = self.start()
+        self.put(url, 0, PDF[:256])
+        with locked_part(Upload.objects.get().part_path) as part:
+            self.assertIsNotNone(part)
+            # A second request at the same offset while one is writing
+            response = self.put(url, 256, b"x" * 256)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["received"], 256)
+        with open(Upload.objects.get().part_path, "rb") as stored:
+            self.assertEqual(stored.read(), PDF[:256])
+
+    def test_limits_are_checked_before_the_body_is_read(self):
+        response = self.client.post(
+            reverse("start_upload"),
+            {"purpose": "avatar", "size": get_purpose("avatar").max_size + 1, "filename": "a.png"},
+        )
+        self.assertEqual(response.data, {"code": 400, "message": "File too large"})
+        url = self.start()
+        self.assertEqual(self.put(url, 0, PDF[:257]).data["message"], "Chunk too large")
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_purge_drops_idle_uploads(self):
+        url = self.start()
+        self.put(url, 0, PDF[:256])
+        Upload.objects.update(updated_at=Upload.objects.get().updated_at - timedelta(days=2))
+        part = Upload.objects.get().part_path
+        os.utime(part, (0, 0))
+        call_command("purge_uploads", stdout=StringIO())
+        self.assertFalse(Upload.objects.exists())
+        self.assertFalse(os.path.exists(part))
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from uploads.views import UploadsView, UploadView
+
+urlpatterns = [
+    path("", UploadsView.as_view(), name="start_upload"),
+    path("<uuid:uploadId>", UploadView.as_view(), name="upload"),
+]
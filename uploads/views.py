@@ -0,0 +1,151 @@
+import os
+
+from django.conf import settings
+from django.utils import timezone
+from django.views.static import serve
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from uploads.models import Upload
+from uploads.pipeline import (CACHE_CONTROL, SNIFF_BYTES, StreamCheck,
+                              UploadRejected, append_chunk, get_purpose,
+                              locked_part)
+from uploads.serializers import NewUploadRequestSerializer, upload_data
+
+
+def _offset_mismatch(upload):
+    return Response(
+        {"code": 409, "message": "Offset mismatch", "received": upload.received},
+        status=409,
+    )
+
+
+def _discard(upload):
+    Upload.objects.filter(pk=upload.pk).delete()
+    try:
+        os.unlink(upload.part_path)
+    except FileNotFoundError:
+        pass
+
+
+class UploadsView(APIView):
+    """Start a resumable upload; the file then arrives in chunks (``UploadView``)."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = NewUploadRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {"code": 400, "message": "Invalid input", "details": serializer.errors},
+                status=400,
+            )
+        data = serializer.validated_data
+        if data["size"] > get_purpose(data["purpose"]).max_size:
+            return Response({"code": 400, "message": "File too large"}, status=400)
+        upload = Upload.objects.create(
+            user=request.user,
+            purpose=data["purpose"],
+            filename=data["filename"],
+            size=data["size"],
+        )
+        return Response(upload_data(upload), status=201)
+
+
+class UploadView(APIView):
+    """
+    One resumable upload. ``PUT`` appends the raw request body at ``Upload-Offset``,
+    which must equal the bytes received so far (a client that lost track asks with
+    ``GET``). The chunk that completes the file answers with the purpose's result.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get_upload(self, request, uploadId):
+        try:
+            return Upload.objects.get(pk=uploadId, user=request.user)
+        except Upload.DoesNotExist:
+            return None
+
+    def get(self, request, uploadId):
+        upload = self.get_upload(request, uploadId)
+        if upload is None:
+            return Response({"code": 404, "message": "Upload not found"}, status=404)
+        return Response(upload_data(upload))
+
+    def delete(self, request, uploadId):
+        upload = self.get_upload(request, uploadId)
+        if upload is None:
+            return Response({"code": 404, "message": "Upload not found"}, status=404)
+        _discard(upload)
+        return Response(status=204)
+
+    def put(self, request, uploadId):
+        upload = self.get_upload(request, uploadId)
+        if upload is None:
+            return Response({"code": 404, "message": "Upload not found"}, status=404)
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            return Response(
+                {"code": 400, "message": "Missing or invalid Upload-Offset"}, status=400
+            )
+        if offset != upload.received:
+            return _offset_mismatch(upload)
+        # Checked before reading any of the body
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+        if not length:
+            return Response({"code": 400, "message": "Empty chunk"}, status=400)
+        if length > settings.UPLOADS["CHUNK_SIZE"]:
+            return Response({"code": 400, "message": "Chunk too large"}, status=400)
+        if offset + length > upload.size:
+            return Response(
+                {"code": 400, "message": "Chunk past the end of the file"}, status=400
+            )
+        # The kind is sniffed from the first chunk alone, so it must hold the magic bytes
+        if offset == 0 and length < min(SNIFF_BYTES, upload.size):
+            return Response({"code": 400, "message": "First chunk too short"}, status=400)
+
+        purpose = get_purpose(upload.purpose)
+        with locked_part(upload.part_path) as part:
+            if part is None:  # Another request is writing a chunk
+                upload.refresh_from_db()
+                return _offset_mismatch(upload)
+            # The offset may have moved on since the upload was read
+            try:
+                upload.refresh_from_db()
+            except Upload.DoesNotExist:  # Finished or cancelled; purge_uploads tidies up
+                return Response({"code": 404, "message": "Upload not found"}, status=404)
+            if offset != upload.received:
+                return _offset_mismatch(upload)
+            check = StreamCheck(purpose, received=offset, kind=upload.kind or None)
+            try:
+                append_chunk(request._request, part, offset, check)
+                if check.received == upload.size:
+                    check.finish()
+            except UploadRejected as exc:
+                _discard(upload)
+                return Response(
+                    {"code": exc.status, "message": exc.message}, status=exc.status
+                )
+            # The lock already keeps other requests out; this holds where there is none
+            moved = Upload.objects.filter(pk=upload.pk, received=offset).update(
+                received=check.received, kind=check.kind or "", updated_at=timezone.now()
+            )
+            if not moved:
+                upload.refresh_from_db()
+                return _offset_mismatch(upload)
+        upload.received, upload.kind = check.received, check.kind or ""
+        if upload.received < upload.size:
+            return Response(upload_data(upload))
+        Upload.objects.filter(pk=upload.pk).delete()
+        data, status = purpose.finish(request, upload.part_path, check.kind, upload.filename)
+        return Response(data, status=status)
+
+
+def serve_hashed(request, path, prefix):
+    """Development server for content-addressed media; cached forever by clients."""
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, prefix))
+    response["Cache-Control"] = CACHE_CONTROL
+    return response
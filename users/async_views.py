@@ -0,0 +1,28 @@
+"""
+ASGI-native ``me/`` endpoint, served instead of ``users.views.CurrentUserView`` when
+``settings.ASYNC_API_VIEWS`` is on. A warm GET is answered from the user cache
+without touching the database or leaving the event loop.
+"""
+
+from asgiref.sync import sync_to_async
+
+from core.async_views import AsyncAPIView, render_response
+
+from .serializers import user_data
+from .views import update_user
+
+
+class CurrentUserView(AsyncAPIView):
+    async def get(self, request):
+        return render_response(request, user_data(request.user, request))
+
+    async def put(self, request):
+        data, status = await sync_to_async(self._update)(request)
+        return render_response(request, data, status=status)
+
+    @staticmethod
+    def _update(request):
+        serializer = update_user(request)
+        if serializer.is_valid():
+            return serializer.data, 200
+        return serializer.errors, 400
@@ -0,0 +1,82 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (AuthenticationFailed,
+                                                 InvalidToken, TokenError)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from core import routers
+from users.cache import get_user_cache
+from users.revocation import ais_token_revoked, is_token_revoked
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that reads the token's user (with profile) through the user
+    cache instead of querying the ``User`` table on every request, and rejects revoked
+    tokens (``users.revocation``).
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        routers.pin_if_recent_writer(user_id)
+        user = get_user_cache().get_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        if is_token_revoked(validated_token, user):
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        return user
+
+
+def get_raw_token(request):
+    """Extract the bearer token from a plain Django request, or None."""
+    header = request.META.get(api_settings.AUTH_HEADER_NAME, "")
+    parts = header.split()
+    if len(parts) == 2 and parts[0] in api_settings.AUTH_HEADER_TYPES:
+        return parts[1]
+    return None
+
+
+async def aget_user_for_token(raw_token):
+    """
+    Async counterpart of JWTAuthentication for views that run outside DRF (async
+    views, WebSockets). Returns the active user the access token belongs to, or None.
+    """
+    if not raw_token:
+        return None
+    try:
+        token = AccessToken(raw_token)
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return None
+    await routers.apin_if_recent_writer(user_id)
+    user = await get_user_cache().aget_user(user_id)
+    if user is None:
+        return None
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        return None
+    if await ais_token_revoked(token, user):
+        return None
+    return user
+
+
+async def aauthenticate(request):
+    return await aget_user_for_token(get_raw_token(request))
@@ -0,0 +1,81 @@
+"""
+Content-addressed avatar storage.
+
+An upload is stored once under the SHA-256 of its bytes (``uploads.pipeline``), so re-uploading the same
+image (or two users picking the same one) writes nothing new, and every URL names
+content that never changes and can be cached forever. A background job re-encodes
+the original into square WebP thumbnails of ``SIZES``; until it has, profiles point
+at the original.
+
+    MEDIA_ROOT/avatars/3f/3fa2...c1.png        original
+    MEDIA_ROOT/avatars/3f/3fa2...c1_96.webp    96x96 thumbnail
+"""
+
+import os
+import tempfile
+
+from django.conf import settings
+
+SIZES = (48, 96, 256)
+ORIGINAL = "original"
+
+
+def _directory(digest):
+    return f"avatars/{digest[:2]}"
+
+
+def original_name(digest, ext):
+    return f"{_directory(digest)}/{digest}{ext}"
+
+
+def variant_name(digest, size):
+    return f"{_directory(digest)}/{digest}_{size}.webp"
+
+
+def media_path(name):
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def ready_sizes(digest):
+    return [size for size in SIZES if os.path.exists(media_path(variant_name(digest, size)))]
+
+
+def render_thumbnails(digest, ext):
+    """Write any missing thumbnails of the stored original; returns the ready sizes."""
+    from PIL import Image, ImageOps
+
+    missing = [size for size in SIZES if size not in ready_sizes(digest)]
+    if missing:
+        with Image.open(media_path(original_name(digest, ext))) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            for size in missing:
+                path = media_path(variant_name(digest, size))
+                thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+                # Write then rename, so a half-written file is never served
+                with tempfile.NamedTemporaryFile(
+                    dir=os.path.dirname(path), suffix=".webp", delete=False
+                ) as tmp:
+                    thumbnail.save(tmp, "WEBP", quality=85)
+                os.replace(tmp.name, path)
+    return ready_sizes(digest)
+
+
+def requested_size(request):
+    """
+    The thumbnail size asked for with ``?avatarSize=<px>``. None means the original,
+    which is what clients get unless they ask for a size.
+    """
+    value = request.GET.get("avatarSize")
+    if value is None or value == ORIGINAL:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def pick_size(requested, sizes):
+    """The smallest ready thumbnail of at least ``requested`` px, or None for the original."""
+    larger = [size for size in sizes if size >= requested]
+    return min(larger) if larger else None
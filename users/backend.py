@@ -1,19 +1,23 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User
 
+from .models import users_by_email
+from .passwords import check_password
+
 
 class EmailBackend(ModelBackend):
     """
-    Custom authentication backend that allows users to log in using their email address.
+    Custom authentication backend that allows users to log in using their email address
+    (in any case).
     """
 
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None:
             username = kwargs.get("email")
         try:
-            user = User.objects.get(email=username)
+            user = users_by_email(username).get()
         except User.DoesNotExist:
             return None
-        if user.check_password(password) and self.user_can_authenticate(user):
+        if check_password(user, password) and self.user_can_authenticate(user):
             return user
         return None
@@ -0,0 +1,195 @@
+"""
+Read-through cache of ``User`` rows together with their ``UserProfile``, keyed by
+user id. Authentication (``CachedJWTAuthentication``) and the async token lookup
+read users through it, so a warm request needs no query to know who is calling.
+
+Entries hold plain field values, never model instances: each read builds fresh
+objects, so a request that edits ``request.user`` cannot leak the edit to other
+requests. Views that change a user or profile call ``invalidate``; anything else
+(admin edits, deactivation) shows up once the entry's TTL expires.
+"""
+
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from users.models import UserProfile
+
+_USER_FIELDS = [field.attname for field in User._meta.concrete_fields]
+_PROFILE_FIELDS = [field.attname for field in UserProfile._meta.concrete_fields]
+# Part of shared cache keys, so entries written before a field was added aren't read
+_LAYOUT = zlib.crc32(" ".join(_USER_FIELDS + _PROFILE_FIELDS).encode())
+
+
+class LocMemLRUBackend:
+    """Per-process LRU with a TTL; the default."""
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Memory only, so the async API can call straight through
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+
+class DjangoCacheBackend:
+    """Stores entries in one of Django's ``CACHES``, e.g. Redis shared by all workers."""
+
+    def __init__(self, alias="default", ttl=300, key_prefix="users.cache"):
+        self.alias = alias
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, key):
+        return f"{self.key_prefix}:{_LAYOUT:x}:{key}"
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, value):
+        self.cache.set(self._key(key), value, self.ttl)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    async def aget(self, key):
+        return await self.cache.aget(self._key(key))
+
+    async def aset(self, key, value):
+        await self.cache.aset(self._key(key), value, self.ttl)
+
+
+class UserCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_user(self, user_id):
+        """The user with ``profile`` preloaded, or None if there is no such user."""
+        entry = self.backend.get(user_id)
+        if entry is None:
+            self.misses += 1
+            entry = self._load(user_id)
+            if entry is None:
+                return None
+            self.backend.set(user_id, entry)
+        else:
+            self.hits += 1
+        return self._build(entry)
+
+    async def aget_user(self, user_id):
+        entry = await self.backend.aget(user_id)
+        if entry is None:
+            self.misses += 1
+            entry = await sync_to_async(self._load)(user_id)
+            if entry is None:
+                return None
+            await self.backend.aset(user_id, entry)
+        else:
+            self.hits += 1
+        return self._build(entry)
+
+    def invalidate(self, user_id):
+        self.invalidations += 1
+        self.backend.delete(user_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else None,
+            "invalidations": self.invalidations,
+        }
+
+    def _load(self, user_id):
+        user = User.objects.select_related("profile").filter(pk=user_id).first()
+        if user is None:
+            return None
+        profile = getattr(user, "profile", None)
+        return (
+            user._state.db,
+            tuple(getattr(user, name) for name in _USER_FIELDS),
+            tuple(getattr(profile, name) for name in _PROFILE_FIELDS) if profile else None,
+        )
+
+    def _build(self, entry):
+        db, user_values, profile_values = entry
+        user = User.from_db(db, _USER_FIELDS, user_values)
+        if profile_values is not None:
+            profile = UserProfile.from_db(db, _PROFILE_FIELDS, profile_values)
+            profile.user = user
+            user.profile = profile
+        else:
+            # As select_related leaves it: ``user.profile`` raises without a query
+            User.profile.related.set_cached_value(user, None)
+        return user
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = settings.USER_CACHE
+                backend = import_string(config["BACKEND"])
+                _cache = UserCache(backend(**config.get("OPTIONS", {})))
+    return _cache
+
+
+def invalidate(user_id):
+    get_user_cache().invalidate(user_id)
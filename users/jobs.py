@@ -0,0 +1,21 @@
+from django.utils import timezone
+
+from jobs.queue import register
+
+from . import avatars
+from .cache import invalidate
+from .models import UserProfile
+
+AVATAR_THUMBNAILS = "users.avatar_thumbnails"
+
+
+@register(AVATAR_THUMBNAILS)
+def avatar_thumbnails(payload):
+    digest = payload["hash"]
+    sizes = avatars.render_thumbnails(digest, payload["ext"])
+    # Everyone using this image picks up the thumbnails, however many uploaded it
+    profiles = UserProfile.objects.filter(avatarHash=digest)
+    user_ids = list(profiles.values_list("user_id", flat=True))
+    profiles.update(avatarSizes=sizes, updatedAt=timezone.now())
+    for user_id in user_ids:
+        invalidate(user_id)
@@ -0,0 +1,148 @@
+import logging
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import bench
+from users.models import users_by_email
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed bench users (1M by default) and measure login: the email lookup before "
+        "and after the LOWER(email) index, then login throughput from concurrent "
+        "clients with the password check inline or in the PASSWORD_CHECKS pool, "
+        "together with the latency other requests see meanwhile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1_000_000)
+        parser.add_argument("--lookups", type=int, default=200)
+        parser.add_argument("--logins", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument(
+            "--pool-threads",
+            default="0,2",
+            help="PASSWORD_CHECKS THREADS values to compare (0 checks inline)",
+        )
+        parser.add_argument(
+            "--reuse",
+            action="store_true",
+            help="Benchmark the bench data left by a previous --keep run",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Do not delete the seeded data"
+        )
+
+    def handle(self, *args, **options):
+        if options["reuse"]:
+            user_ids = list(bench.bench_users().values_list("id", flat=True))
+        else:
+            user_ids = bench.seed_users(options["users"], stdout=self.stdout)
+        # Every login is over the request metrics' latency budget; don't log each one
+        logging.getLogger("core.metrics").setLevel(logging.ERROR)
+        sample = random.Random(0).sample(user_ids, min(1000, len(user_ids)))
+        emails = list(User.objects.filter(id__in=sample).values_list("email", flat=True))
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Email lookup, {len(user_ids)} users"))
+            self._lookups(emails, options["lookups"])
+            for threads in (int(t) for t in options["pool_threads"].split(",")):
+                self.stdout.write(
+                    self.style.MIGRATE_HEADING(f"Logins, PASSWORD_CHECKS THREADS={threads}")
+                )
+                with override_settings(
+                    PASSWORD_CHECKS={"THREADS": threads, "MAX_PENDING": options["logins"]},
+                    ALLOWED_HOSTS=["testserver"],
+                ):
+                    self._logins(emails, user_ids[0], options)
+        finally:
+            if not options["keep"]:
+                bench.cleanup(stdout=self.stdout)
+
+    def _lookups(self, emails, repeat):
+        rng = random.Random(1)
+        queries = [
+            (
+                "email = %s (no index)",
+                lambda: User.objects.get(email=rng.choice(emails)),
+                User.objects.filter(email=emails[0]),
+            ),
+            (
+                "LOWER(email) = LOWER(%s)",
+                lambda: users_by_email(rng.choice(emails).upper()).get(),
+                users_by_email(emails[0]),
+            ),
+        ]
+        for label, fn, queryset in queries:
+            plan = queryset.explain().replace("\n", "\n    ")
+            self.stdout.write(f"  plan for {label}:\n    {plan}")
+            self.stdout.write("  " + bench.format_summary(label, bench.measure(fn, repeat)))
+
+    def _logins(self, emails, probe_user_id, options):
+        remaining = list(emails * (options["logins"] // len(emails) + 1))[: options["logins"]]
+        lock = threading.Lock()
+        logins, other, failed = [], [], []
+        done = threading.Event()
+
+        def login_client():
+            client = Client()
+            try:
+                while True:
+                    with lock:
+                        if not remaining:
+                            return
+                        email = remaining.pop()
+                    started = time.perf_counter()
+                    response = client.post(
+                        reverse("login"),
+                        {"email": email, "password": bench.BENCH_PASSWORD},
+                        content_type="application/json",
+                    )
+                    if response.status_code == 200:
+                        logins.append(time.perf_counter() - started)
+                    else:
+                        failed.append(response.status_code)
+            finally:
+                connection.close()
+
+        def probe():
+            # A cheap authenticated read, standing in for everyone else's requests
+            token = AccessToken.for_user(User.objects.get(id=probe_user_id))
+            client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+            try:
+                while not done.is_set():
+                    started = time.perf_counter()
+                    client.get(reverse("current_user"))
+                    other.append(time.perf_counter() - started)
+                    time.sleep(0.01)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=login_client) for _ in range(options["concurrency"])
+        ]
+        prober = threading.Thread(target=probe)
+        started = time.perf_counter()
+        prober.start()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        prober.join()
+        self.stdout.write(
+            f"  {len(logins) / elapsed:.1f} logins/s over {elapsed:.1f}s "
+            f"({options['concurrency']} clients, {len(failed)} failed)"
+        )
+        if logins:
+            self.stdout.write("  " + bench.format_summary("login", logins))
+        if other:
+            self.stdout.write("  " + bench.format_summary("GET /api/users/me/ meanwhile", other))
@@ -0,0 +1,149 @@
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import bench
+from users import revocation
+from users.authentication import CachedJWTAuthentication
+from users.models import RevokedToken
+
+
+def random_jti(rng):
+    # What SimpleJWT uses: uuid4().hex
+    return f"{rng.getrandbits(128):032x}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed revoked tokens (10M by default) and measure what the revocation check "
+        "adds to authenticated requests: loading the Bloom filter and its size, a "
+        "check against it next to the exact query it saves, the poll, and "
+        "authentication and GET /api/users/me/ end to end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--revoked", type=int, default=10_000_000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--checks", type=int, default=100_000)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument(
+            "--reuse",
+            action="store_true",
+            help="Benchmark the bench data left by a previous --keep run",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Do not delete the seeded data"
+        )
+
+    def handle(self, *args, **options):
+        logging.getLogger("core.metrics").setLevel(logging.ERROR)
+        if options["reuse"]:
+            user_ids = list(bench.bench_users().values_list("id", flat=True))
+        else:
+            user_ids = bench.seed_users(options["users"], stdout=self.stdout)
+            self._seed_revoked(user_ids, options["revoked"])
+        try:
+            revoked = RevokedToken.objects.filter(user__in=bench.bench_users())
+            count = revoked.count()
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Revocation list, {count} revoked"))
+            revocations = self._load()
+            sample = list(revoked.values_list("jti", flat=True)[: options["checks"]])
+            self._checks(revocations, sample, options["checks"])
+            self.stdout.write(self.style.MIGRATE_HEADING("Authentication"))
+            with override_settings(ALLOWED_HOSTS=["testserver"]):
+                self._requests(user_ids[0], options["requests"])
+        finally:
+            if not options["keep"]:
+                deleted, _ = RevokedToken.objects.filter(user__in=bench.bench_users()).delete()
+                self.stdout.write(f"Removed {deleted} revoked tokens")
+                bench.cleanup(stdout=self.stdout)
+
+    def _seed_revoked(self, user_ids, count, batch_size=10000):
+        rng = random.Random(0)
+        now = timezone.now()
+        for offset in range(0, count, batch_size):
+            size = min(batch_size, count - offset)
+            with transaction.atomic():
+                RevokedToken.objects.bulk_create(
+                    [
+                        RevokedToken(
+                            jti=random_jti(rng),
+                            user_id=rng.choice(user_ids),
+                            expiresAt=now + timedelta(days=7),
+                            revokedAt=now - timedelta(seconds=rng.randint(60, 7 * 86400)),
+                        )
+                        for _ in range(size)
+                    ]
+                )
+            if (offset + size) % 1_000_000 == 0 or offset + size == count:
+                self.stdout.write(f"Seeded {offset + size}/{count} revoked tokens")
+
+    def _load(self):
+        revocations = revocation.RevocationList(settings.TOKEN_REVOCATION)
+        started = time.perf_counter()
+        revocations.sync()
+        elapsed = time.perf_counter() - started
+        stats = revocations.stats()
+        self.stdout.write(
+            f"  load: {elapsed:.1f}s for {stats['entries']} jtis, "
+            f"{stats['bytes'] / 2**20:.1f} MiB for capacity {stats['capacity']}"
+        )
+        poll = bench.measure(revocations.sync, 50)
+        self.stdout.write("  " + bench.format_summary("poll, nothing new", poll))
+        return revocations
+
+    def _checks(self, revocations, revoked, count):
+        rng = random.Random(1)
+        fresh = [random_jti(rng) for _ in range(count)]
+
+        def per_check(jtis, fn):
+            started = time.perf_counter()
+            hits = sum(fn(jti) for jti in jtis)
+            return (time.perf_counter() - started) / len(jtis) * 1e6, hits
+
+        bloom = revocations._filter
+        micros, hits = per_check(fresh, bloom.__contains__)
+        self.stdout.write(
+            f"  filter, not revoked: {micros:6.2f}µs per check, "
+            f"false positives {hits / len(fresh):.2%}"
+        )
+        micros, hits = per_check(revoked, bloom.__contains__)
+        self.stdout.write(f"  filter, revoked:     {micros:6.2f}µs per check, {hits} hits")
+        micros, _ = per_check(fresh, revocations.is_revoked)
+        self.stdout.write(f"  is_revoked, not revoked: {micros:6.2f}µs per check")
+        micros, _ = per_check(
+            fresh[:2000], lambda jti: RevokedToken.objects.filter(jti=jti).exists()
+        )
+        self.stdout.write(
+            f"  exact query (a database blacklist): {micros:6.2f}µs per check"
+        )
+
+    def _requests(self, user_id, repeat):
+        user = User.objects.get(id=user_id)
+        token = AccessToken.for_user(user)
+        revocation.get_revocation_list().sync()
+        authentication = CachedJWTAuthentication()
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        validated = authentication.get_validated_token(str(token).encode())
+        authentication.authenticate(request)  # Warm the user cache
+        for label, fn in [
+            ("revocation check", lambda: revocation.is_token_revoked(validated, user)),
+            ("CachedJWTAuthentication", lambda: authentication.authenticate(request)),
+        ]:
+            self.stdout.write("  " + bench.format_summary(label, bench.measure(fn, repeat)))
+
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+        url = reverse("current_user")
+        client.get(url)
+        samples = bench.measure(lambda: client.get(url), repeat)
+        self.stdout.write("  " + bench.format_summary("GET me/", samples))
@@ -0,0 +1,135 @@
+import logging
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import bench
+from users import search
+
+SYLLABLES = ["al", "an", "bo", "ca", "da", "el", "fi", "ga", "ha", "is", "jo", "ka",
+             "li", "ma", "no", "ol", "pe", "ra", "sa", "te", "ul", "vi", "wy", "zo"]
+
+
+def make_name(rng, i):
+    def word(parts):
+        return "".join(rng.choice(SYLLABLES) for _ in range(parts)).capitalize()
+
+    return f"{word(rng.randint(2, 3))} {word(rng.randint(2, 4))}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed bench users (1M by default) with varied names and measure typeahead "
+        "search: the unindexed scan against the database's prefix index, then "
+        "GET /api/users/search with and without the result cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1_000_000)
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument(
+            "--scan-queries",
+            type=int,
+            default=20,
+            help="Queries for the unindexed baseline, which takes seconds each at 1M",
+        )
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument(
+            "--reuse",
+            action="store_true",
+            help="Benchmark the bench data left by a previous --keep run",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Do not delete the seeded data"
+        )
+
+    def handle(self, *args, **options):
+        if options["reuse"]:
+            user_ids = list(bench.bench_users().values_list("id", flat=True))
+        else:
+            user_ids = bench.seed_users(options["users"], stdout=self.stdout, name=make_name)
+        logging.getLogger("core.metrics").setLevel(logging.ERROR)
+        try:
+            queries = self._queries(user_ids, options["queries"])
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(f"Search backends, {len(user_ids)} users")
+            )
+            self._backends(queries, options)
+            self.stdout.write(self.style.MIGRATE_HEADING("GET /api/users/search"))
+            with override_settings(ALLOWED_HOSTS=["testserver"]):
+                self._requests(queries, user_ids[0], options)
+        finally:
+            if not options["keep"]:
+                bench.cleanup(stdout=self.stdout)
+
+    def _queries(self, user_ids, count):
+        """What a typeahead sends: one to a few letters, a name and a surname start."""
+        rng = random.Random(1)
+        sample = rng.sample(user_ids, min(count, len(user_ids)))
+        users = User.objects.filter(id__in=sample).select_related("profile")
+        queries = []
+        for user in users:
+            first, last = user.profile.name.lower().split()
+            queries += [
+                first[: rng.randint(1, 3)],
+                first[: rng.randint(3, len(first))],
+                f"{first} {last[: rng.randint(1, 3)]}",
+                user.email[: rng.randint(5, 8)],
+            ]
+        rng.shuffle(queries)
+        return queries[:count]
+
+    def _backends(self, queries, options):
+        rng = random.Random(2)
+        limit = options["limit"] + 1
+        for label, backend, count in [
+            ("istartswith scan", search.IStartsWithUserSearch(), options["scan_queries"]),
+            (type(search.get_user_search_backend()).__name__, search.get_user_search_backend(),
+             len(queries)),
+        ]:
+            sample = queries[:count]
+            first = bench.measure(
+                lambda: backend.ids(search.query_terms(rng.choice(sample)), 0, limit),
+                count,
+            )
+            self.stdout.write("  " + bench.format_summary(f"{label}, first page", first))
+
+            def next_page():
+                terms = search.query_terms(rng.choice(sample))
+                page = backend.ids(terms, 0, limit)
+                if len(page) == limit:
+                    backend.ids(terms, page[-2], limit)
+
+            pages = bench.measure(next_page, count)
+            self.stdout.write("  " + bench.format_summary(f"{label}, two pages", pages))
+
+    def _requests(self, queries, probe_user_id, options):
+        token = AccessToken.for_user(User.objects.get(id=probe_user_id))
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+        rng = random.Random(3)
+        url = reverse("user_search")
+
+        def request(query):
+            response = client.get(url, {"q": query, "limit": options["limit"]})
+            assert response.status_code == 200, response.content
+
+        def cold():
+            search.get_result_cache().clear()
+            request(rng.choice(queries))
+
+        client.get(reverse("current_user"))  # Warm the user cache
+        self.stdout.write(
+            "  " + bench.format_summary("uncached", bench.measure(cold, len(queries)))
+        )
+        # Typeaheads repeat the short prefixes most: a skewed draw from the queries
+        popular = queries[: max(1, len(queries) // 10)]
+        search.get_result_cache().clear()
+        samples = bench.measure(
+            lambda: request(rng.choice(popular if rng.random() < 0.7 else queries)),
+            len(queries),
+        )
+        self.stdout.write("  " + bench.format_summary("through the result cache", samples))
@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from users.models import UserProfile
+
+BOT_EMAILS = [
+    "alice@example.com",
+    "bob@example.com",
+    "charlie@example.com",
+    "dave@example.com",
+    "eve@example.com",
+]
+
+BOT_PASSWORD = "testpass"
+
+
+class Command(BaseCommand):
+    help = "Create the bot users that auto-reply to messages (testing only)"
+
+    def handle(self, *args, **options):
+        for email in BOT_EMAILS:
+            name = email.split("@")[0].capitalize()
+            user, created = User.objects.get_or_create(
+                username=email, defaults={"email": email, "first_name": name}
+            )
+            if created:
+                user.set_password(BOT_PASSWORD)
+                user.save()
+                UserProfile.objects.create(
+                    user=user, name=name, gender="other", dob="2000-01-01"
+                )
+                self.stdout.write(self.style.SUCCESS(f"Created bot user {email}"))
+            else:
+                self.stdout.write(f"Bot user {email} already exists")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete revoked tokens that have expired anyway, in batches. Expired rows are "
+        "never loaded into the revocation filter, but they fill the table; run it "
+        "e.g. nightly from cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=10000, help="Rows deleted per query"
+        )
+
+    def handle(self, *args, **options):
+        expired = RevokedToken.objects.filter(expiresAt__lte=timezone.now())
+        deleted = 0
+        while ids := list(expired.values_list("id", flat=True)[: options["batch_size"]]):
+            deleted += RevokedToken.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(f"Deleted {deleted} expired revoked tokens")
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="avatarHash",
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="avatarSizes",
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
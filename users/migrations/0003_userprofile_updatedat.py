@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0002_avatar_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="updatedAt",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import Lower
+
+# As users.models.EMAIL_KEY_CONSTRAINT was when this migration was written
+EMAIL_KEY_CONSTRAINT = models.UniqueConstraint(
+    Lower("email"), condition=~Q(email=""), name="users_auth_user_email_lower_uniq"
+)
+
+
+def add_constraint(apps, schema_editor):
+    # auth.User belongs to another app, so its constraint can't be declared on the
+    # model; create it with the schema editor instead.
+    User = apps.get_model("auth", "User")
+    duplicates = list(
+        User.objects.using(schema_editor.connection.alias)
+        .exclude(email="")
+        .values(email_key=Lower("email"))
+        .annotate(users=Count("id"))
+        .filter(users__gt=1)
+        .values_list("email_key", flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Several users share these emails (ignoring case); change or remove all "
+            f"but one of each before migrating: {', '.join(duplicates)}"
+        )
+    schema_editor.add_constraint(User, EMAIL_KEY_CONSTRAINT)
+
+
+def remove_constraint(apps, schema_editor):
+    schema_editor.remove_constraint(apps.get_model("auth", "User"), EMAIL_KEY_CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_userprofile_updatedat"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(add_constraint, remove_constraint, elidable=False),
+    ]
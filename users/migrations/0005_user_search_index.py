@@ -0,0 +1,84 @@
+from django.db import migrations
+
+from core.schema import run_sql
+from users.search import SQLITE_PROFILE_TRIGGERS
+
+# Prefix index over profile names and emails, queried by users.search. The database
+# keeps it current as users and profiles change.
+#
+# On SQLite the triggers belong to auth_user and users_userprofile: a later migration
+# that makes Django rebuild either table (rather than ALTER it in place) drops them
+# and must recreate them; users_userprofile's are users.search.SQLITE_PROFILE_TRIGGERS.
+
+# SQLite keeps its own copy of name and email in an FTS5 table keyed by user id; a user
+# without a profile is indexed with an empty name. A prefix query of up to eight
+# characters reads one prefix index entry. Longer ones merge every word that starts
+# with them, which is few by then, but at four or five characters that can be a
+# hundred thousand words ("user1", "user2"... emails) and tens of milliseconds.
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE users_search_fts USING fts5(
+        name,
+        email,
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='1 2 3 4 5 6 7 8'
+    )
+    """,
+    """
+    INSERT INTO users_search_fts(rowid, name, email)
+    SELECT auth_user.id, COALESCE(users_userprofile.name, ''), auth_user.email
+    FROM auth_user LEFT JOIN users_userprofile ON users_userprofile.user_id = auth_user.id
+    """,
+    """
+    CREATE TRIGGER users_search_fts_user_insert AFTER INSERT ON auth_user BEGIN
+        INSERT INTO users_search_fts(rowid, name, email) VALUES (new.id, '', new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER users_search_fts_user_update AFTER UPDATE OF email ON auth_user BEGIN
+        UPDATE users_search_fts SET email = new.email WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER users_search_fts_user_delete AFTER DELETE ON auth_user BEGIN
+        DELETE FROM users_search_fts WHERE rowid = old.id;
+    END
+    """,
+    *SQLITE_PROFILE_TRIGGERS,
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS users_search_fts_profile_delete",
+    "DROP TRIGGER IF EXISTS users_search_fts_profile_update",
+    "DROP TRIGGER IF EXISTS users_search_fts_profile_insert",
+    "DROP TRIGGER IF EXISTS users_search_fts_user_delete",
+    "DROP TRIGGER IF EXISTS users_search_fts_user_update",
+    "DROP TRIGGER IF EXISTS users_search_fts_user_insert",
+    "DROP TABLE IF EXISTS users_search_fts",
+]
+
+# The LOWER(email) index from 0004 follows the database collation, which LIKE 'x%'
+# can't seek outside the C locale; text_pattern_ops can.
+POSTGRES_INSTALL = [
+    "CREATE INDEX users_profile_name_search ON users_userprofile "
+    "USING GIN (to_tsvector('simple', name))",
+    "CREATE INDEX users_auth_user_email_prefix ON auth_user "
+    "(LOWER(email) text_pattern_ops)",
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS users_auth_user_email_prefix",
+    "DROP INDEX IF EXISTS users_profile_name_search",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_email_lower_unique"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_sql({"sqlite": SQLITE_INSTALL, "postgresql": POSTGRES_INSTALL}),
+            run_sql({"sqlite": SQLITE_UNINSTALL, "postgresql": POSTGRES_UNINSTALL}),
+        ),
+    ]
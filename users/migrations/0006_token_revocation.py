@@ -0,0 +1,61 @@
+# Generated by Django 5.1.7 on 2026-10-18 11:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+from core.schema import run_sql
+from users.search import SQLITE_PROFILE_TRIGGERS
+
+# Adding or removing a column rebuilds users_userprofile on SQLite, which drops the
+# search index triggers that 0005 put on it
+restore_triggers = run_sql({"sqlite": SQLITE_PROFILE_TRIGGERS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_user_search_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_triggers),
+        migrations.AddField(
+            model_name="userprofile",
+            name="tokenVersion",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="RevokedToken",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("jti", models.CharField(max_length=255, null=True, unique=True)),
+                ("expiresAt", models.DateTimeField(db_index=True)),
+                (
+                    "revokedAt",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -1,7 +1,23 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Q, Value
+from django.db.models.functions import Lower
+from django.utils import timezone
 
-# Create your models here.
+# Emails are unique ignoring case (migration 0004 adds this to auth_user), and every
+# lookup by email goes through ``users_by_email`` so it can use the index. Email is
+# optional for Django users (createsuperuser, the admin), so blank ones may repeat.
+EMAIL_KEY_CONSTRAINT = models.UniqueConstraint(
+    Lower("email"), condition=~Q(email=""), name="users_auth_user_email_lower_uniq"
+)
+
+
+def users_by_email(email):
+    """Users whose email matches ``email`` ignoring case: at most one, none if blank."""
+    # The index only covers non-blank emails, so the query must say so to use it
+    return User.objects.alias(email_key=Lower("email")).filter(
+        ~Q(email=""), email_key=Lower(Value(email))
+    )
 
 
 class UserProfile(models.Model):
@@ -14,7 +30,27 @@ class UserProfile(models.Model):
     dob = models.DateField()
     createdAt = models.DateTimeField(auto_now_add=True)
     avatarUrl = models.URLField(blank=True, null=True)
+    # Set for uploaded avatars (users.avatars): content hash and ready thumbnail sizes
+    avatarHash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    avatarSizes = models.JSONField(default=list, blank=True)
     avatarColor = models.CharField(max_length=16, blank=True, null=True)
+    # Any change to what user_data shows; validates cached inbox responses (chats)
+    updatedAt = models.DateTimeField(auto_now=True)
+    # Bumped to sign out every session; tokens carry the version they were issued at
+    # (users.revocation)
+    tokenVersion = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
+
+
+class RevokedToken(models.Model):
+    """
+    A revoked token (logout), kept until it would have expired anyway. A row without a
+    ``jti`` records a revoke-all of ``user``'s sessions so other processes hear of it.
+    """
+
+    jti = models.CharField(max_length=255, unique=True, null=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    expiresAt = models.DateTimeField(db_index=True)
+    revokedAt = models.DateTimeField(default=timezone.now, db_index=True)
@@ -0,0 +1,74 @@
+"""
+Password checks for logins, optionally in a bounded thread pool.
+
+A PBKDF2 check is tens of milliseconds of CPU or more, and it runs with the GIL
+released. Under ASGI each sync request gets its own thread, so a burst of logins
+hashes on every core at once and the requests around them wait for CPU. With
+``PASSWORD_CHECKS["THREADS"]`` set, checks run in a pool of that many threads, so
+no more than that many hash at a time. Past ``MAX_PENDING`` queued or running
+checks, logins are turned away with ``PasswordChecksBusy`` (a 503) instead of
+queueing without bound.
+
+Only the hash runs in the pool. Upgrading a stored hash (after a hasher or
+iteration count change) is saved from the caller's thread and connection.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import verify_password
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class PasswordChecksBusy(Exception):
+    pass
+
+
+_lock = threading.Lock()
+_pool = None
+_slots = None
+
+
+def _get_pool():
+    """``(pool, slots)``, or ``(None, None)`` when checks run inline."""
+    global _pool, _slots
+    threads = settings.PASSWORD_CHECKS["THREADS"]
+    if not threads:
+        return None, None
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(threads, thread_name_prefix="password-check")
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_CHECKS["MAX_PENDING"])
+        return _pool, _slots
+
+
+@receiver(setting_changed)
+def _reset_pool(setting, **kwargs):
+    global _pool
+    if setting == "PASSWORD_CHECKS":
+        with _lock:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = None
+
+
+def check_password(user, raw_password):
+    """``user.check_password(raw_password)``, hashing in the pool when one is set."""
+    pool, slots = _get_pool()
+    if pool is None:
+        return user.check_password(raw_password)
+    if not slots.acquire(blocking=False):
+        raise PasswordChecksBusy
+    try:
+        future = pool.submit(verify_password, raw_password, user.password)
+        is_correct, must_update = future.result()
+    finally:
+        slots.release()
+    if is_correct and must_update:
+        # As AbstractBaseUser.check_password does: not a password change
+        user.set_password(raw_password)
+        user._password = None
+        user.save(update_fields=["password"])
+    return is_correct
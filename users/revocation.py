@@ -0,0 +1,257 @@
+"""
+Token revocation: logout revokes a token until it expires, and revoking all of a user's
+sessions invalidates every token issued to them so far.
+
+Revoked tokens are rows of ``RevokedToken``, but requests don't query the table. Each
+process keeps the revoked ``jti``s in a Bloom filter (``core.bloom``), so checking a
+token that was never revoked, which is nearly every request, costs a hash and no I/O.
+A filter hit is confirmed with an exact query, so false positives only cost that query.
+Revocations made in this process go straight into the filter; other processes pick them
+up within ``TOKEN_REVOCATION["POLL_INTERVAL"]`` seconds, when a request finds the poll
+due and reads the rows revoked since the last one. Every ``REBUILD_INTERVAL`` (or once
+the filter fills up) it is rebuilt from the unexpired rows: inline when the table is
+small, otherwise in a thread while requests keep using the old filter, or the exact
+query until there is one.
+
+Revoking all sessions bumps ``UserProfile.tokenVersion``. Tokens from login carry the
+version they were issued at (tokens without it count as version 0), and the profile
+comes from the user cache, so that check is free as well. The bump is also written as a
+``RevokedToken`` row without a ``jti``, which tells other processes to drop the user
+from their user cache.
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, transaction
+from django.db.models import F, Max, Min
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from core.bloom import BloomFilter
+
+from .cache import invalidate
+from .models import RevokedToken, UserProfile
+
+logger = logging.getLogger(__name__)
+
+VERSION_CLAIM = "ver"
+
+
+def token_version(user):
+    profile = getattr(user, "profile", None)
+    return profile.tokenVersion if profile is not None else 0
+
+
+class RevocationList:
+    def __init__(self, config):
+        self.config = config
+        self._filter = None
+        self._loading = False
+        self._next_poll = 0.0
+        self._next_rebuild = 0.0
+        self._poll_from = None
+        # Rows handled by the last poll; polls overlap so late commits aren't missed
+        self._seen = set()
+        # Held while refreshing; requests never wait for it
+        self._lock = threading.Lock()
+        # Held while setting bits, which isn't atomic
+        self._add_lock = threading.Lock()
+
+    def is_revoked(self, jti):
+        if self._due():
+            self._refresh()
+        bloom = self._filter
+        if bloom is not None and jti not in bloom:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    async def ais_revoked(self, jti):
+        bloom = self._filter
+        if bloom is not None and not self._due() and jti not in bloom:
+            return False
+        return await sync_to_async(self.is_revoked)(jti)
+
+    def add(self, jti):
+        """Put a jti revoked by this process in the filter without waiting for a poll."""
+        bloom = self._filter
+        if bloom is not None:
+            with self._add_lock:
+                bloom.add(jti)
+
+    def sync(self):
+        """Load the filter if there is none and poll now, waiting for the lock."""
+        with self._lock:
+            if self._filter is None:
+                self._rebuild(inline=True)
+            else:
+                self._poll()
+
+    def stats(self):
+        bloom = self._filter
+        return {
+            "loaded": bloom is not None,
+            "entries": len(bloom) if bloom is not None else 0,
+            "capacity": bloom.capacity if bloom is not None else 0,
+            "bytes": len(bloom.bits) if bloom is not None else 0,
+        }
+
+    def _due(self):
+        return self._filter is None or time.monotonic() >= self._next_poll
+
+    def _refresh(self):
+        if not self._lock.acquire(blocking=False):
+            return  # Another thread is on it; go with the filter as it is
+        try:
+            bloom = self._filter
+            if not self._loading and (
+                bloom is None
+                or time.monotonic() >= self._next_rebuild
+                or len(bloom) > bloom.capacity
+            ):
+                self._rebuild()
+            elif bloom is not None and time.monotonic() >= self._next_poll:
+                self._poll()
+        finally:
+            self._lock.release()
+
+    def _rebuild(self, inline=False):
+        # An upper bound: it includes expired and revoke-all rows
+        ids = RevokedToken.objects.aggregate(low=Min("id"), high=Max("id"))
+        estimate = ids["high"] - ids["low"] + 1 if ids["high"] is not None else 0
+        if inline or estimate <= self.config["INLINE_LOAD_MAX"]:
+            self._install(*self._load(estimate))
+            self._poll()
+            return
+        self._loading = True
+        threading.Thread(
+            target=self._load_in_background,
+            args=(estimate,),
+            name="token-revocations",
+            daemon=True,
+        ).start()
+        if self._filter is not None:
+            self._poll()
+
+    def _load(self, estimate):
+        started = timezone.now()
+        bloom = BloomFilter(
+            max(self.config["MIN_CAPACITY"], 2 * estimate),
+            self.config["FALSE_POSITIVE_RATE"],
+        )
+        jtis = RevokedToken.objects.filter(
+            jti__isnull=False, expiresAt__gt=started
+        ).values_list("jti", flat=True)
+        bloom.update(jtis.iterator(chunk_size=10000))
+        return bloom, started
+
+    def _load_in_background(self, estimate):
+        try:
+            bloom, started = self._load(estimate)
+            with self._lock:
+                self._install(bloom, started)
+                # Catch up on what was revoked while loading on the next request
+                self._next_poll = 0.0
+        except Exception:
+            logger.exception("Loading the token revocation list failed")
+        finally:
+            self._loading = False
+            connections.close_all()
+
+    def _install(self, bloom, started):
+        self._filter = bloom
+        self._poll_from = started - timedelta(seconds=self.config["POLL_INTERVAL"])
+        self._seen = set()
+        self._next_rebuild = time.monotonic() + self.config["REBUILD_INTERVAL"]
+
+    def _poll(self):
+        started = timezone.now()
+        rows = list(
+            RevokedToken.objects.filter(revokedAt__gte=self._poll_from).values_list(
+                "id", "jti", "user_id"
+            )
+        )
+        with self._add_lock:
+            for row_id, jti, user_id in rows:
+                if row_id in self._seen:
+                    continue
+                if jti is None:
+                    invalidate(user_id)
+                else:
+                    self._filter.add(jti)
+        self._seen = {row[0] for row in rows}
+        self._poll_from = started - timedelta(seconds=self.config["POLL_INTERVAL"])
+        self._next_poll = time.monotonic() + self.config["POLL_INTERVAL"]
+
+
+_list = None
+_list_lock = threading.Lock()
+
+
+def get_revocation_list():
+    global _list
+    if _list is None:
+        with _list_lock:
+            if _list is None:
+                _list = RevocationList(settings.TOKEN_REVOCATION)
+    return _list
+
+
+@receiver(setting_changed)
+def _reset_list(setting, **kwargs):
+    global _list
+    if setting == "TOKEN_REVOCATION":
+        _list = None
+
+
+def is_token_revoked(token, user):
+    """True if ``token`` (validated, belonging to ``user``) was revoked."""
+    if token.get(VERSION_CLAIM, 0) != token_version(user):
+        return True
+    return get_revocation_list().is_revoked(token[api_settings.JTI_CLAIM])
+
+
+async def ais_token_revoked(token, user):
+    if token.get(VERSION_CLAIM, 0) != token_version(user):
+        return True
+    return await get_revocation_list().ais_revoked(token[api_settings.JTI_CLAIM])
+
+
+def revoke_tokens(user, tokens):
+    """Revoke validated tokens of ``user``; revoking one twice is fine."""
+    RevokedToken.objects.bulk_create(
+        [
+            RevokedToken(
+                jti=token[api_settings.JTI_CLAIM],
+                user=user,
+                expiresAt=datetime_from_epoch(token["exp"]),
+            )
+            for token in tokens
+        ],
+        ignore_conflicts=True,
+    )
+    revocations = get_revocation_list()
+    for token in tokens:
+        revocations.add(token[api_settings.JTI_CLAIM])
+
+
+def revoke_all(user):
+    """
+    Revoke every token issued to ``user`` so far. The version lives on the profile,
+    so this does nothing for users without one (accounts made outside the API).
+    """
+    with transaction.atomic():
+        UserProfile.objects.filter(user=user).update(tokenVersion=F("tokenVersion") + 1)
+        # No token outlives a refresh token issued now
+        RevokedToken.objects.create(
+            user=user,
+            expiresAt=timezone.now() + api_settings.REFRESH_TOKEN_LIFETIME,
+        )
+    invalidate(user.id)
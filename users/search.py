@@ -0,0 +1,168 @@
+"""
+Typeahead search over the user directory: every word of the query must start a word of
+the user's profile name or email (``ali sm`` finds "Alice Smith", ``alice.t`` finds
+alice.test@example.com).
+
+Like message search (``chats.search``) the index lives in the database and triggers
+keep it current. On SQLite it is an FTS5 table with prefix indexes for the first one to
+eight characters, which covers what a typeahead sends. Results come in user id
+order, so a page is a keyset (``after`` the last id) that the index walks and stops
+after ``limit`` rows, however many users match. PostgreSQL uses a GIN index on names
+and a prefix index on emails; other databases fall back to an unindexed scan.
+
+Pages of ids are cached per query for ``USER_SEARCH["CACHE"]["ttl"]`` seconds, so a new
+or renamed user can take that long to show up under a popular prefix.
+"""
+
+import re
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection as default_connection
+from django.db.models import Q
+from django.dispatch import receiver
+
+from users.cache import LocMemLRUBackend
+
+# The SQLite index's triggers on users_userprofile (migration 0005). Django drops them
+# whenever a migration rebuilds that table rather than ALTERing it in place; such
+# migrations run these again afterwards. Kept in one place so they cannot drift.
+SQLITE_PROFILE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS users_search_fts_profile_delete",
+    "DROP TRIGGER IF EXISTS users_search_fts_profile_update",
+    "DROP TRIGGER IF EXISTS users_search_fts_profile_insert",
+    """
+    CREATE TRIGGER users_search_fts_profile_insert AFTER INSERT ON users_userprofile BEGIN
+        UPDATE users_search_fts SET name = new.name WHERE rowid = new.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER users_search_fts_profile_update
+    AFTER UPDATE OF name, user_id ON users_userprofile BEGIN
+        UPDATE users_search_fts SET name = '' WHERE rowid = old.user_id;
+        UPDATE users_search_fts SET name = new.name WHERE rowid = new.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER users_search_fts_profile_delete AFTER DELETE ON users_userprofile BEGIN
+        UPDATE users_search_fts SET name = '' WHERE rowid = old.user_id;
+    END
+    """,
+]
+
+_TERM_RE = re.compile(r"\w+")
+
+
+def query_terms(query):
+    """Lowercased word terms of user input; search syntax is never passed through."""
+    return [term.lower() for term in _TERM_RE.findall(query or "")]
+
+
+class UserSearchBackend:
+    """``ids`` returns up to ``limit`` matching user ids above ``after``, ascending."""
+
+    def __init__(self, connection=None):
+        self.connection = connection or default_connection
+
+    def ids(self, terms, after, limit):
+        raise NotImplementedError
+
+    def _fetch(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SQLiteFTS5UserSearch(UserSearchBackend):
+    """FTS5 table keyed by user id over name and email (migration 0005)."""
+
+    table = "users_search_fts"
+
+    def ids(self, terms, after, limit):
+        match = " ".join(f'"{term}"*' for term in terms)
+        return self._fetch(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+            f"AND rowid > %s ORDER BY rowid LIMIT %s",
+            [match, after, limit],
+        )
+
+
+class PostgresUserSearch(UserSearchBackend):
+    """
+    GIN index on ``to_tsvector('simple', name)`` for names, and a ``LOWER(email)
+    text_pattern_ops`` index for emails (migration 0005). Emails match from their
+    start: the first term through the index, the rest anywhere after it.
+    """
+
+    config = "simple"
+
+    def ids(self, terms, after, limit):
+        tsquery = " & ".join(f"'{term}':*" for term in terms)
+        # \w terms can still hold LIKE's "_" wildcard
+        like = [term.replace("_", r"\_") for term in terms]
+        email_sql = " AND ".join(["LOWER(email) LIKE %s"] * len(terms))
+        email_params = [like[0] + "%"] + [f"%{term}%" for term in like[1:]]
+        return self._fetch(
+            "SELECT id FROM ("
+            "  SELECT user_id AS id FROM users_userprofile"
+            "  WHERE to_tsvector(%s, name) @@ to_tsquery(%s, %s) AND user_id > %s"
+            "  UNION"
+            f"  SELECT id FROM auth_user WHERE {email_sql} AND id > %s"
+            ") matches ORDER BY id LIMIT %s",
+            [self.config, self.config, tsquery, after, *email_params, after, limit],
+        )
+
+
+class IStartsWithUserSearch(UserSearchBackend):
+    """Unindexed fallback (and the benchmark baseline): name or email prefix scans."""
+
+    def ids(self, terms, after, limit):
+        from django.contrib.auth.models import User
+
+        users = User.objects.using(self.connection.alias).filter(id__gt=after)
+        for term in terms:
+            users = users.filter(
+                Q(profile__name__istartswith=term)
+                | Q(profile__name__icontains=f" {term}")
+                | Q(email__istartswith=term)
+            )
+        return list(users.order_by("id").values_list("id", flat=True)[:limit])
+
+
+BACKENDS = {
+    "sqlite": SQLiteFTS5UserSearch,
+    "postgresql": PostgresUserSearch,
+}
+
+
+def get_user_search_backend(connection=None):
+    connection = connection or default_connection
+    return BACKENDS.get(connection.vendor, IStartsWithUserSearch)(connection)
+
+
+_cache = None
+
+
+def get_result_cache():
+    global _cache
+    if _cache is None:
+        _cache = LocMemLRUBackend(**settings.USER_SEARCH["CACHE"])
+    return _cache
+
+
+@receiver(setting_changed)
+def _reset_cache(setting, **kwargs):
+    global _cache
+    if setting == "USER_SEARCH":
+        _cache = None
+
+
+def search_user_ids(terms, after=0, limit=20):
+    """Ids of the page of matches after ``after``, through the per-query cache."""
+    key = (tuple(terms), after, limit)
+    cache = get_result_cache()
+    ids = cache.get(key)
+    if ids is None:
+        ids = get_user_search_backend().ids(terms, after, limit)
+        cache.set(key, ids)
+    return ids
@@ -1,13 +1,56 @@
+from django.conf import settings
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
+                                                  TokenRefreshSerializer)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import UserProfile
+from core.serialization import format_date, format_datetime
+
+from . import avatars
+from .cache import get_user_cache
+from .models import UserProfile, users_by_email
+from .revocation import VERSION_CLAIM, is_token_revoked, token_version
 
 
 class EmailTokenObtainPairSerializer(TokenObtainPairSerializer):
     username_field = "email"  # this is used in validation error messages
 
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        # Revoking all sessions bumps the version; the access token copies the claim
+        token[VERSION_CLAIM] = token_version(user)
+        return token
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses refresh tokens revoked by logout or revoke-all (users.revocation)."""
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs["refresh"])
+        user = get_user_cache().get_user(refresh.get(api_settings.USER_ID_CLAIM))
+        if user is not None and is_token_revoked(refresh, user):
+            raise InvalidToken("Token has been revoked")
+        return super().validate(attrs)
+
+
+def avatar_url(profile, request=None):
+    url = profile.avatarUrl
+    if url and request:
+        # Serve the thumbnail the client asked for once the job has rendered it
+        if profile.avatarSizes:
+            requested = avatars.requested_size(request)
+            size = avatars.pick_size(requested, profile.avatarSizes) if requested else None
+            if size:
+                url = settings.MEDIA_URL + avatars.variant_name(profile.avatarHash, size)
+        if url.startswith('http://') or url.startswith('https://'):
+            return url
+        return request.build_absolute_uri(url)
+    return url
+
 
 class UserProfileSerializer(serializers.ModelSerializer):
     avatarUrl = serializers.SerializerMethodField()
@@ -18,12 +61,28 @@ class UserProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ["createdAt"]
 
     def get_avatarUrl(self, obj):
-        request = self.context.get('request')
-        if obj.avatarUrl and request:
-            if obj.avatarUrl.startswith('http://') or obj.avatarUrl.startswith('https://'):
-                return obj.avatarUrl
-            return request.build_absolute_uri(obj.avatarUrl)
-        return obj.avatarUrl
+        return avatar_url(obj, self.context.get('request'))
+
+
+def profile_data(profile, request=None, tz=None):
+    """``UserProfileSerializer(profile).data`` without DRF's per-field machinery."""
+    return {
+        "name": profile.name,
+        "gender": profile.gender,
+        "dob": format_date(profile.dob),
+        "createdAt": format_datetime(profile.createdAt, tz),
+        "avatarUrl": avatar_url(profile, request),
+        "avatarColor": profile.avatarColor,
+    }
+
+
+def user_data(user, request=None, tz=None):
+    """``UserSerializer(user).data`` for reads; ``user.profile`` should be preloaded."""
+    return {
+        "id": user.pk,
+        "email": user.email,
+        "profile": profile_data(user.profile, request, tz),
+    }
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -40,6 +99,14 @@ class UserSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id"]
 
+    def validate_email(self, value):
+        others = users_by_email(value)
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError("Email already exists")
+        return value
+
     def update(self, instance, validated_data):
         profile_data = validated_data.pop('profile', {})
         # Update User fields
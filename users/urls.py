@@ -1,14 +1,23 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
 
-from .views import (AvatarUploadView, CurrentUserView, LoginView, RegisterView,
-                    UserByEmailView)
+from . import async_views, views
+from .views import (AvatarUploadView, LoginView, LogoutView, RegisterView,
+                    RevokeSessionsView, UserByEmailView, UserCacheStatsView,
+                    UserSearchView)
+
+api = async_views if settings.ASYNC_API_VIEWS else views
 
 urlpatterns = [
-    path("me/", CurrentUserView.as_view(), name="current_user"),
+    path("me/", api.CurrentUserView.as_view(), name="current_user"),
     path("me/avatar", AvatarUploadView.as_view(), name="upload_avatar"),
     path("register/", RegisterView.as_view(), name="register"),
     path("login/", LoginView.as_view(), name="login"),
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("logout/", LogoutView.as_view(), name="logout"),
+    path("sessions/revoke/", RevokeSessionsView.as_view(), name="revoke_sessions"),
+    path("search", UserSearchView.as_view(), name="user_search"),
     path("search/<str:email>/", UserByEmailView.as_view(), name="user_by_email"),
+    path("cache/stats/", UserCacheStatsView.as_view(), name="user_cache_stats"),
 ]
@@ -1,61 +1,112 @@
-import os
+import logging
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from .models import UserProfile
+from core import routers
+from jobs.queue import QueueFull, enqueue
+from uploads.pipeline import (KINDS, UploadRejected, get_purpose, receive_file,
+                              store_by_hash)
+
+from . import avatars
+from .cache import get_user_cache, invalidate
+from .jobs import AVATAR_THUMBNAILS
+from .models import UserProfile, users_by_email
+from .passwords import PasswordChecksBusy
+from .revocation import revoke_all, revoke_tokens
+from .search import query_terms, search_user_ids
 from rest_framework_simplejwt.tokens import AccessToken
 from .serializers import (EmailTokenObtainPairSerializer,
-                          UserRegisterRequestSerializer, UserSerializer)
+                          UserRegisterRequestSerializer, UserSerializer,
+                          user_data)
+
+logger = logging.getLogger(__name__)
+
+
+def update_user(request):
+    """Apply a partial update of the requesting user; returns the validated serializer."""
+    # request.user may come from the user cache; edit the current row instead
+    user = User.objects.select_related("profile").get(pk=request.user.pk)
+    serializer = UserSerializer(user, data=request.data, partial=True, context={"request": request})
+    if serializer.is_valid():
+        serializer.save()
+        invalidate(request.user.id)
+        routers.remember_write(request.user.id)
+    return serializer
 
 
 class CurrentUserView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user, context={"request": request})
-        return Response(serializer.data)
+        return Response(user_data(request.user, request))
 
     def put(self, request):
-        serializer = UserSerializer(request.user, data=request.data, partial=True, context={"request": request})
+        serializer = update_user(request)
         if serializer.is_valid():
-            serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def finish_avatar_upload(request, path, kind, filename):
+    """Upload finisher for the "avatar" purpose: make the file the user's avatar."""
+    # Stored under its content hash; the same image is only ever stored once
+    digest = store_by_hash(path, "avatars", kind)
+    ext = KINDS[kind][0]
+    absolute_url = request.build_absolute_uri(
+        settings.MEDIA_URL + avatars.original_name(digest, ext)
+    )
+    # Update the user's profile model with the new avatar URL
+    profile = request.user.profile
+    profile.avatarUrl = absolute_url
+    profile.avatarHash = digest
+    profile.avatarSizes = avatars.ready_sizes(digest)
+    profile.save(update_fields=["avatarUrl", "avatarHash", "avatarSizes", "updatedAt"])
+    invalidate(request.user.id)
+    routers.remember_write(request.user.id)
+    if len(profile.avatarSizes) < len(avatars.SIZES):
+        try:
+            enqueue(AVATAR_THUMBNAILS, {"hash": digest, "ext": ext})
+        except QueueFull:
+            logger.warning("Job queue is full, no thumbnails for avatar %s", digest)
+    data = {
+        "avatarUrl": absolute_url,
+        "avatarUrls": {
+            size: request.build_absolute_uri(
+                settings.MEDIA_URL + avatars.variant_name(digest, size)
+            )
+            for size in profile.avatarSizes
+        },
+    }
+    return data, 200
+
+
 class AvatarUploadView(APIView):
+    """
+    Single-request avatar upload, checked while it streams in (``uploads.pipeline``);
+    larger files can go through a resumable upload with purpose "avatar" instead.
+    """
+
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        avatar = request.FILES.get("avatar")
-        if not avatar:
-            return Response({"code": 400, "message": "No file uploaded"}, status=400)
-        if avatar.size > 2 * 1024 * 1024:  # 2MB limit
-            return Response({"code": 400, "message": "File too large"}, status=400)
-        ext = os.path.splitext(avatar.name)[1].lower()
-        if ext not in [".jpg", ".jpeg", ".png", ".gif"]:
-            return Response({"code": 400, "message": "Invalid file format"}, status=400)
-        filename = f"avatar_{request.user.id}{ext}"
-        upload_dir = os.path.join(settings.MEDIA_ROOT, "avatars")
-        os.makedirs(upload_dir, exist_ok=True)
-        filepath = os.path.join(upload_dir, filename)
-        with open(filepath, "wb+") as dest:
-            for chunk in avatar.chunks():
-                dest.write(chunk)
-        relative_url = f"{settings.MEDIA_URL}avatars/{filename}"
-        absolute_url = request.build_absolute_uri(relative_url)
-        # Update the user's profile model with the new avatar URL
-        profile = request.user.profile
-        profile.avatarUrl = absolute_url
-        profile.save()
-        return Response({"avatarUrl": absolute_url})
+        try:
+            avatar = receive_file(request, get_purpose("avatar"), "avatar")
+        except UploadRejected as exc:
+            return Response({"code": exc.status, "message": exc.message}, status=exc.status)
+        data, status_code = finish_avatar_upload(
+            request, avatar.temporary_file_path(), avatar.kind, avatar.name
+        )
+        return Response(data, status=status_code)
 
 
 class UserByEmailView(APIView):
@@ -63,13 +114,55 @@ class UserByEmailView(APIView):
 
     def get(self, request, email):
         try:
-            user = User.objects.get(email=email)
+            user = users_by_email(email).select_related("profile").get()
         except User.DoesNotExist:
             return Response({"code": 404, "message": "User not found"}, status=404)
         serializer = UserSerializer(user)
         return Response(serializer.data)
 
 
+class UserSearchView(APIView):
+    """
+    Typeahead over the user directory by name or email prefix (see ``users.search``),
+    paged by user id: ``next`` is the ``after`` of the following page.
+    """
+
+    permission_classes = [IsAuthenticated]
+    page_size = 20
+    max_page_size = 50
+
+    def get(self, request):
+        terms = query_terms(request.query_params.get("q", ""))
+        if not terms:
+            return Response({"code": 400, "message": "Missing search query"}, status=400)
+        try:
+            limit = int(request.query_params.get("limit", self.page_size))
+            after = int(request.query_params.get("after", 0))
+        except ValueError:
+            return Response({"code": 400, "message": "Invalid limit or cursor"}, status=400)
+        limit = min(max(limit, 1), self.max_page_size)
+        ids = search_user_ids(terms, max(after, 0), limit + 1)
+        page = ids[:limit]
+        # Users without a profile can't be shown; their ids still move the cursor
+        users = User.objects.filter(profile__isnull=False).select_related("profile").in_bulk(page)
+        return Response(
+            {
+                "users": [user_data(users[id], request) for id in page if id in users],
+                "pagination": {
+                    "limit": limit,
+                    "next": str(page[-1]) if len(ids) > limit else None,
+                },
+            }
+        )
+
+
+class UserCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_user_cache().stats())
+
+
 class RegisterView(APIView):
     permission_classes = [AllowAny]
 
@@ -81,22 +174,28 @@ class RegisterView(APIView):
                 status=400,
             )
         data = serializer.validated_data
-        if User.objects.filter(email=data["email"]).exists():
+        if users_by_email(data["email"]).exists():
             return Response(
                 {"code": 400, "message": "Email already exists"}, status=400
             )
-        user = User.objects.create(
-            username=data["email"],
-            email=data["email"],
-        )
+        user = User(username=data["email"], email=data["email"])
         user.set_password(data["password"])
-        user.save()
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:  # Registered concurrently
+            return Response(
+                {"code": 400, "message": "Email already exists"}, status=400
+            )
         UserProfile.objects.create(
             user=user,
             name=data["name"],
             gender=data["gender"],
             dob=data["dob"],
         )
+        invalidate(user.id)
+        # The new account may not have reached the replicas yet
+        routers.remember_write(user.id)
         access_token = AccessToken.for_user(user)
         refresh = RefreshToken.for_user(user)
         return Response(
@@ -111,3 +210,46 @@ class RegisterView(APIView):
 class LoginView(TokenObtainPairView):
     permission_classes = [AllowAny]
     serializer_class = EmailTokenObtainPairSerializer
+
+    def post(self, request, *args, **kwargs):
+        try:
+            return super().post(request, *args, **kwargs)
+        except PasswordChecksBusy:
+            return Response(
+                {"code": 503, "message": "Too many logins in progress, try again"},
+                status=503,
+                headers={"Retry-After": "1"},
+            )
+
+
+class LogoutView(APIView):
+    """Revokes the access token the request was made with and, if given, ``refresh``."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        tokens = [request.auth]
+        if raw_refresh := request.data.get("refresh"):
+            try:
+                refresh = RefreshToken(raw_refresh)
+            except TokenError:
+                refresh = None
+            if refresh is None or refresh.get(api_settings.USER_ID_CLAIM) != request.user.id:
+                return Response(
+                    {"code": 400, "message": "Invalid refresh token"}, status=400
+                )
+            tokens.append(refresh)
+        revoke_tokens(request.user, tokens)
+        routers.remember_write(request.user.id)
+        return Response({"success": True, "message": "Logged out"})
+
+
+class RevokeSessionsView(APIView):
+    """Revokes every access and refresh token issued to the user so far."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        revoke_all(request.user)
+        routers.remember_write(request.user.id)
+        return Response({"success": True, "message": "All sessions revoked"})